@@ -1,4 +1,5 @@
 import os
+import sys
 from flask import Flask
 from bananaai.config import load_config, validate_config
 from bananaai.routes.ui import ui_bp
@@ -7,7 +8,26 @@ from bananaai.routes.health import health_bp
 from bananaai.middleware.error_handler import register_error_handlers
 from bananaai.middleware.security import register_security_middleware
 from bananaai.middleware.rate_limiter import register_rate_limiter
+from bananaai.middleware.admission import register_admission
+from bananaai.middleware.tracing import register_tracing
+from bananaai.middleware.compression import register_compression
+from bananaai.middleware.capture import register_capture
+from bananaai.middleware.proxy import register_proxy_fix
 from bananaai.utils.logger import setup_logging
+from bananaai.utils.json_provider import init_json_provider
+from bananaai.utils.warmup import start_warmup
+from bananaai.services.storage import storage
+from bananaai.services.file_index import file_index
+from bananaai.services.image_pipeline import image_pipeline
+from bananaai.services.janitor import janitor
+from bananaai.services.health_prober import health_prober
+from bananaai.services.metrics import metrics
+from bananaai.services.assets import assets
+from bananaai.services.reference_images import reference_cache
+from bananaai.services.upstream_pool import upstream_pool
+from bananaai.services.idempotency import idempotency
+from bananaai.services.history import history
+from bananaai.services.upload_sessions import upload_sessions
 
 
 def create_app():
@@ -19,21 +39,71 @@ def create_app():
     
     # Setup logging
     setup_logging(app)
+    init_json_provider(app)
     
     # Register middleware
+    register_proxy_fix(app)
+    metrics.init_app(app)
     register_security_middleware(app)
+    register_tracing(app)
+    register_compression(app)
     register_rate_limiter(app)
+    register_admission(app)
+    register_capture(app)
     register_error_handlers(app)
 
+    # Storage and background services
+    storage.init_app(app)
+    file_index.init_app(app)
+    image_pipeline.init_app(app)
+    janitor.init_app(app)
+    health_prober.init_app(app)
+    reference_cache.init_app(app)
+    upload_sessions.init_app(app)
+    upstream_pool.init_app(app)
+    idempotency.init_app(app)
+    history.init_app(app)
+    assets.init_app(app)
+    if app.config.get('START_BACKGROUND_SERVICES', True):
+        start_background_services(app)
+
     # Register blueprints
     app.register_blueprint(ui_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(health_bp, url_prefix='/health')
 
+    # Admin profiling hooks exist only when a token is configured
+    if app.config.get('ADMIN_TOKEN'):
+        from bananaai.routes.admin import register_admin
+        register_admin(app)
+
     return app
 
 
-if __name__ == '__main__':
-    app = create_app()
+def start_background_services(app):
+    """Start background threads; under gunicorn this runs in each worker after fork"""
+    file_index.start()
+    upload_sessions.start()
+    if janitor.enabled:
+        janitor.start()
+    if health_prober.enabled:
+        health_prober.start()
+    if metrics.enabled:
+        metrics.start()
+    if app.config.get('WARMUP_IMPORTS', True):
+        start_warmup()
+
+
+def run_dev_server(app):
+    """Run the Flask development server; refused in production unless allowed"""
+    if app.config['APP_ENV'] == 'production' and not app.config['ALLOW_DEV_SERVER']:
+        sys.exit(
+            "Refusing to start the Flask development server in production. "
+            "Use: gunicorn -c gunicorn.conf.py wsgi:app"
+        )
     port = int(os.environ.get('PORT', 8000))
     app.run(host='0.0.0.0', port=port)
+
+
+if __name__ == '__main__':
+    run_dev_server(create_app())
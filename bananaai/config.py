@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -10,29 +11,196 @@ def load_config(app):
     app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_MB', '20')) * 1024 * 1024
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
     
+    # Runtime environment; Railway sets RAILWAY_ENVIRONMENT on deployed services
+    default_env = 'production' if os.getenv('RAILWAY_ENVIRONMENT') else 'development'
+    app.config['APP_ENV'] = os.getenv('APP_ENV', default_env).lower()
+    app.config['ALLOW_DEV_SERVER'] = os.getenv('ALLOW_DEV_SERVER', 'false').lower() == 'true'
+    
+    # Reverse proxies whose X-Forwarded-For is trusted for the client address
+    # (Railway's edge is one hop); per-client limits see the proxy without it
+    app.config['TRUSTED_PROXY_HOPS'] = int(
+        os.getenv('TRUSTED_PROXY_HOPS', '1' if os.getenv('RAILWAY_ENVIRONMENT') else '0'))
+    
+    # Gunicorn starts background threads in each worker after fork instead
+    app.config['START_BACKGROUND_SERVICES'] = os.getenv('START_BACKGROUND_SERVICES', 'true').lower() == 'true'
+    
+    # Import the Gemini SDK and PIL on a background thread after startup
+    app.config['WARMUP_IMPORTS'] = os.getenv('WARMUP_IMPORTS', 'true').lower() == 'true'
+    
     # File handling
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
     app.config['OUTPUT_FOLDER'] = os.getenv('OUTPUT_FOLDER', 'output')
     app.config['LOG_FOLDER'] = os.getenv('LOG_FOLDER', 'logs')
     
+    # Uploads: the browser downscales images to UPLOAD_MAX_EDGE (0 keeps the
+    # original) and sends files larger than UPLOAD_CHUNK_BYTES in resumable
+    # chunks, assembled in UPLOAD_PARTIAL_FOLDER (shared by all workers)
+    app.config['UPLOAD_MAX_EDGE'] = int(os.getenv('UPLOAD_MAX_EDGE', '2048'))
+    app.config['UPLOAD_JPEG_QUALITY'] = int(os.getenv('UPLOAD_JPEG_QUALITY', '90'))
+    app.config['UPLOAD_CHUNK_BYTES'] = int(os.getenv('UPLOAD_CHUNK_BYTES', str(1024 * 1024)))
+    app.config['UPLOAD_PARTIAL_FOLDER'] = os.getenv(
+        'UPLOAD_PARTIAL_FOLDER', os.path.join(app.config['UPLOAD_FOLDER'], '.partial'))
+    app.config['UPLOAD_SESSION_TTL_SECONDS'] = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', '86400'))
+    # Open sessions hold disk outside the janitor's quotas: cap them per
+    # client and their declared bytes overall
+    app.config['UPLOAD_SESSIONS_PER_CLIENT'] = int(os.getenv('UPLOAD_SESSIONS_PER_CLIENT', '4'))
+    app.config['UPLOAD_PENDING_MB'] = int(os.getenv('UPLOAD_PENDING_MB', '512'))
+    
+    # Logging: "async" formats and writes on a listener thread, "sync" on the
+    # calling thread; LOG_SAMPLING keeps 1 in N sub-WARNING records per logger,
+    # e.g. "bananaai.services.banana_client=10"
+    app.config['LOG_MODE'] = os.getenv('LOG_MODE', 'async').lower()
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text').lower()
+    app.config['LOG_SAMPLING'] = os.getenv('LOG_SAMPLING', '')
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    
     # API settings (both Gemini and Banana AI use the same API)
     app.config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
     app.config['LLM_MODEL'] = os.getenv('LLM_MODEL', 'gemini-2.5-flash')
     
+    # Upstream execution mode: "sync" blocks the request thread on the SDK call,
+    # "async" runs it on a shared event loop with the SDK's async API
+    app.config['UPSTREAM_MODE'] = os.getenv('UPSTREAM_MODE', 'sync').lower()
+    app.config['UPSTREAM_TIMEOUT'] = int(os.getenv('UPSTREAM_TIMEOUT', '180'))
+    
     # Banana AI model (image generation model)
     app.config['BANANA_MODEL'] = os.getenv('BANANA_MODEL', 'gemini-2.5-flash-image-preview')
     
+    # Upstream pool: JSON (or a path to a JSON file) listing several API keys
+    # with weights and per-minute limits, and fallback models per client;
+    # unset sends every call with GEMINI_API_KEY to LLM_MODEL/BANANA_MODEL
+    app.config['UPSTREAM_POOL'] = os.getenv('UPSTREAM_POOL')
+    app.config['UPSTREAM_POOL_COOLDOWN_SECONDS'] = int(os.getenv('UPSTREAM_POOL_COOLDOWN_SECONDS', '60'))
+    # Each worker process keeps its own pool and gets 1/N of every key's rpm
+    app.config['UPSTREAM_POOL_PROCESSES'] = int(
+        os.getenv('UPSTREAM_POOL_PROCESSES', os.getenv('WEB_CONCURRENCY', '1')))
+    
     # Rate limiting (per-minute limits)
     app.config['RATE_LIMIT_ASSIST'] = int(os.getenv('RATE_LIMIT_ASSIST', '10'))
     app.config['RATE_LIMIT_UPLOAD'] = int(os.getenv('RATE_LIMIT_UPLOAD', '5'))
+    # Chunk, status and completion requests of resumable uploads
+    app.config['RATE_LIMIT_UPLOAD_CHUNK'] = int(os.getenv('RATE_LIMIT_UPLOAD_CHUNK', '120'))
+    
+    # Admission control: at most N requests per endpoint run at once, the rest
+    # queue fairly per client (weights as "ip=weight,..."); a request that
+    # could not finish within its deadline is answered 503 with Retry-After
+    app.config['ADMISSION_ENABLED'] = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+    app.config['ADMISSION_ASSIST_CONCURRENCY'] = int(os.getenv('ADMISSION_ASSIST_CONCURRENCY', '4'))
+    app.config['ADMISSION_ASSIST_DEADLINE_MS'] = int(os.getenv('ADMISSION_ASSIST_DEADLINE_MS', '20000'))
+    app.config['ADMISSION_GENERATE_CONCURRENCY'] = int(os.getenv('ADMISSION_GENERATE_CONCURRENCY', '4'))
+    app.config['ADMISSION_GENERATE_DEADLINE_MS'] = int(os.getenv('ADMISSION_GENERATE_DEADLINE_MS', '90000'))
+    app.config['ADMISSION_CLIENT_WEIGHTS'] = os.getenv('ADMISSION_CLIENT_WEIGHTS', '')
+    
+    # Idempotency keys for /generate: responses are stored for the TTL in a
+    # SQLite file shared by all workers on the host; a duplicate of a request
+    # still running waits up to the /generate admission deadline for its response
+    app.config['IDEMPOTENCY_ENABLED'] = os.getenv('IDEMPOTENCY_ENABLED', 'true').lower() == 'true'
+    app.config['IDEMPOTENCY_DB'] = os.getenv(
+        'IDEMPOTENCY_DB', os.path.join(tempfile.gettempdir(), 'bananaai-idempotency.db'))
+    app.config['IDEMPOTENCY_TTL_SECONDS'] = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+    app.config['IDEMPOTENCY_LEASE_SECONDS'] = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', '300'))
+    app.config['IDEMPOTENCY_MAX_ENTRIES'] = int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000'))
     
+    # Generation history: metadata of every generated image in a SQLite file
+    # shared by all workers, written by a background thread
+    app.config['HISTORY_ENABLED'] = os.getenv('HISTORY_ENABLED', 'true').lower() == 'true'
+    app.config['HISTORY_DB'] = os.getenv('HISTORY_DB', os.path.join('data', 'history.db'))
+    app.config['HISTORY_QUEUE_SIZE'] = int(os.getenv('HISTORY_QUEUE_SIZE', '10000'))
+    
+    # Traffic capture for bananaai.tools.replay: sanitized request traces
+    # (shapes, hashed cache keys, upstream latencies; never prompt text)
+    app.config['CAPTURE_ENABLED'] = os.getenv('CAPTURE_ENABLED', 'false').lower() == 'true'
+    app.config['CAPTURE_FILE'] = os.getenv('CAPTURE_FILE', os.path.join('logs', 'capture.jsonl'))
+    app.config['CAPTURE_SAMPLE_RATE'] = float(os.getenv('CAPTURE_SAMPLE_RATE', '1.0'))
+    app.config['CAPTURE_SALT'] = os.getenv('CAPTURE_SALT', '')
+    
+    # Most image variants one /generate request may ask for
+    app.config['GENERATE_MAX_IMAGES'] = int(os.getenv('GENERATE_MAX_IMAGES', '4'))
+
+    # Reference images: bytes of upstream-ready payloads kept in memory per worker
+    app.config['REFERENCE_CACHE_MB'] = int(os.getenv('REFERENCE_CACHE_MB', '64'))
+
+    # Prompt expansion: answer /assist from local style presets when one matches
+    # (auto), never call the LLM (always) or always call it (off)
+    app.config['ASSIST_LOCAL_MODE'] = os.getenv('ASSIST_LOCAL_MODE', 'auto').lower()
+
     # Cache settings (TTL in seconds)
     app.config['CACHE_TTL'] = int(os.getenv('CACHE_TTL', '3600'))  # 1 hour
     app.config['CACHE_MAX_SIZE'] = int(os.getenv('CACHE_MAX_SIZE', '100'))
     
+    # Storage backend for uploads and outputs: "local" or "s3". With s3 the
+    # local folders act as a read-through cache in front of the bucket
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local').lower()
+    app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+    app.config['S3_PREFIX'] = os.getenv('S3_PREFIX', '')
+    app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')  # MinIO, R2, local stand-ins
+    app.config['S3_REGION'] = os.getenv('S3_REGION')
+    app.config['S3_MAX_POOL_CONNECTIONS'] = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32'))
+    app.config['S3_MULTIPART_THRESHOLD_MB'] = int(os.getenv('S3_MULTIPART_THRESHOLD_MB', '8'))
+    app.config['S3_PRESIGN_EXPIRY'] = int(os.getenv('S3_PRESIGN_EXPIRY', '3600'))
+    app.config['S3_REDIRECT_DOWNLOADS'] = os.getenv('S3_REDIRECT_DOWNLOADS', 'true').lower() == 'true'
+    
+    # Generated image post-processing (runs in a background pool)
+    app.config['IMAGE_OPTIMIZE'] = os.getenv('IMAGE_OPTIMIZE', 'true').lower() == 'true'
+    app.config['IMAGE_PIPELINE_WORKERS'] = int(os.getenv('IMAGE_PIPELINE_WORKERS', '2'))
+    app.config['PREVIEW_MAX_EDGE'] = int(os.getenv('PREVIEW_MAX_EDGE', '512'))
+    app.config['PREVIEW_QUALITY'] = int(os.getenv('PREVIEW_QUALITY', '60'))
+    
     # File cleanup (hours)
     app.config['FILE_CLEANUP_HOURS'] = int(os.getenv('FILE_CLEANUP_HOURS', '24'))
     
+    # Storage janitor (quotas in MB, 0 disables the quota)
+    app.config['JANITOR_ENABLED'] = os.getenv('JANITOR_ENABLED', 'true').lower() == 'true'
+    app.config['JANITOR_INTERVAL_SECONDS'] = int(os.getenv('JANITOR_INTERVAL_SECONDS', '300'))
+    app.config['JANITOR_DELETES_PER_SECOND'] = float(os.getenv('JANITOR_DELETES_PER_SECOND', '20'))
+    # Workers on one host elect a single janitor with a lock on this file
+    app.config['JANITOR_LOCK_FILE'] = os.getenv(
+        'JANITOR_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'bananaai-janitor.lock'))
+    app.config['UPLOAD_QUOTA_MB'] = int(os.getenv('UPLOAD_QUOTA_MB', '1024'))
+    app.config['OUTPUT_QUOTA_MB'] = int(os.getenv('OUTPUT_QUOTA_MB', '2048'))
+    # Index of the upload and output folders shared by the workers on a host,
+    # rescanned every STATS_RECONCILE_SECONDS to pick up outside changes
+    app.config['FILE_INDEX_DB'] = os.getenv(
+        'FILE_INDEX_DB', os.path.join(tempfile.gettempdir(), 'bananaai-files.db'))
+    app.config['STATS_RECONCILE_SECONDS'] = int(os.getenv('STATS_RECONCILE_SECONDS', '3600'))
+    
+    # Readiness prober: upstream reachability, free disk and load, checked in
+    # the background so /health/ready answers from the cached result
+    app.config['HEALTH_PROBE_ENABLED'] = os.getenv('HEALTH_PROBE_ENABLED', 'true').lower() == 'true'
+    app.config['HEALTH_PROBE_INTERVAL_SECONDS'] = int(os.getenv('HEALTH_PROBE_INTERVAL_SECONDS', '30'))
+    app.config['HEALTH_PROBE_TIMEOUT_SECONDS'] = float(os.getenv('HEALTH_PROBE_TIMEOUT_SECONDS', '5'))
+    app.config['HEALTH_PROBE_FAILURES'] = int(os.getenv('HEALTH_PROBE_FAILURES', '2'))
+    app.config['HEALTH_SLOW_UPSTREAM_MS'] = int(os.getenv('HEALTH_SLOW_UPSTREAM_MS', '5000'))
+    app.config['HEALTH_MIN_FREE_DISK_MB'] = int(os.getenv('HEALTH_MIN_FREE_DISK_MB', '512'))
+    app.config['HEALTH_MAX_INFLIGHT'] = int(os.getenv('HEALTH_MAX_INFLIGHT', os.getenv('WEB_THREADS', '8')))
+    app.config['HEALTH_MAX_PIPELINE_BACKLOG'] = int(os.getenv('HEALTH_MAX_PIPELINE_BACKLOG', '50'))
+    
+    # Metrics: with METRICS_DIR set each worker process writes its values
+    # there and /health/metrics sums them (gunicorn sets a default)
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_DIR'] = os.getenv('METRICS_DIR')
+    app.config['METRICS_FLUSH_SECONDS'] = int(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+    
+    # Request tracing: per-phase Server-Timing header, a timing log line
+    # (INFO above TRACE_SLOW_MS, DEBUG otherwise) and an optional Zipkin
+    # v2 collector, e.g. http://localhost:9411/api/v2/spans
+    app.config['TRACE_SERVER_TIMING'] = os.getenv('TRACE_SERVER_TIMING', 'true').lower() == 'true'
+    app.config['TRACE_SLOW_MS'] = int(os.getenv('TRACE_SLOW_MS', '2000'))
+    app.config['TRACE_EXPORT_URL'] = os.getenv('TRACE_EXPORT_URL')
+    app.config['TRACE_SERVICE_NAME'] = os.getenv('TRACE_SERVICE_NAME', 'bananaai')
+    
+    # Admin profiling endpoints (/admin), registered only when a token is set
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')
+    app.config['PROFILE_MAX_SECONDS'] = int(os.getenv('PROFILE_MAX_SECONDS', '60'))
+    
+    # Response encoding: JSON provider ("orjson" falls back to "default" when
+    # not installed) and negotiated brotli/gzip compression
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson').lower()
+    app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', '500'))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+    
     # Create directories
     for folder in [app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER'], app.config['LOG_FOLDER']]:
         Path(folder).mkdir(exist_ok=True)
@@ -51,4 +219,12 @@ def validate_config(config):
     # Validate file size limits
     max_size = config.get('MAX_CONTENT_LENGTH', 0)
     if max_size > 100 * 1024 * 1024:  # 100MB limit
-        raise ValueError("MAX_CONTENT_LENGTH cannot exceed 100MB")
\ No newline at end of file
+        raise ValueError("MAX_CONTENT_LENGTH cannot exceed 100MB")
+    
+    # Every chunk is one request, so it must fit in a request body
+    chunk_bytes = config.get('UPLOAD_CHUNK_BYTES', 1024 * 1024)
+    if chunk_bytes <= 0 or (max_size and chunk_bytes > max_size):
+        raise ValueError("UPLOAD_CHUNK_BYTES must be positive and at most MAX_CONTENT_LENGTH")
+
+    if config.get('ASSIST_LOCAL_MODE', 'auto') not in ('auto', 'always', 'off'):
+        raise ValueError("ASSIST_LOCAL_MODE must be 'auto', 'always' or 'off'")
\ No newline at end of file
@@ -0,0 +1,237 @@
+import math
+import time
+import heapq
+import logging
+import itertools
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from flask import jsonify, current_app
+from ..services.metrics import ADMISSION_SHED, ADMISSION_QUEUE_SECONDS
+from .proxy import client_address
+from .tracing import add_span
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest request in the service time average
+SERVICE_TIME_ALPHA = 0.2
+
+ENDPOINTS = ('assist', 'generate')
+
+BUSY_MESSAGE = "Server is busy, please try again shortly"
+
+
+class Shed(Exception):
+    """The request cannot start before its deadline"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('finish', 'start', 'event', 'admitted')
+
+    def __init__(self, finish: float, start: float):
+        self.finish = finish
+        self.start = start
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionQueue:
+    """Bounded concurrency with weighted fair queuing and deadline shedding
+
+    At most ``max_concurrency`` requests run at once; the rest wait in
+    start-time fair queuing order. Each client's requests get finish tags
+    spaced ``1 / weight`` apart, so a client with a backlog cannot delay
+    another client by more than one request per slot. A request is shed
+    up front when the requests ahead of it, times the recent service time,
+    would not let it finish within ``deadline`` seconds, and shed later if
+    it is still queued when that time runs out.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, deadline: float,
+                 weights: Dict[str, float] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.deadline = deadline
+        self.weights = weights or {}
+        self._lock = threading.Lock()
+        self._queue: List[tuple] = []  # (finish tag, seq, waiter)
+        self._seq = itertools.count()
+        self._finish: Dict[str, float] = {}  # client -> finish tag of its last request
+        self._virtual = 0.0
+        self._inflight = 0
+        self._service: Optional[float] = None
+        self._admitted = 0
+        self._shed = {'estimate': 0, 'timeout': 0}
+        self._queue_seconds = 0.0
+
+    def estimate_wait(self, ahead: int) -> float:
+        """Seconds until a request with ``ahead`` queued requests before it starts"""
+        return (ahead + 1) * (self._service or 0) / self.max_concurrency
+
+    def acquire(self, client: str) -> float:
+        """
+        Wait for a slot
+
+        Args:
+            client: Key the fair share is kept for
+
+        Returns:
+            Seconds spent queued
+
+        Raises:
+            Shed: If the request would miss its deadline
+        """
+        with self._lock:
+            start = max(self._virtual, self._finish.get(client, 0.0))
+            finish = start + 1 / self.weights.get(client, 1.0)
+            if self._inflight < self.max_concurrency and not self._queue:
+                self._finish[client] = finish
+                self._virtual = start
+                self._inflight += 1
+                self._admitted += 1
+                return 0.0
+
+            # Only requests with earlier finish tags are served before this one
+            ahead = sum(1 for tag, _, _ in self._queue if tag <= finish)
+            wait = self.estimate_wait(ahead)
+            budget = self.deadline - (self._service or 0)
+            if wait > budget:
+                self._shed['estimate'] += 1
+                raise Shed('estimate', max(1, math.ceil(wait - budget)))
+            waiter = _Waiter(finish, start)
+            self._finish[client] = finish
+            heapq.heappush(self._queue, (finish, next(self._seq), waiter))
+
+        queued_at = time.perf_counter()
+        waiter.event.wait(budget)
+        waited = time.perf_counter() - queued_at
+        with self._lock:
+            if not waiter.admitted:
+                self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                heapq.heapify(self._queue)
+                self._shed['timeout'] += 1
+                raise Shed('timeout', max(1, math.ceil(self.estimate_wait(len(self._queue)))))
+            self._queue_seconds += waited
+        return waited
+
+    def release(self, service_time: float):
+        """Free a slot, record how long the request ran and start the next one"""
+        with self._lock:
+            if self._service is None:
+                self._service = service_time
+            else:
+                self._service += SERVICE_TIME_ALPHA * (service_time - self._service)
+            self._inflight -= 1
+            while self._queue and self._inflight < self.max_concurrency:
+                _, _, waiter = heapq.heappop(self._queue)
+                waiter.admitted = True
+                self._virtual = waiter.start
+                self._inflight += 1
+                self._admitted += 1
+                waiter.event.set()
+            if not self._queue:
+                # Tags at or below virtual time give no priority; forget them
+                self._finish = {c: f for c, f in self._finish.items() if f > self._virtual}
+
+    def summary(self) -> dict:
+        """Load, service time and shed counts of this queue"""
+        with self._lock:
+            return {
+                'max_concurrency': self.max_concurrency,
+                'deadline_ms': round(self.deadline * 1000),
+                'inflight': self._inflight,
+                'queued': len(self._queue),
+                'service_ms': round(self._service * 1000, 1) if self._service is not None else None,
+                'admitted': self._admitted,
+                'shed': dict(self._shed),
+                'queue_seconds_total': round(self._queue_seconds, 3),
+            }
+
+
+@contextmanager
+def admission_slot(endpoint_type):
+    """
+    Hold a slot of ``endpoint_type``'s admission queue for a ``with`` block
+
+    For handlers that cannot use ``admit``, such as streamed responses whose
+    work runs after the view has returned.
+
+    Raises:
+        Shed: If the request would miss its deadline
+    """
+    queue = current_app.extensions.get('admission', {}).get(endpoint_type)
+    if queue is None:
+        yield
+        return
+
+    try:
+        waited = queue.acquire(client_address())
+    except Shed as e:
+        ADMISSION_SHED.inc(endpoint=endpoint_type, reason=e.reason)
+        logger.warning("Shed /%s request from %s (%s), retry after %ds",
+                       endpoint_type, client_address(), e.reason, e.retry_after)
+        raise
+    ADMISSION_QUEUE_SECONDS.observe(waited, endpoint=endpoint_type)
+    if waited:
+        add_span('queue', waited)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        queue.release(time.perf_counter() - start)
+
+
+def admit(endpoint_type):
+    """Run the view only once ``endpoint_type``'s admission queue has a slot for it"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            try:
+                with admission_slot(endpoint_type):
+                    return f(*args, **kwargs)
+            except Shed as e:
+                response = jsonify({
+                    "error": BUSY_MESSAGE,
+                    "retry_after": e.retry_after
+                })
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response, 503
+        return wrapper
+    return decorator
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    """Parse ``client=weight`` pairs, e.g. ``10.0.0.5=4,10.0.0.6=2``"""
+    weights = {}
+    for pair in filter(None, (p.strip() for p in (spec or '').split(','))):
+        client, _, weight = pair.partition('=')
+        weights[client.strip()] = float(weight)
+    return weights
+
+
+def register_admission(app):
+    """Create an admission queue per endpoint type"""
+    cfg = app.config
+    queues = {}
+    if cfg.get('ADMISSION_ENABLED', True):
+        weights = _parse_weights(cfg.get('ADMISSION_CLIENT_WEIGHTS'))
+        for name in ENDPOINTS:
+            queues[name] = AdmissionQueue(
+                name,
+                cfg.get(f'ADMISSION_{name.upper()}_CONCURRENCY', 4),
+                cfg.get(f'ADMISSION_{name.upper()}_DEADLINE_MS', 30000) / 1000,
+                weights
+            )
+    app.extensions['admission'] = queues
+
+
+def admission_summary(app) -> dict:
+    return {name: queue.summary() for name, queue in app.extensions.get('admission', {}).items()}
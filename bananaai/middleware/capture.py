@@ -0,0 +1,172 @@
+import os
+import hmac
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from flask import g, request
+
+from ..utils.validators import is_safe_filename
+
+logger = logging.getLogger(__name__)
+
+# Request fields whose values are recorded as sent; every other string is
+# recorded by length only, so no prompt text ever reaches the capture
+KEPT_VALUES = ('aspect_ratio',)
+
+
+class CaptureWriter:
+    """Appends capture records to a JSON Lines file
+
+    Every worker appends to the same file; each record is one ``write`` of
+    a single line, so lines from different processes do not interleave.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def write(self, record: Dict[str, Any]):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            # Reopened after a fork so workers do not share a file offset
+            if self._file is None or self._pid != os.getpid():
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+                self._pid = os.getpid()
+            self._file.write(line)
+            self._file.flush()
+            self.written += 1
+
+
+def _digest(salt: bytes, value: str) -> str:
+    return hmac.new(salt, value.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def _file_size(upload_folder: str, filename: Any) -> Optional[int]:
+    if not is_safe_filename(filename):
+        return None
+    try:
+        return os.path.getsize(os.path.join(upload_folder, filename))
+    except OSError:
+        return None
+
+
+def request_shape(data: Dict[str, Any], salt: bytes, upload_folder: str) -> Dict[str, Any]:
+    """
+    Describe a request body without its content
+
+    Numbers and booleans are kept, strings become their length (except
+    ``KEPT_VALUES``) and reference images become a hashed name and a size
+    in bytes, so a replay can send requests of the same shape.
+    """
+    shape = {}
+    for key, value in data.items():
+        if key == 'reference_images' and isinstance(value, list):
+            shape[key] = [{'id': _digest(salt, str(name)), 'bytes': _file_size(upload_folder, name)}
+                          for name in value]
+        elif isinstance(value, (bool, int, float)) or value is None:
+            shape[key] = value
+        elif isinstance(value, str):
+            shape[key] = value if key in KEPT_VALUES else {'chars': len(value)}
+        else:
+            shape[key] = {'type': type(value).__name__}
+    return shape
+
+
+def register_capture(app):
+    """
+    Record sanitized traces of API requests for ``bananaai.tools.replay``
+
+    With ``CAPTURE_ENABLED`` a sample (``CAPTURE_SAMPLE_RATE``) of ``/api``
+    requests is appended to ``CAPTURE_FILE``: arrival time, route, status,
+    duration, the request's shape, a keyed hash of its prompt cache key,
+    how the prompt expansion was answered and the upstream call latencies.
+    The record is written when the response is closed, after the body has
+    been sent, so streamed responses include their upstream calls.
+    """
+    cfg = app.config
+    if not cfg.get('CAPTURE_ENABLED', False):
+        return
+    writer = CaptureWriter(cfg.get('CAPTURE_FILE', os.path.join('logs', 'capture.jsonl')))
+    sample_rate = cfg.get('CAPTURE_SAMPLE_RATE', 1.0)
+    # Hashes are keyed so short prompts cannot be recovered by guessing
+    salt = (cfg.get('CAPTURE_SALT') or cfg.get('SECRET_KEY') or '').encode('utf-8')
+    app.extensions['capture'] = writer
+
+    @app.after_request
+    def capture_request(response):
+        if request.blueprint != 'api' or request.url_rule is None:
+            return response
+        if sample_rate < 1.0 and random.random() >= sample_rate:
+            return response
+        trace = g.get('trace')
+        if trace is None:
+            return response
+
+        upload_folder = cfg.get('UPLOAD_FOLDER', 'uploads')
+        record = {
+            't': round(trace.wall_start, 3),
+            'method': request.method,
+            'route': request.url_rule.rule,
+            'status': response.status_code,
+        }
+        data = request.get_json(silent=True) if request.is_json else None
+        if isinstance(data, dict):
+            record['params'] = request_shape(data, salt, upload_folder)
+            if isinstance(data.get('prompt'), str):
+                # Same key as the prompt expansion cache, so repeats show up as repeats
+                refs = data.get('reference_images') or []
+                cache_key = (f"{data['prompt'].strip()}:{str(data.get('aspect_ratio', '9:16')).strip()}:"
+                             f"{','.join(map(str, refs))}")
+                record['cache_key'] = _digest(salt, cache_key)
+        elif request.args:
+            record['params'] = request_shape(request.args.to_dict(), salt, upload_folder)
+        files = {}
+        for name, file in request.files.items():
+            try:
+                file.stream.seek(0, os.SEEK_END)
+                files[name] = {'bytes': file.stream.tell(), 'type': file.mimetype}
+            except (OSError, ValueError):
+                files[name] = {'bytes': None, 'type': file.mimetype}
+        if files:
+            record['files'] = files
+
+        # Streamed bodies run after this hook with the same ``g``; keep it
+        request_g = g._get_current_object()
+
+        def write():
+            record['ms'] = round((time.perf_counter() - trace.start) * 1000, 1)
+            expansion = request_g.get('expansion')
+            if expansion:
+                record['expansion'] = expansion
+            record['upstream'] = [
+                {'client': s.attrs.get('client'), 'ms': round(s.duration * 1000, 1),
+                 **({'candidates': s.attrs['candidates']} if 'candidates' in s.attrs else {})}
+                for s in trace.spans if s.name == 'upstream'
+            ]
+            try:
+                writer.write(record)
+            except OSError as e:
+                logger.warning("Failed to write capture record: %s", e)
+
+        response.call_on_close(write)
+        return response
+
+
+def capture_summary(app) -> Dict[str, Any]:
+    """Capture settings and records written by this process"""
+    writer = app.extensions.get('capture')
+    if writer is None:
+        return {'enabled': False}
+    return {'enabled': True, 'file': writer.path,
+            'sample_rate': app.config.get('CAPTURE_SAMPLE_RATE', 1.0), 'written': writer.written}
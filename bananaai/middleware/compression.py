@@ -0,0 +1,118 @@
+import zlib
+import logging
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+class _Encoder:
+    """Incremental gzip or brotli encoder for one response body"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Emit everything buffered so far without ending the stream"""
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def _is_compressible(mimetype: str) -> bool:
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def _stream(chunks, encoder: _Encoder):
+    """Compress a streamed body chunk by chunk, flushing after each one"""
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def register_compression(app):
+    """
+    Compress responses with brotli or gzip, as negotiated by Accept-Encoding
+
+    Buffered responses below ``COMPRESS_MIN_BYTES`` and non-text types are
+    left alone. Streamed responses are compressed incrementally with a flush
+    after every chunk, so clients still see each chunk as it is produced.
+    Server-sent events are never compressed, because proxies buffer
+    compressed event streams. Files sent with ``send_file`` (already
+    compressed images, precompressed assets) pass through untouched.
+    """
+    cfg = app.config
+    if not cfg.get('COMPRESS_ENABLED', True):
+        return
+
+    min_bytes = cfg.get('COMPRESS_MIN_BYTES', 500)
+    gzip_level = cfg.get('COMPRESS_GZIP_LEVEL', 6)
+    brotli_quality = cfg.get('COMPRESS_BROTLI_QUALITY', 4)
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers
+                or response.direct_passthrough
+                or response.mimetype == 'text/event-stream'
+                or not _is_compressible(response.mimetype)):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        encoder = _Encoder(encoding, gzip_level, brotli_quality)
+        if response.is_streamed:
+            response.response = _stream(response.response, encoder)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < min_bytes:
+                return response
+            response.set_data(encoder.compress(body) + encoder.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # The compressed body is a different representation
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,60 @@
+import hashlib
+from functools import wraps
+
+from flask import request, jsonify, current_app
+from ..services.idempotency import idempotency, REPLAY, CONFLICT, IN_PROGRESS
+from ..services.metrics import IDEMPOTENCY_REQUESTS
+from .tracing import span
+
+MAX_KEY_LENGTH = 255
+
+
+def idempotent(endpoint_type):
+    """Run a view once per ``Idempotency-Key`` and replay its response to duplicates
+
+    Keys are not tied to the client address: a phone that retries after
+    switching networks must still get the stored response. Keys are random
+    per user action, and one reused for a different request body is
+    rejected by its fingerprint. A duplicate of a request still running
+    waits for it no longer than ``endpoint_type``'s admission deadline.
+    Only successful responses are stored; after an error the key is
+    released and a retry runs the view again.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key or not idempotency.enabled:
+                return f(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return jsonify({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+            fingerprint = hashlib.sha256(request.path.encode() + b'\0' + request.get_data()).digest()
+            deadline_ms = current_app.config.get(f'ADMISSION_{endpoint_type.upper()}_DEADLINE_MS')
+            wait = min(idempotency.lease, deadline_ms / 1000) if deadline_ms else idempotency.lease
+            with span('idempotency'):
+                outcome, stored = idempotency.begin(key, fingerprint, wait=wait)
+            IDEMPOTENCY_REQUESTS.inc(outcome=outcome)
+
+            if outcome == REPLAY:
+                status, body = stored
+                response = current_app.response_class(body, status=status, mimetype='application/json')
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            if outcome == CONFLICT:
+                return jsonify({"error": "Idempotency-Key was already used for a different request"}), 422
+            if outcome == IN_PROGRESS:
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+            except BaseException:
+                idempotency.release(key)
+                raise
+            if 200 <= response.status_code < 300:
+                idempotency.complete(key, response.status_code, response.get_data())
+            else:
+                idempotency.release(key)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,21 @@
+from flask import request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+
+def register_proxy_fix(app):
+    """
+    Trust the forwarding headers of the reverse proxies in front of the app
+
+    With ``TRUSTED_PROXY_HOPS`` set, ``request.remote_addr`` is taken from
+    that many ``X-Forwarded-For`` hops (and the scheme from
+    ``X-Forwarded-Proto``), so it is the client's address instead of the
+    proxy's. Hops beyond that are ignored, since the client can forge them.
+    """
+    hops = app.config.get('TRUSTED_PROXY_HOPS', 0)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+
+
+def client_address() -> str:
+    """Address that per-client limits and fair queuing are kept for"""
+    return request.remote_addr or 'unknown'
@@ -1,16 +1,18 @@
 import time
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import jsonify, current_app
 from collections import defaultdict, deque
+from ..services.metrics import RATE_LIMIT_REJECTS
+from .proxy import client_address
 
 # In-memory rate limiter (suitable for single-instance local development)
-request_history = defaultdict(lambda: {'assist': deque(), 'upload': deque()})
+request_history = defaultdict(lambda: {'assist': deque(), 'upload': deque(), 'upload_chunk': deque()})
 
 def rate_limit(endpoint_type):
     def decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            client_ip = request.remote_addr
+            client_ip = client_address()
             now = time.time()
             
             # Get rate limit for this endpoint
@@ -24,6 +26,7 @@ def rate_limit(endpoint_type):
             
             # Check if limit exceeded
             if len(history) >= rate_limit_per_minute:
+                RATE_LIMIT_REJECTS.inc(endpoint=endpoint_type)
                 return jsonify({
                     "error": "Rate limit exceeded",
                     "retry_after": 60 - (now - history[0])
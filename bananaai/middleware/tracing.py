@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Spans go to a context variable rather than ``g`` so that they follow the
+# request into ``asyncio.to_thread`` workers and the upstream event loop
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('bananaai_trace', default=None)
+
+
+class Span:
+    """One timed phase of a request"""
+
+    __slots__ = ('name', 'start', 'duration', 'attrs')
+
+    def __init__(self, name: str, start: float, duration: float, attrs: dict):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, **attrs):
+        with self._lock:
+            self.spans.append(Span(name, start, duration, attrs))
+
+    def summary(self) -> List[dict]:
+        """Spans as plain dicts with millisecond offsets, for logs"""
+        return [
+            {'name': s.name, 'offset_ms': round((s.start - self.start) * 1000, 1),
+             'duration_ms': round(s.duration * 1000, 1), **s.attrs}
+            for s in self.spans
+        ]
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Time a phase of the current request
+
+    A no-op outside a traced request, so library code can use it freely.
+
+    Args:
+        name: Phase name, e.g. ``upstream`` or ``disk_write``
+        **attrs: Extra fields for logs and the exporter (e.g. ``attempt``)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, **attrs)
+
+
+def add_span(name: str, duration: float, **attrs):
+    """Record a phase timed by the caller (e.g. summed over chunks)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - duration, duration, **attrs)
+
+
+def bind_trace(coro, trace: Optional[Trace] = None):
+    """
+    Wrap a coroutine so it records spans into ``trace``
+
+    Tasks started on another thread's event loop do not inherit the caller's
+    context variables; the upstream loop uses this to carry the trace over.
+    """
+    trace = trace or _current_trace.get()
+
+    async def _bound():
+        _current_trace.set(trace)
+        return await coro
+
+    return _bound()
+
+
+class RequestIdFilter(logging.Filter):
+    """Add the current request id to every log record (``-`` outside requests)"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            trace = _current_trace.get()
+            record.request_id = trace.request_id if trace else '-'
+        return True
+
+
+class ZipkinExporter:
+    """Ship traces to a local collector in Zipkin v2 JSON
+
+    Zipkin, Jaeger and the OpenTelemetry collector all accept this format.
+    Traces are batched on a daemon thread; if the collector is slow or down
+    they are dropped rather than queued without bound.
+    """
+
+    def __init__(self, url: str, service_name: str = 'bananaai', max_queue: int = 1000,
+                 batch_size: int = 50):
+        self.url = url
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace, name: str, status: int):
+        with self._lock:
+            # Threads do not survive fork, so each worker starts its own sender
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+        try:
+            self._queue.put_nowait(self._to_zipkin(trace, name, status))
+        except queue.Full:
+            pass
+
+    def _to_zipkin(self, trace: Trace, name: str, status: int) -> List[dict]:
+        trace_id = trace.request_id.replace('-', '')
+        root_id = trace_id[:16]
+        total = time.perf_counter() - trace.start
+        spans = [{
+            'traceId': trace_id,
+            'id': root_id,
+            'name': name,
+            'kind': 'SERVER',
+            'timestamp': int(trace.wall_start * 1e6),
+            'duration': max(1, int(total * 1e6)),
+            'localEndpoint': {'serviceName': self.service_name},
+            'tags': {'http.status_code': str(status), 'request_id': trace.request_id},
+        }]
+        for s in trace.spans:
+            spans.append({
+                'traceId': trace_id,
+                'parentId': root_id,
+                'id': os.urandom(8).hex(),
+                'name': s.name,
+                'timestamp': int((trace.wall_start + s.start - trace.start) * 1e6),
+                'duration': max(1, int(s.duration * 1e6)),
+                'localEndpoint': {'serviceName': self.service_name},
+                'tags': {k: str(v) for k, v in s.attrs.items()},
+            })
+        return spans
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            for _ in range(self.batch_size - 1):
+                try:
+                    batch.extend(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                req = urllib.request.Request(
+                    self.url, data=json.dumps(batch).encode(),
+                    headers={'Content-Type': 'application/json'}, method='POST'
+                )
+                urllib.request.urlopen(req, timeout=5).close()
+            except Exception as e:
+                logger.debug(f"Trace export to {self.url} failed: {e}")
+
+
+def register_tracing(app):
+    """Trace request phases and report them as Server-Timing and log fields"""
+    cfg = app.config
+    server_timing = cfg.get('TRACE_SERVER_TIMING', True)
+    slow_ms = cfg.get('TRACE_SLOW_MS', 2000)
+    exporter = None
+    if cfg.get('TRACE_EXPORT_URL'):
+        exporter = ZipkinExporter(cfg['TRACE_EXPORT_URL'], cfg.get('TRACE_SERVICE_NAME', 'bananaai'))
+
+    @app.before_request
+    def start_trace():
+        g.trace = Trace(getattr(g, 'request_id', None) or os.urandom(16).hex())
+        _current_trace.set(g.trace)
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.get('trace')
+        if trace is None:
+            return response
+
+        total_ms = (time.perf_counter() - trace.start) * 1000
+        if server_timing:
+            entries = [
+                f'{s.name};dur={s.duration * 1000:.1f}'
+                + (f';desc="attempt {s.attrs["attempt"]}"' if 'attempt' in s.attrs else '')
+                for s in trace.spans
+            ]
+            entries.append(f'total;dur={total_ms:.1f}')
+            response.headers['Server-Timing'] = ', '.join(entries)
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        level = logging.INFO if total_ms >= slow_ms else logging.DEBUG
+        if logger.isEnabledFor(level):
+            phases = ' '.join(f"{s['name']}={s['duration_ms']}ms" for s in trace.summary())
+            logger.log(
+                level,
+                f"request_id={trace.request_id} {request.method} {route} "
+                f"status={response.status_code} total={total_ms:.1f}ms {phases}",
+                extra={'request_id': trace.request_id, 'route': route,
+                       'total_ms': round(total_ms, 1), 'spans': trace.summary()},
+            )
+
+        if exporter is not None:
+            exporter.export(trace, f"{request.method} {route}", response.status_code)
+        return response
+
+    @app.teardown_request
+    def clear_trace(exc=None):
+        # Request threads are reused; do not leak the trace into the next one
+        _current_trace.set(None)
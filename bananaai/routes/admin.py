@@ -0,0 +1,173 @@
+import os
+import re
+import hmac
+import math
+import logging
+import threading
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, g, jsonify, request, send_file
+
+from ..middleware.security import csrf
+from ..services.profiler import SORT_KEYS, sample_stacks, MemoryTracker, RequestProfiler
+
+logger = logging.getLogger(__name__)
+admin_bp = Blueprint('admin', __name__)
+
+memory = MemoryTracker()
+_cpu_lock = threading.Lock()
+_PROFILE_ID = re.compile(r'^[0-9a-f-]{8,64}$')
+
+
+def _is_admin() -> bool:
+    token = current_app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):]
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _number_arg(name: str, default, cast=int):
+    """
+    Read a numeric query argument
+
+    Raises:
+        ValueError: If the argument is not a finite, non-negative number
+    """
+    value = cast(request.args.get(name, default))
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(name)
+    return value
+
+
+def require_admin(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not _is_admin():
+            return jsonify({"error": "Unauthorized"}), 401
+        return f(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/cpu', methods=['GET'])
+@require_admin
+def cpu_profile():
+    """Sample all thread stacks and return collapsed stacks for a flamegraph"""
+    max_seconds = current_app.config.get('PROFILE_MAX_SECONDS', 60)
+    try:
+        seconds = min(_number_arg('seconds', 10, float), max_seconds)
+        interval = max(_number_arg('interval', 0.01, float), 0.001)
+    except ValueError:
+        return jsonify({"error": "seconds and interval must be non-negative numbers"}), 400
+
+    if not _cpu_lock.acquire(blocking=False):
+        return jsonify({"error": "A CPU profile is already running"}), 409
+    try:
+        logger.info("Sampling CPU stacks for %.1fs", seconds)
+        stacks = sample_stacks(seconds, interval)
+    finally:
+        _cpu_lock.release()
+
+    return Response(stacks, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename=cpu-{os.getpid()}.collapsed'
+    })
+
+
+@admin_bp.route('/memory/start', methods=['POST'])
+@require_admin
+def memory_start():
+    """Start tracemalloc (it slows allocations until stopped)"""
+    try:
+        # tracemalloc itself rejects a depth outside 1..65535
+        memory.start(_number_arg('frames', 10))
+    except ValueError:
+        return jsonify({"error": "frames must be an integer from 1 to 65535"}), 400
+    return jsonify({"tracing": memory.tracing})
+
+
+@admin_bp.route('/memory/stop', methods=['POST'])
+@require_admin
+def memory_stop():
+    """Stop tracemalloc and drop stored snapshots"""
+    memory.stop()
+    return jsonify({"tracing": memory.tracing})
+
+
+@admin_bp.route('/memory/snapshot', methods=['POST'])
+@require_admin
+def memory_snapshot():
+    """Take a snapshot and list the largest allocation sites"""
+    try:
+        limit = _number_arg('limit', 20)
+    except ValueError:
+        return jsonify({"error": "limit must be a non-negative integer"}), 400
+    try:
+        return jsonify(memory.snapshot(limit))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+@admin_bp.route('/memory/diff', methods=['GET'])
+@require_admin
+def memory_diff():
+    """Compare two snapshots: ?from=<id>&to=<id>"""
+    key_type = request.args.get('key', 'lineno')
+    try:
+        limit = _number_arg('limit', 20)
+    except ValueError:
+        return jsonify({"error": "limit must be a non-negative integer"}), 400
+    if key_type not in ('filename', 'lineno', 'traceback'):
+        return jsonify({"error": "key must be filename, lineno or traceback"}), 400
+    try:
+        stats = memory.diff(int(request.args['from']), int(request.args['to']),
+                            limit=limit, key_type=key_type)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Unknown snapshot id"}), 404
+    return jsonify({"diff": stats})
+
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@require_admin
+def get_profile(profile_id):
+    """Fetch a request profile as text (default) or raw pstats (?format=raw)"""
+    profiler = current_app.extensions['request_profiler']
+    if not _PROFILE_ID.match(profile_id) or not os.path.exists(profiler.path(profile_id)):
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get('format') == 'raw':
+        return send_file(os.path.abspath(profiler.path(profile_id)), as_attachment=True)
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return jsonify({"error": f"sort must be one of: {', '.join(sorted(SORT_KEYS))}"}), 400
+    return Response(profiler.report(profile_id, sort=sort), mimetype='text/plain')
+
+
+def register_admin(app):
+    """
+    Register the admin profiling endpoints under ``/admin``
+
+    Only called when ``ADMIN_TOKEN`` is set; otherwise no route or request
+    hook exists and the profiling code is never imported.
+    """
+    csrf.exempt(admin_bp)
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+
+    profiler = RequestProfiler(os.path.join(app.config.get('LOG_FOLDER', 'logs'), 'profiles'))
+    app.extensions['request_profiler'] = profiler
+
+    @app.before_request
+    def start_request_profile():
+        # An admin flags a request to profile it end to end
+        if request.headers.get('X-Profile-Request') and _is_admin():
+            g.profile = profiler.begin()
+
+    @app.after_request
+    def finish_request_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            profile_id = getattr(g, 'request_id', None) or os.urandom(16).hex()
+            profiler.end(profile, profile_id)
+            response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    logger.warning("Admin profiling endpoints enabled at /admin")
@@ -1,60 +1,297 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, g
 from ..services.llm_client import LLMClient
 from ..services.banana_client import BananaAIClient
-from ..services.prompt_builder import expand_prompt, SYSTEM_GUIDE
+from ..services.prompt_builder import expand_local, should_use_llm, SYSTEM_GUIDE
 from ..services.cache_service import CacheService
+from ..services.image_pipeline import image_pipeline
+from ..services.reference_images import load_reference_images
+from ..services.upstream_loop import upstream_loop
+from ..services.upstream_pool import upstream_pool
+from ..services.history import history
+from ..services.upload_sessions import (upload_sessions, UploadSessionNotFound, OffsetMismatch,
+                                        ChecksumMismatch, SessionLimitExceeded)
+from ..services.metrics import ASSIST_EXPANSIONS, ASSIST_UPSTREAM_SECONDS_SAVED
 from ..middleware.rate_limiter import rate_limit
-from ..utils.validators import validate_prompt_request, validate_image_file
-from ..utils.file_ops import save_uploaded_file, get_file_url, generate_output_filename, save_generated_image
-import logging
+from ..middleware.admission import admit, admission_slot, Shed, BUSY_MESSAGE
+from ..middleware.idempotency import idempotent
+from ..middleware.proxy import client_address
+from ..middleware.tracing import span
+from ..utils.validators import validate_prompt_request, validate_image_file, ALLOWED_EXTENSIONS
+from ..utils.file_ops import (save_uploaded_file, save_uploaded_path, get_file_url, generate_output_filename,
+                              save_generated_image)
+from werkzeug.datastructures import FileStorage
 import os
+import logging
+import time
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 api_bp = Blueprint('api', __name__)
-cache = CacheService()
+cache = CacheService(name='assist')
+
+# Moving average of LLM expansion latency, used to estimate the time saved
+# by answering from the local presets
+_LLM_LATENCY_ALPHA = 0.2
+_llm_latency = None
+
+
+def _record_llm_latency(seconds: float):
+    global _llm_latency
+    if _llm_latency is None:
+        _llm_latency = seconds
+    else:
+        _llm_latency += _LLM_LATENCY_ALPHA * (seconds - _llm_latency)
+
+
+def _call_upstream(sync_call, async_call, **kwargs):
+    """
+    Run an upstream client call in the configured execution mode
+    
+    In ``async`` mode the coroutine runs on the shared upstream event loop;
+    otherwise the blocking SDK call runs on the request thread.
+    """
+    cfg = current_app.config
+    if cfg.get('UPSTREAM_MODE') == 'async':
+        return upstream_loop.run(async_call(**kwargs), timeout=cfg.get('UPSTREAM_TIMEOUT'))
+    return sync_call(**kwargs)
+
+def _expand(user_text: str, ar: str, reference_images: list, refine: bool = False,
+            images: list = None) -> dict:
+    """
+    Expand a prompt from the cache, the local presets or the LLM
+
+    Args:
+        user_text: The user's prompt
+        ar: Aspect ratio
+        reference_images: Uploaded reference image filenames
+        refine: The client asked for LLM refinement
+        images: Reference images already loaded by ``load_reference_images``
+
+    Returns:
+        Response fields: expanded, cached, source and preset; how it was
+        answered is also left in ``g.expansion`` for the traffic capture
+    """
+    cfg = current_app.config
+
+    # Check cache first (include images in cache key)
+    cache_key = f"{user_text}:{ar}:{','.join(reference_images)}"
+    with span('cache'):
+        cached_result = cache.get(cache_key)
+    if cached_result:
+        logger.info("Returning cached prompt expansion")
+        g.expansion = {'outcome': 'hit'}
+        return {"expanded": cached_result, "cached": True, "source": "llm"}
+
+    # 1) rule-based expansion ภายใน
+    expanded_local, preset = expand_local(user_text, ar)
+    if not should_use_llm(preset, cfg.get('ASSIST_LOCAL_MODE', 'auto'), refine, reference_images):
+        ASSIST_EXPANSIONS.inc(tier='local', preset=preset or 'none')
+        if _llm_latency is not None:
+            ASSIST_UPSTREAM_SECONDS_SAVED.inc(_llm_latency)
+        logger.info("Answered prompt expansion locally with preset %s", preset)
+        g.expansion = {'outcome': 'local', 'preset': preset}
+        return {"expanded": expanded_local, "cached": False, "source": "local", "preset": preset}
+
+    # Add reference image context if provided
+    if reference_images:
+        image_context = f"\n\nReference images provided: {', '.join(reference_images)}"
+        expanded_local = expanded_local + image_context
+        logger.debug("Processing with reference images: %s", reference_images)
+
+    # 2) ส่งเข้า Gemini 2.5 Flash เพื่อขยาย/ขัดเกลา
+    client = LLMClient(api_key=cfg.get('GEMINI_API_KEY'), model=cfg.get('LLM_MODEL'),
+                       upload_folder=cfg.get('UPLOAD_FOLDER', 'uploads'), pool=upstream_pool)
+    start = time.perf_counter()
+    result = _call_upstream(
+        client.expand, client.expand_async,
+        system_prompt=SYSTEM_GUIDE,
+        user_prompt=expanded_local,
+        reference_images=reference_images,
+        images=images
+    )
+    _record_llm_latency(time.perf_counter() - start)
+    ASSIST_EXPANSIONS.inc(tier='llm', preset=preset or 'none')
+
+    # Cache the result
+    cache.set(cache_key, result, ttl=cfg.get('CACHE_TTL', 3600))
+
+    logger.info("Successfully generated prompt expansion")
+    g.expansion = {'outcome': 'llm', 'preset': preset}
+    return {"expanded": result, "cached": False, "source": "llm", "preset": preset}
+
+
+def _generation_options(data: dict) -> dict:
+    """
+    Read and validate the optional image generation parameters
+
+    Raises:
+        ValueError: If a parameter has the wrong type or is out of range
+    """
+    try:
+        guidance_scale = float(data.get('guidance_scale', 7.5))
+        num_inference_steps = int(data.get('num_inference_steps', 20))
+    except TypeError:
+        # null, a list or an object
+        raise ValueError("guidance_scale and num_inference_steps must be numbers")
+    n = data.get('n', 1)
+    max_images = current_app.config.get('GENERATE_MAX_IMAGES', 4)
+
+    # int() would truncate 2.7 and raise TypeError for null or a list
+    if isinstance(n, bool) or not isinstance(n, int):
+        raise ValueError("n must be an integer")
+
+    if guidance_scale < 1 or guidance_scale > 20:
+        raise ValueError("guidance_scale must be between 1 and 20")
+
+    if num_inference_steps < 1 or num_inference_steps > 100:
+        raise ValueError("num_inference_steps must be between 1 and 100")
+
+    if n < 1 or n > max_images:
+        raise ValueError(f"n must be between 1 and {max_images}")
+
+    return {
+        'negative_prompt': data.get('negative_prompt', '').strip(),
+        'guidance_scale': guidance_scale,
+        'num_inference_steps': num_inference_steps,
+        'n': n,
+    }
+
+
+def _save_variant(result: dict, prompt: str, aspect_ratio: str, output_folder: str,
+                  variant: int) -> dict:
+    """
+    Save one generated image and queue its preview and optimization
+
+    Returns:
+        Response fields of the variant
+
+    Raises:
+        RuntimeError: If the image could not be saved
+    """
+    filename = generate_output_filename(prompt, aspect_ratio, variant=variant)
+    filepath = save_generated_image(result['image_base64'], output_folder, filename)
+    if not filepath:
+        raise RuntimeError("Failed to save generated image")
+
+    # Raw bytes are on disk; the preview and optimization follow in the
+    # background, and clients show the full image until the preview exists
+    preview = image_pipeline.submit(filepath)
+    preview_url = f"/output/{preview}" if preview else None
+
+    return {
+        "filename": filename,
+        "url": f"/output/{filename}",
+        "preview_url": preview_url,
+        "seed": result.get('seed'),
+        "width": result.get('width'),
+        "height": result.get('height'),
+    }
+
+
+def _generate(prompt: str, aspect_ratio: str, options: dict, images: list,
+              references: list = None) -> dict:
+    """
+    Generate the requested image variants and save them
+
+    All variants come from as few upstream calls as the model allows and
+    are decoded and written concurrently. The first variant's fields are
+    also returned at the top level, as for a single image.
+
+    Args:
+        prompt: Prompt for the image model
+        aspect_ratio: Aspect ratio
+        options: Parameters from ``_generation_options``
+        images: Reference images from ``load_reference_images``
+        references: Filenames of the reference images, for the history
+
+    Returns:
+        Response fields for the generated images
+
+    Raises:
+        RuntimeError: If generation or saving failed
+    """
+    cfg = current_app.config
+    banana_model = cfg.get('BANANA_MODEL', 'gemini-2.5-flash-image-preview')
+
+    # Initialize Banana AI client (uses Gemini Image model)
+    banana_client = BananaAIClient(cfg.get('GEMINI_API_KEY'), banana_model, pool=upstream_pool)
+
+    # Generate images
+    logger.info("Generating %d image(s) with prompt: %.50s...", options['n'], prompt)
+    start = time.perf_counter()
+    results = _call_upstream(
+        banana_client.generate_images, banana_client.generate_images_async,
+        prompt=prompt,
+        aspect_ratio=aspect_ratio,
+        reference_images=images,
+        **options
+    )
+
+    if not results:
+        raise RuntimeError("Failed to generate image")
+
+    # Save generated images, several variants in parallel
+    output_folder = cfg.get('OUTPUT_FOLDER', 'output')
+    if len(results) == 1:
+        variants = [_save_variant(results[0], prompt, aspect_ratio, output_folder, 0)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(results)) as pool:
+            # Each worker runs in a copy of the request context so its spans are traced
+            futures = [
+                pool.submit(contextvars.copy_context().run, _save_variant,
+                            result, prompt, aspect_ratio, output_folder, index)
+                for index, result in enumerate(results)
+            ]
+            variants = [future.result() for future in futures]
+
+    # Metadata goes to the history store's writer thread, off the request path
+    generation_ms = round((time.perf_counter() - start) * 1000)
+    trace = g.get('trace')
+    for index, (result, variant) in enumerate(zip(results, variants)):
+        history.record(
+            filename=variant['filename'], prompt=prompt, aspect_ratio=aspect_ratio,
+            negative_prompt=options['negative_prompt'], guidance_scale=options['guidance_scale'],
+            num_inference_steps=options['num_inference_steps'], variant=index,
+            seed=result.get('seed'), width=result.get('width'), height=result.get('height'),
+            model=result.get('model'), placeholder=(result.get('model') or '').endswith('(placeholder)'),
+            generation_ms=generation_ms, reference_images=references or [],
+            request_id=trace.request_id if trace else None
+        )
+
+    logger.info("Image generation completed successfully")
+    return {
+        "success": True,
+        **variants[0],
+        "images": variants,
+        "prompt": prompt,
+        "aspect_ratio": aspect_ratio,
+        "generation_time": results[0].get('generation_time'),
+        "message": "Image generated successfully"
+    }
+
 
 @api_bp.route('/assist', methods=['POST'])
 @rate_limit('assist')
+@admit('assist')
 def assist():
     """AI-powered prompt expansion endpoint"""
     try:
         data = request.get_json(force=True, silent=True) or {}
         
         # Validate input
-        is_valid, error_msg = validate_prompt_request(data)
+        with span('validate'):
+            is_valid, error_msg = validate_prompt_request(data)
         if not is_valid:
             return jsonify({"error": error_msg}), 400
 
         user_text = data.get('prompt').strip()
         ar = data.get('aspect_ratio', '9:16').strip()
         reference_images = data.get('reference_images', [])
-        
-        # Check cache first (include images in cache key)
-        cache_key = f"{user_text}:{ar}:{','.join(reference_images)}"
-        cached_result = cache.get(cache_key)
-        if cached_result:
-            logger.info("Returning cached prompt expansion")
-            return jsonify({"expanded": cached_result, "cached": True})
+        refine = bool(data.get('refine', False))
 
-        # 1) rule-based expansion ภายใน
-        expanded_local = expand_prompt(user_text, ar)
-        
-        # Add reference image context if provided
-        if reference_images:
-            image_context = f"\n\nReference images provided: {', '.join(reference_images)}"
-            expanded_local = expanded_local + image_context
-            logger.info(f"Processing with reference images: {reference_images}")
-
-        # 2) ส่งเข้า Gemini 2.5 Flash เพื่อขยาย/ขัดเกลา
-        cfg = current_app.config
-        client = LLMClient(api_key=cfg.get('GEMINI_API_KEY'), model=cfg.get('LLM_MODEL'))
-        result = client.expand(SYSTEM_GUIDE, expanded_local, reference_images=reference_images)
-        
-        # Cache the result
-        cache.set(cache_key, result, ttl=cfg.get('CACHE_TTL', 3600))
-        
-        logger.info("Successfully generated prompt expansion")
-        return jsonify({"expanded": result, "cached": False})
+        return jsonify(_expand(user_text, ar, reference_images, refine))
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -78,7 +315,8 @@ def upload():
         file = request.files['image_file']
         
         # Validate file
-        is_valid, error_msg = validate_image_file(file)
+        with span('validate'):
+            is_valid, error_msg = validate_image_file(file)
         if not is_valid:
             return jsonify({"error": error_msg}), 400
         
@@ -91,7 +329,7 @@ def upload():
         
         # Return file info
         file_url = get_file_url(filename)
-        logger.info(f"File uploaded successfully: {filename}")
+        logger.info("File uploaded successfully: %s", filename)
         
         return jsonify({
             "filename": filename,
@@ -104,99 +342,123 @@ def upload():
         return jsonify({"error": "Failed to upload file"}), 500
 
 
+@api_bp.route('/upload/sessions', methods=['POST'])
+@rate_limit('upload')
+def create_upload_session():
+    """
+    Start a resumable chunked upload
+
+    Takes ``filename``, ``size`` and ``sha256`` (hex, of the whole file).
+    The client then PUTs chunks to ``/upload/sessions/<upload_id>`` with an
+    ``Upload-Offset`` header and finishes with ``.../complete``.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    filename = data.get('filename')
+    if not isinstance(filename, str) or not filename.strip():
+        return jsonify({"error": "filename is required"}), 400
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in ALLOWED_EXTENSIONS:
+        return jsonify({"error": f"Invalid file type. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
+
+    try:
+        return jsonify(upload_sessions.create(filename, data.get('size'), data.get('sha256'),
+                                              client=client_address())), 201
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except SessionLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429 if e.per_client else 503
+
+
+@api_bp.route('/upload/sessions/<upload_id>', methods=['GET'])
+@rate_limit('upload_chunk')
+def upload_session_status(upload_id):
+    """Bytes received so far; a client resumes from ``offset``"""
+    try:
+        return jsonify(upload_sessions.status(upload_id))
+    except UploadSessionNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+
+
+@api_bp.route('/upload/sessions/<upload_id>', methods=['PUT'])
+@rate_limit('upload_chunk')
+def upload_chunk(upload_id):
+    """Append the request body at ``Upload-Offset``"""
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header is required"}), 400
+
+    try:
+        with span('disk_write'):
+            offset = upload_sessions.append(upload_id, offset, request.stream, request.content_length)
+        return jsonify({"upload_id": upload_id, "offset": offset})
+    except UploadSessionNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+    except OffsetMismatch as e:
+        # The client resends from the offset the server has
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@api_bp.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+@rate_limit('upload_chunk')
+def complete_upload(upload_id):
+    """Verify the size and SHA-256 of a chunked upload and save it like ``/upload``"""
+    try:
+        done = upload_sessions.complete(upload_id)
+    except UploadSessionNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+    except OffsetMismatch as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    except ChecksumMismatch as e:
+        return jsonify({"error": str(e)}), 422
+
+    with span('validate'), open(done['path'], 'rb') as f:
+        is_valid, error_msg = validate_image_file(FileStorage(f, filename=done['filename']))
+    if not is_valid:
+        os.remove(done['path'])
+        return jsonify({"error": error_msg}), 400
+
+    filename = save_uploaded_path(done['path'], done['filename'],
+                                  current_app.config.get('UPLOAD_FOLDER', 'uploads'))
+    if not filename:
+        return jsonify({"error": "Failed to save file"}), 500
+
+    logger.info("Chunked upload completed: %s (%d bytes)", filename, done['size'])
+    return jsonify({
+        "filename": filename,
+        "url": get_file_url(filename),
+        "message": "File uploaded successfully"
+    })
+
+
 @api_bp.route('/generate', methods=['POST'])
 @rate_limit('assist')  # Use same rate limit as assist
+@idempotent('generate')
+@admit('generate')
 def generate():
     """Generate image using Banana AI"""
     try:
         data = request.get_json(force=True, silent=True) or {}
         
         # Validate input
-        is_valid, error_msg = validate_prompt_request(data)
+        with span('validate'):
+            is_valid, error_msg = validate_prompt_request(data)
         if not is_valid:
             return jsonify({"error": error_msg}), 400
 
         prompt = data.get('prompt').strip()
         aspect_ratio = data.get('aspect_ratio', '9:16').strip()
-        
-        # Optional parameters
-        negative_prompt = data.get('negative_prompt', '').strip()
-        guidance_scale = float(data.get('guidance_scale', 7.5))
-        num_inference_steps = int(data.get('num_inference_steps', 20))
+        options = _generation_options(data)
         reference_images = data.get('reference_images', [])  # list of uploaded image filenames
-        
-        # Validate optional parameters
-        if guidance_scale < 1 or guidance_scale > 20:
-            return jsonify({"error": "guidance_scale must be between 1 and 20"}), 400
-        
-        if num_inference_steps < 1 or num_inference_steps > 100:
-            return jsonify({"error": "num_inference_steps must be between 1 and 100"}), 400
 
-        # Get configuration
-        cfg = current_app.config
-        api_key = cfg.get('GEMINI_API_KEY')
-        banana_model = cfg.get('BANANA_MODEL', 'gemini-2.5-flash-image-preview')
-        
-        if not api_key:
+        if not current_app.config.get('GEMINI_API_KEY'):
             return jsonify({"error": "GEMINI_API_KEY not configured"}), 503
 
-        # Initialize Banana AI client (uses Gemini Image model)
-        banana_client = BananaAIClient(api_key, banana_model)
-        
-        # Build reference image paths if provided
-        reference_image_paths = []
-        if reference_images:
-            upload_folder = cfg.get('UPLOAD_FOLDER', 'uploads')
-            for ref_image in reference_images:
-                ref_path = os.path.join(upload_folder, ref_image)
-                if os.path.exists(ref_path):
-                    reference_image_paths.append(ref_path)
-                    logger.info(f"Using reference image: {ref_image}")
-                else:
-                    logger.warning(f"Reference image not found: {ref_path}")
-            logger.info(f"Total reference images found: {len(reference_image_paths)}")
-        
-        # Generate image
-        logger.info(f"Generating image with prompt: {prompt[:50]}...")
-        result = banana_client.generate_image(
-            prompt=prompt,
-            aspect_ratio=aspect_ratio,
-            negative_prompt=negative_prompt,
-            guidance_scale=guidance_scale,
-            num_inference_steps=num_inference_steps,
-            reference_image_paths=reference_image_paths
-        )
-        
-        if not result:
-            return jsonify({"error": "Failed to generate image"}), 500
-        
-        # Save generated image
-        output_folder = cfg.get('OUTPUT_FOLDER', 'output')
-        filename = generate_output_filename(prompt, aspect_ratio)
-        
-        filepath = save_generated_image(
-            result['image_base64'], 
-            output_folder, 
-            filename
-        )
-        
-        if not filepath:
-            return jsonify({"error": "Failed to save generated image"}), 500
-        
-        # Return result
-        logger.info("Image generation completed successfully")
-        return jsonify({
-            "success": True,
-            "filename": filename,
-            "url": f"/output/{filename}",
-            "prompt": prompt,
-            "aspect_ratio": aspect_ratio,
-            "seed": result.get('seed'),
-            "width": result.get('width'),
-            "height": result.get('height'),
-            "generation_time": result.get('generation_time'),
-            "message": "Image generated successfully"
-        })
+        images = load_reference_images(current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                                       reference_images)
+        return jsonify(_generate(prompt, aspect_ratio, options, images, reference_images))
         
     except ValueError as e:
         logger.error(f"Validation error: {e}")
@@ -206,4 +468,120 @@ def generate():
         return jsonify({"error": str(e)}), 503
     except Exception as e:
         logger.error(f"Unexpected error in /generate: {e}")
-        return jsonify({"error": "Internal server error"}), 500
\ No newline at end of file
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {current_app.json.dumps(data)}\n\n"
+
+
+@api_bp.route('/create', methods=['POST'])
+@rate_limit('assist')
+def create():
+    """
+    Expand the prompt and generate the image in one request
+
+    Streams server-sent events: ``expanded`` as soon as the prompt is
+    expanded, then ``image`` (the /generate response) or ``error``.
+    Reference images are loaded once and shared by both stages, which run
+    in one slot of the ``generate`` admission queue; a shed request gets an
+    ``error`` event with ``retry_after``.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+
+    with span('validate'):
+        is_valid, error_msg = validate_prompt_request(data)
+    if not is_valid:
+        return jsonify({"error": error_msg}), 400
+
+    try:
+        options = _generation_options(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not current_app.config.get('GEMINI_API_KEY'):
+        return jsonify({"error": "GEMINI_API_KEY not configured"}), 503
+
+    user_text = data.get('prompt').strip()
+    ar = data.get('aspect_ratio', '9:16').strip()
+    reference_images = data.get('reference_images', [])
+    refine = bool(data.get('refine', False))
+
+    def events():
+        stage = 'expand'
+        try:
+            with admission_slot('generate'):
+                images = load_reference_images(current_app.config.get('UPLOAD_FOLDER', 'uploads'),
+                                               reference_images)
+                expansion = _expand(user_text, ar, reference_images, refine, images=images)
+                yield _sse('expanded', expansion)
+
+                stage = 'generate'
+                yield _sse('image', _generate(expansion['expanded'], ar, options, images,
+                                              reference_images))
+        except Shed as e:
+            yield _sse('error', {"stage": stage, "error": BUSY_MESSAGE, "retry_after": e.retry_after})
+        except ValueError as e:
+            logger.error("Validation error during %s: %s", stage, e)
+            yield _sse('error', {"stage": stage, "error": str(e)})
+        except RuntimeError as e:
+            logger.error("API error during %s: %s", stage, e)
+            # Same messages as /assist and /generate
+            message = str(e) if stage == 'generate' else "Service temporarily unavailable"
+            yield _sse('error', {"stage": stage, "error": message})
+        except Exception as e:
+            logger.error("Unexpected error in /create during %s: %s", stage, e)
+            yield _sse('error', {"stage": stage, "error": "Internal server error"})
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    # Ask reverse proxies not to buffer, so the expanded prompt arrives early
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _timestamp(value: str):
+    """
+    Parse a Unix time or ISO 8601 date from a query parameter
+
+    Raises:
+        ValueError: If the value is neither
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}")
+
+
+@api_bp.route('/history', methods=['GET'])
+def generation_history():
+    """
+    List past generations, newest first
+
+    Query parameters: ``limit``, ``cursor`` (``next_cursor`` of the
+    previous page), ``q`` (prompt text), ``aspect_ratio``, ``since`` and
+    ``until`` (Unix time or ISO 8601).
+    """
+    if not history.enabled:
+        return jsonify({"error": "History is disabled"}), 404
+    args = request.args
+    try:
+        with span('history'):
+            page = history.query(
+                limit=int(args.get('limit', 20)),
+                cursor=args.get('cursor'),
+                text=args.get('q', '').strip() or None,
+                aspect_ratio=args.get('aspect_ratio') or None,
+                since=_timestamp(args.get('since')),
+                until=_timestamp(args.get('until'))
+            )
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
@@ -1,7 +1,16 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, current_app, Response
 import time
-import os
-from ..utils.file_ops import get_upload_stats
+from ..services.file_index import file_index
+from ..services.image_pipeline import image_pipeline
+from ..services.health_prober import health_prober, READY
+from ..services.metrics import metrics
+from ..services.reference_images import reference_cache
+from ..services.upstream_pool import upstream_pool
+from ..services.idempotency import idempotency
+from ..services.history import history
+from ..services.upload_sessions import upload_sessions
+from ..middleware.admission import admission_summary
+from ..middleware.capture import capture_summary
 
 health_bp = Blueprint('health', __name__)
 
@@ -20,29 +29,41 @@ def health_check():
 
 @health_bp.route('/ready', methods=['GET'])  
 def readiness_check():
-    """Check if all dependencies are available"""
+    """Check if all dependencies are available
+    
+    Answers from the background prober's cached result; "degraded" (503)
+    tells the load balancer to shed traffic from an overloaded instance.
+    """
     try:
-        # Check if upload folder exists
-        upload_folder = os.getenv('UPLOAD_FOLDER', 'uploads')
-        if not os.path.exists(upload_folder):
-            return jsonify({"status": "not ready", "error": "Upload folder missing"}), 503
-            
-        # Check if API key is configured
-        if not os.getenv('GEMINI_API_KEY'):
-            return jsonify({"status": "not ready", "error": "API key missing"}), 503
-            
-        return jsonify({"status": "ready"})
+        status, details = health_prober.status()
+        return jsonify({"status": status, **details}), 200 if status == READY else 503
     except Exception as e:
         return jsonify({"status": "not ready", "error": str(e)}), 503
 
 @health_bp.route('/stats', methods=['GET'])
 def stats():
     """Get application statistics"""
-    upload_folder = os.getenv('UPLOAD_FOLDER', 'uploads')
-    upload_stats = get_upload_stats(upload_folder)
+    # Counters of the file index shared by all workers, no directory scan per request
+    cfg = current_app.config
+    upload_stats = file_index.stats(cfg.get('UPLOAD_FOLDER', 'uploads'))
+    output_stats = file_index.stats(cfg.get('OUTPUT_FOLDER', 'output'))
     
     return jsonify({
         "uptime": time.time() - start_time,
         "uploads": upload_stats,
+        "outputs": output_stats,
+        "upload_sessions": upload_sessions.summary(),
+        "image_pipeline": image_pipeline.summary(),
+        "reference_cache": reference_cache.summary(),
+        "upstream_pool": upstream_pool.summary(),
+        "admission": admission_summary(current_app),
+        "idempotency": idempotency.summary(),
+        "history": history.summary(),
+        "capture": capture_summary(current_app),
         "version": "1.0.0"
-    })
\ No newline at end of file
+    })
+
+@health_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint, aggregated across worker processes"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
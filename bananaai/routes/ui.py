@@ -1,24 +1,57 @@
-from flask import Blueprint, render_template, send_from_directory, current_app
-import os
+import hashlib
+
+from flask import Blueprint, render_template, current_app, request
+from flask_wtf.csrf import generate_csrf
+from ..services.assets import assets
+from ..services.storage import storage
 
 ui_bp = Blueprint('ui', __name__)
 
+# Name of the cookie main.js reads the CSRF token from
+CSRF_COOKIE = 'csrf_token'
+
+
+def _render_index():
+    """Render index.html once per process and keep the body and its ETag"""
+    cached = current_app.extensions.get('index_page')
+    if cached is None or current_app.debug:
+        body = render_template('index.html').encode('utf-8')
+        cached = (body, hashlib.sha256(body).hexdigest()[:16])
+        current_app.extensions['index_page'] = cached
+    return cached
+
 
 @ui_bp.route('/')
 def index():
     """Main UI page"""
-    return render_template('index.html')
+    body, etag = _render_index()
+    response = current_app.response_class(body, mimetype='text/html')
+    response.set_etag(etag)
+    # Revalidate every time so a deploy is picked up; unchanged pages cost a 304
+    response.headers['Cache-Control'] = 'no-cache'
+
+    # The page is identical for every visitor, so the per-session CSRF token
+    # travels in a cookie instead of being rendered into the HTML
+    response.set_cookie(CSRF_COOKIE, generate_csrf(), samesite='Strict',
+                        secure=request.is_secure, httponly=False)
+    return response.make_conditional(request)
+
+
+@ui_bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve fingerprinted, precompressed static assets"""
+    return assets.send(filename)
 
 
 @ui_bp.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
     upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-    return send_from_directory(upload_folder, filename)
+    return storage.send(upload_folder, filename)
 
 
 @ui_bp.route('/output/<filename>')
 def generated_file(filename):
     """Serve generated image files"""
     output_folder = current_app.config.get('OUTPUT_FOLDER', 'output')
-    return send_from_directory(output_folder, filename)
\ No newline at end of file
+    return storage.send(output_folder, filename)
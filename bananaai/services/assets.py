@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+import mimetypes
+from typing import Dict
+
+from flask import abort, request, send_from_directory, url_for
+
+from ..tools.build_assets import DIST_DIR, MANIFEST
+
+logger = logging.getLogger(__name__)
+
+# Built names contain a content hash, so a URL never changes meaning
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class Assets:
+    """Serves fingerprinted, precompressed static assets
+
+    Reads the manifest written by ``python -m bananaai.tools.build_assets``.
+    Templates call ``asset_url('js/main.js')``: with a manifest it points at
+    the hashed file under ``/assets/``, otherwise at the plain file under
+    ``/static/`` so development works without a build.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.manifest: Dict[str, str] = {}
+        self._built = set()
+
+    def init_app(self, app):
+        """Load the manifest and register the ``asset_url`` template helper"""
+        self.load(app.static_folder)
+        app.add_template_global(self.url, 'asset_url')
+
+    def load(self, static_folder: str):
+        """(Re)load the build manifest from ``<static_folder>/dist``"""
+        self.folder = os.path.join(static_folder, DIST_DIR)
+        try:
+            with open(os.path.join(self.folder, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+            logger.info("No asset manifest; serving unbuilt static files")
+        self._built = set(self.manifest.values())
+
+    def url(self, path: str) -> str:
+        """URL of a static asset, preferring the built version"""
+        built = self.manifest.get(path)
+        if built:
+            return url_for('ui.asset', filename=built)
+        return url_for('static', filename=path)
+
+    def send(self, filename: str):
+        """Serve a built asset, using a .br or .gz sibling if the client accepts it"""
+        if filename not in self._built:
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        served, encoding = filename, None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[candidate] and \
+                    os.path.exists(os.path.join(self.folder, filename + suffix)):
+                served, encoding = filename + suffix, candidate
+                break
+
+        response = send_from_directory(self.folder, served, mimetype=mimetype, max_age=31536000)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+assets = Assets()
@@ -1,25 +1,43 @@
 import time
+import asyncio
 import logging
-import google.generativeai as genai
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import base64
 import os
-import tempfile
-from PIL import Image
 from io import BytesIO
+from ..utils.lazy_import import LazyModule
+from .metrics import track_upstream, UPSTREAM_RETRIES, PLACEHOLDER_FALLBACKS
+from .reference_images import reference_cache
+from .upstream_pool import routed
+from ..middleware.tracing import span
+
+# The SDK pulls in gRPC and protobuf; load it on first use, not at app start
+genai = LazyModule('google.generativeai')
 
 logger = logging.getLogger(__name__)
 
+# Most candidates requested in one call; models that reject several
+# candidates per call are lowered to 1 the first time they do
+MAX_CANDIDATES = 4
+_candidate_limits: Dict[str, int] = {}
+
 
 class BananaAIClient:
     """Client for Banana AI image generation using Google Generative AI Image Model"""
 
-    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-image-preview"):
+    def __init__(self, api_key: str, model_name: str = "gemini-2.5-flash-image-preview",
+                 pool=None):
+        """
+        Args:
+            pool: ``UpstreamPool`` to route each call through; the client
+                then reports the model of its latest call as ``model_name``
+        """
         if not api_key:
             raise ValueError("GEMINI_API_KEY is required for Banana AI")
         
         self.api_key = api_key
         self.model_name = model_name
+        self.pool = pool
         genai.configure(api_key=api_key)
         self._image_model = None
 
@@ -29,24 +47,17 @@ class BananaAIClient:
             self._image_model = genai.GenerativeModel(self.model_name)
         return self._image_model
 
-    def generate_image(self, prompt: str, aspect_ratio: str = "9:16", 
-                      negative_prompt: str = "", guidance_scale: float = 7.5, 
-                      num_inference_steps: int = 20, reference_image_paths: list = None,
-                      max_retries: int = 3) -> Optional[Dict[str, Any]]:
+    def _prepare(self, prompt: str, aspect_ratio: str, negative_prompt: str,
+                 reference_image_paths: list = None, reference_images: list = None):
         """
-        Generate image using Gemini 2.5 Flash Image Preview model with reference image
-        
-        Args:
-            prompt: Text prompt for image generation
-            aspect_ratio: Image aspect ratio (9:16 or 16:9)
-            negative_prompt: What to avoid in the image
-            guidance_scale: How closely to follow the prompt (1-20)
-            num_inference_steps: Number of denoising steps (1-100)
-            reference_image_paths: List of paths to reference image files
-            max_retries: Maximum retry attempts
-        
+        Resolve dimensions, build the prompt and load reference images
+
+        Loaded ``reference_images`` are used as they are; otherwise the
+        files in ``reference_image_paths`` are read through the shared
+        reference image cache.
+
         Returns:
-            Dictionary containing image data and metadata or None if failed
+            Tuple of (width, height, content)
         """
         # Convert aspect ratio to width/height - fixed dimensions
         if aspect_ratio == "16:9":
@@ -58,129 +69,323 @@ class BananaAIClient:
         image_prompt = self._build_image_prompt(prompt, negative_prompt, aspect_ratio)
 
         # Load reference images if provided
-        reference_images = []
-        if reference_image_paths:
-            for ref_path in reference_image_paths:
-                if os.path.exists(ref_path):
-                    try:
-                        from PIL import Image as PILImage
-                        ref_img = PILImage.open(ref_path)
-                        reference_images.append(ref_img)
-                        logger.info(f"Loaded reference image: {ref_path}")
-                    except Exception as e:
-                        logger.error(f"Error loading reference image {ref_path}: {e}")
-            logger.info(f"Total reference images loaded: {len(reference_images)}")
-
-        for attempt in range(max_retries):
-            try:
-                logger.info(f"Generating image with Gemini Image Model (attempt {attempt + 1})")
-                
-                # Get image generation model
-                model = self._get_image_model()
-                
-                # Build content for generation
-                if reference_images:
-                    # Include reference images in the prompt
-                    if len(reference_images) == 1:
-                        content = [
-                            f"Based on this reference image, {image_prompt}",
-                            reference_images[0]
-                        ]
-                        logger.info("Using 1 reference image for generation")
+        if reference_images is not None:
+            reference_images = list(reference_images)
+        elif reference_image_paths:
+            reference_images = []
+            with span('ref_load', images=len(reference_image_paths)):
+                for ref_path in reference_image_paths:
+                    blob = reference_cache.get(ref_path)
+                    if blob is not None:
+                        reference_images.append(blob)
+                        logger.debug("Loaded reference image: %s", ref_path)
                     else:
-                        content = [f"Based on these reference images, combine and use them as inspiration for: {image_prompt}"]
-                        content.extend(reference_images)
-                        logger.info(f"Using {len(reference_images)} reference images for generation")
+                        logger.error("Error loading reference image %s", ref_path)
+            logger.debug("Total reference images loaded: %d", len(reference_images))
+        else:
+            reference_images = []
+
+        # Build content for generation
+        if reference_images:
+            # Include reference images in the prompt
+            if len(reference_images) == 1:
+                content = [
+                    f"Based on this reference image, {image_prompt}",
+                    reference_images[0]
+                ]
+                logger.debug("Using 1 reference image for generation")
+            else:
+                content = [f"Based on these reference images, combine and use them as inspiration for: {image_prompt}"]
+                content.extend(reference_images)
+                logger.debug("Using %d reference images for generation", len(reference_images))
+        else:
+            content = image_prompt
+            logger.debug("No reference images, using text prompt only")
+
+        return width, height, content
+
+    @staticmethod
+    def _generation_config(guidance_scale: float, candidate_count: int = 1) -> dict:
+        return {
+            "temperature": max(0.1, min(1.0, guidance_scale / 10)),
+            "max_output_tokens": 2048,
+            "candidate_count": candidate_count
+        }
+
+    def _candidates_per_call(self, wanted: int) -> int:
+        """How many candidates to ask for in one call to this model"""
+        return max(1, min(wanted, _candidate_limits.get(self.model_name, MAX_CANDIDATES)))
+
+    def _result(self, image_data, mime_type: str, model: str, prompt: str, aspect_ratio: str,
+                width: int, height: int, index: int) -> Dict[str, Any]:
+        return {
+            "image_base64": image_data,  # Can be bytes or string
+            "seed": hash(f"{prompt}{time.time()}{index}") % 1000000,
+            "prompt": prompt,
+            "aspect_ratio": aspect_ratio,
+            "width": width,
+            "height": height,
+            "generation_time": time.time(),
+            "mime_type": mime_type,
+            "model": model
+        }
+
+    def _extract_images(self, response, prompt: str, aspect_ratio: str, width: int,
+                        height: int, limit: int, start: int = 0) -> List[Dict[str, Any]]:
+        """
+        Collect the image parts of every candidate in a response
+
+        Args:
+            limit: Most images to return
+            start: Index of the first image, used to vary the seeds
+
+        Returns:
+            Result dictionaries, empty if the response holds no image data
+        """
+        results = []
+        for candidate in response.candidates or []:
+            content = getattr(candidate, 'content', None)
+            for part in (content.parts if content else None) or []:
+                inline_data = getattr(part, 'inline_data', None)
+                if not inline_data:
+                    continue
+                # Found image data - it might be raw bytes or base64; our
+                # save function handles both
+                if isinstance(inline_data.data, bytes):
+                    logger.debug("Received raw binary image data from Gemini")
                 else:
-                    content = image_prompt
-                    logger.info("No reference images, using text prompt only")
-                
-                # Generate image using Gemini Image Preview model
-                response = model.generate_content(
-                    content,
-                    generation_config={
-                        "temperature": max(0.1, min(1.0, guidance_scale / 10)),
-                        "max_output_tokens": 2048,
-                        "candidate_count": 1
-                    }
-                )
-                
-                # Extract image data from response
-                if response.candidates and len(response.candidates) > 0:
-                    candidate = response.candidates[0]
+                    logger.debug("Received base64 image data from Gemini")
+                results.append(self._result(
+                    inline_data.data, inline_data.mime_type, self.model_name,
+                    prompt, aspect_ratio, width, height, start + len(results)
+                ))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _placeholder(self, prompt: str, aspect_ratio: str,
+                     width: int, height: int) -> Optional[Dict[str, Any]]:
+        """Placeholder result for a response without image data, or None"""
+        logger.warning("No image data in Gemini response, creating placeholder")
+        image_data = self._create_placeholder_image(width, height, prompt)
+        
+        if image_data:
+            logger.info("Created placeholder image")
+            PLACEHOLDER_FALLBACKS.inc(model=self.model_name)
+            return self._result(image_data, "image/png", self.model_name + " (placeholder)",
+                                prompt, aspect_ratio, width, height, 0)
+        
+        logger.error("Failed to create any image data")
+        return None
+
+    def _collect(self, response, results: list, n: int, prompt: str, aspect_ratio: str,
+                 width: int, height: int) -> bool:
+        """
+        Add the images of one response to ``results``
+
+        Returns:
+            True when generation is finished: ``n`` images collected, a
+            placeholder stands in for a response without images, or the
+            model stopped returning images after some were collected
+        """
+        images = self._extract_images(response, prompt, aspect_ratio, width, height,
+                                      limit=n - len(results), start=len(results))
+        if images:
+            logger.info("Successfully generated %d image(s) with Gemini", len(images))
+            results.extend(images)
+            return len(results) >= n
+        if results:
+            logger.warning("Gemini returned %d of %d images", len(results), n)
+            return True
+        placeholder = self._placeholder(prompt, aspect_ratio, width, height)
+        if placeholder:
+            results.append(placeholder)
+            return True
+        return False
+
+    def _on_error(self, e: Exception, count: int, failures: int, max_retries: int) -> bool:
+        """
+        Handle a failed call
+
+        Returns:
+            True if the call failed only because the model rejects several
+            candidates per call; it is then retried one candidate at a time
+            without counting as a failure
+        """
+        if count > 1 and type(e).__name__ == 'InvalidArgument':
+            logger.warning("%s rejected candidate_count=%d, requesting one image per call",
+                           self.model_name, count)
+            _candidate_limits[self.model_name] = 1
+            return True
+        self._handle_error(e, failures, max_retries)
+        return False
+
+    def _handle_error(self, e: Exception, attempt: int, max_retries: int):
+        """Translate an upstream error into a final exception or let the loop retry"""
+        if isinstance(e, genai.types.BlockedPromptException):
+            logger.error(f"Prompt was blocked by safety filters: {e}")
+            raise ValueError("Prompt contains inappropriate content")
+        
+        if isinstance(e, genai.types.StopCandidateException):
+            logger.error(f"Response generation stopped: {e}")
+            raise ValueError("Could not generate appropriate response")
+        
+        logger.error(f"Unexpected error: {e}")
+        if attempt == max_retries - 1:
+            raise RuntimeError(f"Image generation failed: {str(e)}")
+
+    def generate_images(self, prompt: str, aspect_ratio: str = "9:16", 
+                        negative_prompt: str = "", guidance_scale: float = 7.5, 
+                        num_inference_steps: int = 20, reference_image_paths: list = None,
+                        max_retries: int = 3, reference_images: list = None,
+                        n: int = 1) -> List[Dict[str, Any]]:
+        """
+        Generate ``n`` image variants with as few upstream calls as possible
+        
+        All variants are requested as candidates of a single call. If the
+        model returns fewer, further calls ask for the remainder.
+        
+        Args:
+            prompt: Text prompt for image generation
+            aspect_ratio: Image aspect ratio (9:16 or 16:9)
+            negative_prompt: What to avoid in the image
+            guidance_scale: How closely to follow the prompt (1-20)
+            num_inference_steps: Number of denoising steps (1-100)
+            reference_image_paths: List of paths to reference image files
+            max_retries: Maximum failed attempts
+            reference_images: Reference images from ``load_reference_images``,
+                used instead of reading ``reference_image_paths``
+            n: Number of variants
+        
+        Returns:
+            List of result dictionaries with image data and metadata; a
+            single placeholder if the model answered without images
+        """
+        width, height, content = self._prepare(prompt, aspect_ratio, negative_prompt,
+                                               reference_image_paths, reference_images)
+
+        results, calls, failures = [], 0, 0
+        while failures < max_retries:
+            if failures:
+                UPSTREAM_RETRIES.inc(client='banana', model=self.model_name)
+            count = self._candidates_per_call(n - len(results))
+            try:
+                calls += 1
+                with routed(self.pool, 'banana') as lease:
+                    if lease:
+                        self.model_name = lease.model
+                        count = self._candidates_per_call(n - len(results))
+                    logger.debug("Generating %d image(s) with Gemini Image Model (call %d)", count, calls)
                     
-                    # Check if response contains image data
-                    if hasattr(candidate, 'content') and candidate.content.parts:
-                        for part in candidate.content.parts:
-                            if hasattr(part, 'inline_data') and part.inline_data:
-                                # Found image data - it might be raw bytes or base64
-                                image_data = part.inline_data.data
-                                mime_type = part.inline_data.mime_type
-                                
-                                # Check if data is bytes (raw image) or string (base64)
-                                if isinstance(image_data, bytes):
-                                    logger.info("Received raw binary image data from Gemini")
-                                    # Keep as bytes - our save function can handle it
-                                    final_data = image_data
-                                else:
-                                    logger.info("Received base64 image data from Gemini")
-                                    # Keep as string - our save function can handle it
-                                    final_data = image_data
-                                
-                                logger.info("Successfully generated image with Gemini")
-                                return {
-                                    "image_base64": final_data,  # Can be bytes or string
-                                    "seed": hash(prompt + str(time.time())) % 1000000,
-                                    "prompt": prompt,
-                                    "aspect_ratio": aspect_ratio,
-                                    "width": width,
-                                    "height": height,
-                                    "generation_time": time.time(),
-                                    "mime_type": mime_type,
-                                    "model": self.model_name
-                                }
+                    # Generate image using Gemini Image Preview model
+                    model = lease.generative_model() if lease else self._get_image_model()
+                    with span('upstream', client='banana', attempt=calls, candidates=count), \
+                            track_upstream('banana', self.model_name):
+                        response = model.generate_content(
+                            content,
+                            generation_config=self._generation_config(guidance_scale, count)
+                        )
                 
-                # If no image data found, create placeholder
-                logger.warning("No image data in Gemini response, creating placeholder")
-                image_data = self._create_placeholder_image(width, height, prompt)
-                
-                if image_data:
-                    logger.info("Created placeholder image")
-                    return {
-                        "image_base64": image_data,
-                        "seed": hash(prompt + str(time.time())) % 1000000,
-                        "prompt": prompt,
-                        "aspect_ratio": aspect_ratio,
-                        "width": width,
-                        "height": height,
-                        "generation_time": time.time(),
-                        "mime_type": "image/png",
-                        "model": self.model_name + " (placeholder)"
-                    }
-                else:
-                    logger.error("Failed to create any image data")
+                if self._collect(response, results, n, prompt, aspect_ratio, width, height):
+                    return results
+                if results:
+                    continue
                             
-            except genai.types.BlockedPromptException as e:
-                logger.error(f"Prompt was blocked by safety filters: {e}")
-                raise ValueError("Prompt contains inappropriate content")
-            
-            except genai.types.StopCandidateException as e:
-                logger.error(f"Response generation stopped: {e}")
-                raise ValueError("Could not generate appropriate response")
-            
             except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                if attempt == max_retries - 1:
-                    raise RuntimeError(f"Image generation failed: {str(e)}")
+                if self._on_error(e, count, failures, max_retries):
+                    continue
             
             # Wait before retry (exponential backoff)
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt
-                logger.info(f"Waiting {wait_time} seconds before retry...")
+            failures += 1
+            if failures < max_retries:
+                wait_time = 2 ** (failures - 1)
+                logger.info("Waiting %d seconds before retry...", wait_time)
                 time.sleep(wait_time)
         
         raise RuntimeError("Failed to generate image after all retries")
 
+    def generate_image(self, prompt: str, aspect_ratio: str = "9:16", 
+                      negative_prompt: str = "", guidance_scale: float = 7.5, 
+                      num_inference_steps: int = 20, reference_image_paths: list = None,
+                      max_retries: int = 3, reference_images: list = None) -> Optional[Dict[str, Any]]:
+        """
+        Generate image using Gemini 2.5 Flash Image Preview model with reference image
+        
+        Takes the arguments of ``generate_images`` without ``n``.
+        
+        Returns:
+            Dictionary containing image data and metadata or None if failed
+        """
+        return self.generate_images(prompt, aspect_ratio, negative_prompt, guidance_scale,
+                                    num_inference_steps, reference_image_paths, max_retries,
+                                    reference_images, n=1)[0]
+
+    async def generate_images_async(self, prompt: str, aspect_ratio: str = "9:16", 
+                                    negative_prompt: str = "", guidance_scale: float = 7.5, 
+                                    num_inference_steps: int = 20, reference_image_paths: list = None,
+                                    max_retries: int = 3, reference_images: list = None,
+                                    n: int = 1) -> List[Dict[str, Any]]:
+        """
+        Async variant of ``generate_images`` using the SDK's async generation call
+
+        Takes the same arguments and returns the same result. Disk reads and
+        placeholder rendering run in a worker thread to keep the loop free.
+        """
+        width, height, content = await asyncio.to_thread(
+            self._prepare, prompt, aspect_ratio, negative_prompt, reference_image_paths,
+            reference_images
+        )
+
+        results, calls, failures = [], 0, 0
+        while failures < max_retries:
+            if failures:
+                UPSTREAM_RETRIES.inc(client='banana', model=self.model_name)
+            count = self._candidates_per_call(n - len(results))
+            try:
+                calls += 1
+                with routed(self.pool, 'banana') as lease:
+                    if lease:
+                        self.model_name = lease.model
+                        count = self._candidates_per_call(n - len(results))
+                    logger.debug("Generating %d image(s) with Gemini Image Model (async, call %d)",
+                                 count, calls)
+                    
+                    model = lease.generative_model(asynchronous=True) if lease else self._get_image_model()
+                    with span('upstream', client='banana', attempt=calls, candidates=count), \
+                            track_upstream('banana', self.model_name):
+                        response = await model.generate_content_async(
+                            content,
+                            generation_config=self._generation_config(guidance_scale, count)
+                        )
+                
+                if await asyncio.to_thread(self._collect, response, results, n, prompt,
+                                           aspect_ratio, width, height):
+                    return results
+                if results:
+                    continue
+                            
+            except Exception as e:
+                if self._on_error(e, count, failures, max_retries):
+                    continue
+            
+            # Wait before retry (exponential backoff) without blocking the loop
+            failures += 1
+            if failures < max_retries:
+                await asyncio.sleep(2 ** (failures - 1))
+        
+        raise RuntimeError("Failed to generate image after all retries")
+
+    async def generate_image_async(self, prompt: str, aspect_ratio: str = "9:16", 
+                                   negative_prompt: str = "", guidance_scale: float = 7.5, 
+                                   num_inference_steps: int = 20, reference_image_paths: list = None,
+                                   max_retries: int = 3, reference_images: list = None) -> Optional[Dict[str, Any]]:
+        """Async variant of ``generate_image``"""
+        results = await self.generate_images_async(
+            prompt, aspect_ratio, negative_prompt, guidance_scale, num_inference_steps,
+            reference_image_paths, max_retries, reference_images, n=1
+        )
+        return results[0]
+
     def _build_image_prompt(self, prompt: str, negative_prompt: str, aspect_ratio: str) -> str:
         """Build optimized prompt for Gemini image generation model"""
         # Build the image generation prompt
@@ -265,33 +470,23 @@ class BananaAIClient:
         Save base64 image to file
         
         Args:
-            image_base64: Base64 encoded image data (str or bytes)
+            image_base64: Raw image bytes or base64 encoded image data (str or bytes)
             filename: Full path to save the image
         
         Returns:
             True if successful, False otherwise
         """
+        from ..utils.image_codec import write_inline_data
+        
         try:
-            # Handle both string and bytes input
-            if isinstance(image_base64, bytes):
-                # If it's bytes, decode to string first
-                image_base64 = image_base64.decode('utf-8')
-            
-            # Convert to string if not already
-            image_base64 = str(image_base64)
-            
-            # Remove data URL prefix if present
-            if image_base64.startswith('data:image'):
-                image_base64 = image_base64.split(',')[1]
-            
-            # Decode base64
-            image_data = base64.b64decode(image_base64)
+            # Raw bytes, base64 str/bytes and data URLs all go through the
+            # same chunked decoder without intermediate copies
+            write_inline_data(image_base64, filename)
             
-            # Save to file
-            with open(filename, 'wb') as f:
-                f.write(image_data)
+            from .storage import storage
+            storage.publish(os.path.dirname(filename) or '.', os.path.basename(filename))
             
-            logger.info(f"Image saved: {filename}")
+            logger.info("Image saved: %s", filename)
             return True
             
         except Exception as e:
@@ -1,24 +1,30 @@
 import time
 from typing import Optional, Any
+from .metrics import CACHE_HITS, CACHE_MISSES, CACHE_EVICTIONS
 
 class CacheService:
     """Simple in-memory cache with TTL support"""
     
-    def __init__(self, max_size: int = 100):
+    def __init__(self, max_size: int = 100, name: str = 'default'):
         self._cache = {}
         self._access_times = {}
         self.max_size = max_size
+        self.name = name
     
     def get(self, key: str) -> Optional[Any]:
         if key not in self._cache:
+            CACHE_MISSES.inc(cache=self.name)
             return None
         
         value, expiry = self._cache[key]
         if time.time() > expiry:
             self._delete(key)
+            CACHE_EVICTIONS.inc(cache=self.name, reason='expired')
+            CACHE_MISSES.inc(cache=self.name)
             return None
         
         self._access_times[key] = time.time()
+        CACHE_HITS.inc(cache=self.name)
         return value
     
     def set(self, key: str, value: Any, ttl: int = 3600):
@@ -39,6 +45,7 @@ class CacheService:
         
         lru_key = min(self._access_times.items(), key=lambda x: x[1])[0]
         self._delete(lru_key)
+        CACHE_EVICTIONS.inc(cache=self.name, reason='lru')
     
     def clear(self):
         self._cache.clear()
@@ -0,0 +1,328 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A file's access time is written at most this often per process; quota
+# eviction does not need a finer LRU order
+ACCESS_RESOLUTION_SECONDS = 60
+
+# Most recent accesses remembered per process for the above
+MAX_TOUCHED = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0,
+    reconciled_at REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    atime REAL NOT NULL,
+    PRIMARY KEY (folder, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_mtime ON files (folder, mtime);
+CREATE INDEX IF NOT EXISTS files_atime ON files (folder, atime);
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    UPDATE folders SET file_count = file_count + 1, total_bytes = total_bytes + new.size
+    WHERE folder = new.folder;
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE folders SET file_count = file_count - 1, total_bytes = total_bytes - old.size
+    WHERE folder = old.folder;
+END;
+CREATE TRIGGER IF NOT EXISTS files_resize AFTER UPDATE OF size ON files BEGIN
+    UPDATE folders SET total_bytes = total_bytes - old.size + new.size WHERE folder = new.folder;
+END;
+"""
+
+
+class FileIndex:
+    """Incrementally maintained index of the upload and output folders, shared by all workers
+
+    Size, write time and last access of every file live in a SQLite database
+    in WAL mode, so every worker process on the host updates and reads the
+    same index. The code paths that write, read and delete files keep it up
+    to date, so the janitor and ``/health/stats`` never rescan directories:
+    expired files come from an index on write time, quota eviction walks an
+    index on access time, and triggers keep each folder's file count and
+    byte total in one row.
+
+    Folders are scanned when first tracked. After that a background
+    ``reconcile`` every ``reconcile_interval`` seconds picks up files
+    changed behind the app's back (manual cleanup, a crash between writing
+    a file and indexing it). Every worker runs the timer, but the first to
+    claim a folder's round in the database does the scan, so each folder is
+    rescanned once per interval per host.
+    """
+
+    def __init__(self, path: str = None, reconcile_interval: int = 3600):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'bananaai-files.db')
+        self.reconcile_interval = reconcile_interval
+        self._local = threading.local()
+        self._tracked = set()
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._touched_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        """Open the index and track the upload and output folders"""
+        cfg = app.config
+        self.path = cfg.get('FILE_INDEX_DB', self.path)
+        self.reconcile_interval = cfg.get('STATS_RECONCILE_SECONDS', self.reconcile_interval)
+        self._local = threading.local()
+        self._tracked = set()
+        with self._touched_lock:
+            self._touched.clear()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.track(cfg.get('UPLOAD_FOLDER', 'uploads'))
+        self.track(cfg.get('OUTPUT_FOLDER', 'output'))
+
+    def _db(self) -> sqlite3.Connection:
+        """This thread's connection; reopened after a fork"""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid() or self._local.path != self.path:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._local.db = db
+            self._local.pid = os.getpid()
+            self._local.path = self.path
+        return db
+
+    def start(self):
+        """Start the background reconcile thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='file-index-reconcile', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.reconcile_interval):
+            for folder in self.folders():
+                try:
+                    if self._claim(folder):
+                        self.reconcile(folder)
+                except Exception as e:
+                    logger.error(f"File index reconcile failed for {folder}: {e}")
+
+    def _claim(self, folder: str) -> bool:
+        """Take this round's reconcile of a folder, unless another process ran one within the interval"""
+        now = time.time()
+        return self._db().execute(
+            'UPDATE folders SET reconciled_at = ? WHERE folder = ? '
+            'AND (reconciled_at IS NULL OR reconciled_at <= ?)',
+            (now, self._key(folder), now - self.reconcile_interval)
+        ).rowcount == 1
+
+    @staticmethod
+    def _key(folder: str) -> str:
+        return os.path.abspath(folder)
+
+    def track(self, folder: str) -> str:
+        """
+        Start indexing a folder, scanning it if no process has yet
+
+        Returns:
+            The folder's key in the index
+        """
+        key = self._key(folder)
+        if key in self._tracked:
+            return key
+        new = self._db().execute('INSERT OR IGNORE INTO folders (folder) VALUES (?)', (key,)).rowcount
+        if new:
+            self.reconcile(key)
+        self._tracked.add(key)
+        return key
+
+    def folders(self) -> List[str]:
+        """List the folders tracked by this process"""
+        return list(self._tracked)
+
+    @staticmethod
+    def _scan(key: str) -> List[Tuple[str, int, float, float]]:
+        """List (name, size, mtime, atime) of a folder's files with a single scandir pass"""
+        entries = []
+        try:
+            with os.scandir(key) as it:
+                for dirent in it:
+                    if not dirent.is_file(follow_symlinks=False) or dirent.name.endswith('.tmp'):
+                        continue
+                    st = dirent.stat(follow_symlinks=False)
+                    entries.append((dirent.name, st.st_size, st.st_mtime, st.st_atime))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _write(self, sql: str, params: tuple):
+        """Run one update; a failure only leaves drift for the next reconcile"""
+        try:
+            self._db().execute(sql, params)
+        except sqlite3.Error as e:
+            logger.warning(f"File index update failed: {e}")
+
+    def record_write(self, folder: str, filename: str, size: Optional[int] = None):
+        """
+        Record a new or replaced file
+
+        Args:
+            folder: Folder the file was written to
+            filename: Name of the file
+            size: File size in bytes (stat'ed if omitted)
+        """
+        if size is None:
+            try:
+                size = os.path.getsize(os.path.join(folder, filename))
+            except OSError:
+                return
+
+        key = self.track(folder)
+        now = time.time()
+        self._write(
+            'INSERT INTO files (folder, name, size, mtime, atime) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (folder, name) DO UPDATE SET '
+            'size = excluded.size, mtime = excluded.mtime, atime = excluded.atime',
+            (key, filename, size, now, now)
+        )
+
+    def record_access(self, folder: str, filename: str):
+        """Mark a file as recently used"""
+        key = self._key(folder)
+        now = time.time()
+        with self._touched_lock:
+            if now - self._touched.get((key, filename), 0) < ACCESS_RESOLUTION_SECONDS:
+                return
+            if len(self._touched) >= MAX_TOUCHED:
+                self._touched.clear()
+            self._touched[(key, filename)] = now
+        self._write('UPDATE files SET atime = ? WHERE folder = ? AND name = ?', (now, key, filename))
+
+    def record_delete(self, folder: str, filename: str):
+        """Drop a deleted file from the index"""
+        key = self._key(folder)
+        with self._touched_lock:
+            self._touched.pop((key, filename), None)
+        self._write('DELETE FROM files WHERE folder = ? AND name = ?', (key, filename))
+
+    def expired(self, folder: str, cutoff: float) -> List[str]:
+        """List files last written before ``cutoff``, oldest first"""
+        key = self.track(folder)
+        rows = self._db().execute('SELECT name FROM files WHERE folder = ? AND mtime < ? ORDER BY mtime',
+                                  (key, cutoff))
+        return [name for name, in rows]
+
+    def over_quota(self, folder: str, max_bytes: int) -> List[str]:
+        """
+        List least recently used files to evict to get under ``max_bytes``
+
+        Access times are recorded by every worker, so a file that any of
+        them served recently is evicted last.
+        """
+        excess = self.total_bytes(folder) - max_bytes
+        names = []
+        if excess <= 0:
+            return names
+        rows = self._db().execute('SELECT name, size FROM files WHERE folder = ? ORDER BY atime',
+                                  (self._key(folder),))
+        for name, size in rows:
+            names.append(name)
+            excess -= size
+            if excess <= 0:
+                break
+        rows.close()
+        return names
+
+    def total_bytes(self, folder: str) -> int:
+        """Total size of indexed files in a folder"""
+        key = self.track(folder)
+        return self._db().execute('SELECT total_bytes FROM folders WHERE folder = ?', (key,)).fetchone()[0]
+
+    def stats(self, folder: str) -> dict:
+        """
+        Get folder statistics from the maintained counters
+
+        One row read and two index lookups, whatever the number of files.
+
+        Args:
+            folder: Folder to report on
+
+        Returns:
+            Dictionary with the same keys as ``get_upload_stats``, plus
+            ``reconciled_at``, the time of the last folder scan
+        """
+        key = self.track(folder)
+        file_count, total_bytes, reconciled_at, oldest, newest = self._db().execute(
+            'SELECT file_count, total_bytes, reconciled_at, '
+            '(SELECT MIN(mtime) FROM files WHERE folder = ?1), '
+            '(SELECT MAX(mtime) FROM files WHERE folder = ?1) '
+            'FROM folders WHERE folder = ?1', (key,)
+        ).fetchone()
+        return {
+            'file_count': file_count,
+            'total_size_mb': round(total_bytes / (1024 * 1024), 2),
+            'oldest_file': oldest,
+            'newest_file': newest,
+            'reconciled_at': reconciled_at,
+        }
+
+    def reconcile(self, folder: str):
+        """
+        Rescan a folder and fold the result back into the index
+
+        Adds files the index is missing, corrects sizes and drops files that
+        are gone. Files indexed while the scan ran are kept, and known files
+        keep their access time.
+        """
+        key = self._key(folder)
+        scan_started = time.time()
+        on_disk = {name: (size, mtime, atime) for name, size, mtime, atime in self._scan(key)}
+
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('INSERT OR IGNORE INTO folders (folder) VALUES (?)', (key,))
+            indexed = {name: (size, mtime) for name, size, mtime in db.execute(
+                'SELECT name, size, mtime FROM files WHERE folder = ?', (key,))}
+
+            gone = [(key, name) for name, (_, mtime) in indexed.items()
+                    if name not in on_disk and mtime < scan_started]
+            added = [(key, name, size, mtime, atime) for name, (size, mtime, atime) in on_disk.items()
+                     if name not in indexed]
+            resized = [(size, key, name) for name, (size, _, _) in on_disk.items()
+                       if name in indexed and indexed[name][0] != size]
+
+            db.executemany('DELETE FROM files WHERE folder = ? AND name = ?', gone)
+            db.executemany('INSERT INTO files (folder, name, size, mtime, atime) VALUES (?, ?, ?, ?, ?)',
+                           added)
+            db.executemany('UPDATE files SET size = ? WHERE folder = ? AND name = ?', resized)
+            # Recount, so the counters cannot drift from the rows either
+            db.execute('UPDATE folders SET file_count = (SELECT COUNT(*) FROM files WHERE folder = ?1), '
+                       'total_bytes = (SELECT COALESCE(SUM(size), 0) FROM files WHERE folder = ?1), '
+                       'reconciled_at = ?2 WHERE folder = ?1', (key, scan_started))
+
+        if gone or added or resized:
+            logger.info(f"Reconciled file index for {key} "
+                        f"(+{len(added)} -{len(gone)} files, {len(resized)} resized)")
+        else:
+            logger.debug(f"Reconciled file index for {key}: no drift")
+
+
+file_index = FileIndex()
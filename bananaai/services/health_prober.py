@@ -0,0 +1,208 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import g
+
+from .image_pipeline import image_pipeline
+
+logger = logging.getLogger(__name__)
+
+READY = 'ready'
+DEGRADED = 'degraded'
+NOT_READY = 'not ready'
+
+
+def gemini_model_probe(api_key: str, model: str, timeout: float) -> None:
+    """
+    Cheap upstream check: fetch the model's metadata
+
+    ``get_model`` needs a valid key, DNS, TLS and a working route to the API,
+    but generates nothing and is not billed.
+    """
+    from .llm_client import genai
+    genai.configure(api_key=api_key)
+    genai.get_model(f"models/{model}", request_options={'timeout': timeout})
+
+
+class HealthProber:
+    """Background readiness checks
+
+    A daemon thread periodically measures upstream reachability and latency,
+    free disk space and the image pipeline backlog, and caches the result.
+    ``/health/ready`` reads the cached result plus the live in-flight request
+    gauge, so answering a probe never blocks on the network or the disk.
+    """
+
+    def __init__(self, interval: int = 30, timeout: float = 5.0,
+                 probe: Optional[Callable[[str, str, float], None]] = None):
+        self.enabled = True
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = 2
+        self.slow_upstream_ms = 5000
+        self.min_free_disk_mb = 512
+        self.max_inflight = 8
+        self.max_pipeline_backlog = 50
+        self.probe = probe or gemini_model_probe
+        self.api_key = None
+        self.model = None
+        self.folders = ()
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._failures = 0
+        self._result: Optional[Dict[str, Any]] = None
+
+    def init_app(self, app):
+        """Read probe settings from the app config and track in-flight requests"""
+        cfg = app.config
+        self.enabled = cfg.get('HEALTH_PROBE_ENABLED', True)
+        self.interval = cfg.get('HEALTH_PROBE_INTERVAL_SECONDS', self.interval)
+        self.timeout = cfg.get('HEALTH_PROBE_TIMEOUT_SECONDS', self.timeout)
+        self.failure_threshold = cfg.get('HEALTH_PROBE_FAILURES', self.failure_threshold)
+        self.slow_upstream_ms = cfg.get('HEALTH_SLOW_UPSTREAM_MS', self.slow_upstream_ms)
+        self.min_free_disk_mb = cfg.get('HEALTH_MIN_FREE_DISK_MB', self.min_free_disk_mb)
+        self.max_inflight = cfg.get('HEALTH_MAX_INFLIGHT', self.max_inflight)
+        self.max_pipeline_backlog = cfg.get('HEALTH_MAX_PIPELINE_BACKLOG', self.max_pipeline_backlog)
+        self.api_key = cfg.get('GEMINI_API_KEY')
+        self.model = cfg.get('LLM_MODEL')
+        self.folders = (cfg.get('UPLOAD_FOLDER', 'uploads'), cfg.get('OUTPUT_FOLDER', 'output'))
+
+        app.before_request(self._request_started)
+        app.teardown_request(self._request_finished)
+
+    def _request_started(self):
+        with self._lock:
+            self._inflight += 1
+        g.health_inflight = True
+
+    def _request_finished(self, exc=None):
+        # Teardown also runs when an earlier before_request handler answered
+        if g.pop('health_inflight', False):
+            with self._lock:
+                self._inflight -= 1
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='health-prober', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit"""
+        self._stop.set()
+
+    def _run(self):
+        # Probe right away so the cached result is fresh before the first LB check
+        while True:
+            try:
+                self.probe_once()
+            except Exception as e:
+                logger.error(f"Health probe failed: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+    def _check_upstream(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            self.probe(self.api_key, self.model, self.timeout)
+        except Exception as e:
+            self._failures += 1
+            return {
+                'ok': self._failures < self.failure_threshold,
+                'reachable': False,
+                'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+                'consecutive_failures': self._failures,
+                'error': type(e).__name__,
+            }
+
+        self._failures = 0
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        return {
+            'ok': True,
+            'reachable': True,
+            'slow': latency_ms > self.slow_upstream_ms,
+            'latency_ms': latency_ms,
+            'consecutive_failures': 0,
+        }
+
+    def _check_disk(self) -> Dict[str, Any]:
+        free_mb = None
+        for folder in self.folders:
+            if not os.path.isdir(folder):
+                return {'ok': False, 'error': f"{folder} missing"}
+            usage = shutil.disk_usage(folder)
+            folder_free = usage.free // (1024 * 1024)
+            free_mb = folder_free if free_mb is None else min(free_mb, folder_free)
+        return {'ok': free_mb is None or free_mb >= self.min_free_disk_mb, 'free_mb': free_mb}
+
+    def probe_once(self) -> Dict[str, Any]:
+        """
+        Run every check once and cache the result
+
+        Returns:
+            The cached result
+        """
+        result = {
+            'checked_at': time.time(),
+            'upstream': self._check_upstream(),
+            'disk': self._check_disk(),
+            'pipeline_backlog': image_pipeline.summary()['pending'],
+        }
+        self._result = result
+        return result
+
+    def status(self) -> Tuple[str, Dict[str, Any]]:
+        """
+        Current readiness from the cached probe and the live load gauges
+
+        Returns:
+            Tuple of (status, details); status is ``ready``, ``degraded``
+            (overloaded or slow upstream, shed traffic) or ``not ready``
+        """
+        result = self._result
+        inflight = self._inflight
+        details = {'inflight': inflight, 'max_inflight': self.max_inflight}
+
+        if result is None:
+            # Prober not running (or first probe still in flight): fall back
+            # to the static configuration checks
+            details['probe'] = 'pending'
+            if not self.api_key:
+                return NOT_READY, dict(details, error='API key missing')
+            if not all(os.path.isdir(folder) for folder in self.folders):
+                return NOT_READY, dict(details, error='Upload folder missing')
+            return READY, details
+
+        details.update(result)
+        details['age_seconds'] = round(time.time() - result['checked_at'], 1)
+
+        if not result['upstream']['ok']:
+            return NOT_READY, dict(details, error='Upstream unreachable')
+        if not result['disk']['ok']:
+            return NOT_READY, dict(details, error='Low disk space')
+
+        reasons = []
+        if self.max_inflight and inflight > self.max_inflight:
+            reasons.append('inflight')
+        if self.max_pipeline_backlog and result['pipeline_backlog'] >= self.max_pipeline_backlog:
+            reasons.append('pipeline_backlog')
+        if result['upstream'].get('slow'):
+            reasons.append('upstream_latency')
+        if reasons:
+            return DEGRADED, dict(details, reasons=reasons)
+        return READY, details
+
+
+health_prober = HealthProber()
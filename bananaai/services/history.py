@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import queue
+import base64
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import HISTORY_RECORDS
+
+logger = logging.getLogger(__name__)
+
+# Most rows written in one transaction
+WRITE_BATCH = 500
+
+MAX_PAGE_SIZE = 100
+
+COLUMNS = ('created', 'filename', 'prompt', 'aspect_ratio', 'negative_prompt', 'guidance_scale',
+           'num_inference_steps', 'variant', 'seed', 'width', 'height', 'model', 'placeholder',
+           'generation_ms', 'reference_images', 'request_id')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    filename TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    aspect_ratio TEXT NOT NULL,
+    negative_prompt TEXT,
+    guidance_scale REAL,
+    num_inference_steps INTEGER,
+    variant INTEGER NOT NULL DEFAULT 0,
+    seed INTEGER,
+    width INTEGER,
+    height INTEGER,
+    model TEXT,
+    placeholder INTEGER NOT NULL DEFAULT 0,
+    generation_ms INTEGER,
+    reference_images TEXT,
+    request_id TEXT
+);
+CREATE INDEX IF NOT EXISTS generations_created ON generations (created);
+CREATE INDEX IF NOT EXISTS generations_aspect ON generations (aspect_ratio);
+CREATE INDEX IF NOT EXISTS generations_filename ON generations (filename);
+CREATE TRIGGER IF NOT EXISTS generations_fts_insert AFTER INSERT ON generations BEGIN
+    INSERT INTO generations_fts (rowid, prompt) VALUES (new.id, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_fts_delete AFTER DELETE ON generations BEGIN
+    INSERT INTO generations_fts (generations_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+END;
+"""
+
+# Trigram tokens match any substring of 3+ characters, which also works for
+# Thai prompts that have no spaces between words; SQLite before 3.34 lacks it
+FTS_SCHEMA = ("CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5("
+              "prompt, content='generations', content_rowid='id', tokenize='{}')")
+
+
+def _like_escape(text: str) -> str:
+    """Escape LIKE wildcards (the queries use ESCAPE '\\')"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def encode_cursor(row_id: int) -> str:
+    return base64.urlsafe_b64encode(f'g{row_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Raises:
+        ValueError: If the cursor was not made by ``encode_cursor``
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        if not raw.startswith('g'):
+            raise ValueError(raw)
+        return int(raw[1:])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class HistoryStore:
+    """Indexed metadata of every generated image
+
+    Rows go to an SQLite database in WAL mode, so every worker on the host
+    writes to and reads from the same history. Request threads only put
+    rows on a queue; a writer thread inserts them in batches.
+
+    ``created`` never decreases with ``id`` (a row recorded out of order
+    takes the newest time), so every query walks the rowid newest first
+    and stops after one page: time ranges become an id range with one
+    index lookup per bound, aspect ratios use an index that is ordered by
+    rowid, and prompt text is searched in an FTS5 index, which also yields
+    rowids in order. The cursor is the last id of a page, so any page
+    costs the same as the first.
+    """
+
+    def __init__(self, max_queue: int = 10000):
+        self.enabled = False
+        self.path = None
+        self.max_queue = max_queue
+        self.trigram = True
+        self._local = threading.local()
+        self._queue: Optional[queue.Queue] = None
+        self._writer = None
+        self._writer_pid = None
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+    def init_app(self, app):
+        """Open (and create) the database from the app config"""
+        cfg = app.config
+        self.enabled = cfg.get('HISTORY_ENABLED', True)
+        self.path = cfg.get('HISTORY_DB', 'data/history.db')
+        self.max_queue = cfg.get('HISTORY_QUEUE_SIZE', self.max_queue)
+        self._local = threading.local()
+        self._queue = None
+        self._writer = None
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._create_schema(self._db())
+
+    def _create_schema(self, db: sqlite3.Connection):
+        try:
+            db.execute(FTS_SCHEMA.format('trigram'))
+        except sqlite3.OperationalError:
+            db.execute(FTS_SCHEMA.format('unicode61'))
+        self.trigram = 'trigram' in db.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'generations_fts'").fetchone()[0]
+        db.executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """This thread's connection; reopened after a fork"""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def record(self, **fields):
+        """
+        Queue one generated image for the history
+
+        Takes the ``COLUMNS`` as keyword arguments; ``created`` defaults to
+        now. Never blocks: when the writer is behind by ``max_queue`` rows
+        the row is dropped and counted.
+        """
+        if not self.enabled:
+            return
+        fields.setdefault('created', time.time())
+        fields.setdefault('variant', 0)
+        fields['placeholder'] = int(bool(fields.get('placeholder')))
+        if isinstance(fields.get('reference_images'), list):
+            fields['reference_images'] = json.dumps(fields['reference_images'])
+        row = tuple(fields.get(column) for column in COLUMNS)
+        try:
+            self._get_queue().put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            HISTORY_RECORDS.inc(outcome='dropped')
+            logger.warning("History writer is behind; dropped record for %s", fields.get('filename'))
+
+    def _get_queue(self) -> queue.Queue:
+        """Start the writer thread on first use (after any fork)"""
+        with self._lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._writer = threading.Thread(target=self._run, args=(self._queue,),
+                                                name='history-writer', daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+            return self._queue
+
+    def _run(self, rows: queue.Queue):
+        while True:
+            batch = [rows.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(rows.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(batch)
+                HISTORY_RECORDS.inc(len(batch), outcome='written')
+            except Exception as e:
+                HISTORY_RECORDS.inc(len(batch), outcome='failed')
+                logger.error("Failed to write %d history records: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    rows.task_done()
+
+    def write(self, rows: List[tuple]):
+        """Insert rows (tuples in ``COLUMNS`` order) in one transaction"""
+        db = self._db()
+        placeholders = ', '.join('?' * len(COLUMNS))
+        # Workers write in turn; each row is at least as new as the last one
+        placeholders = placeholders.replace(
+            '?', "MAX(?, COALESCE((SELECT MAX(created) FROM generations), 0))", 1)
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany(f"INSERT INTO generations ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                           rows)
+
+    def forget(self, filenames: List[str]) -> int:
+        """
+        Delete the generations of output files that no longer exist
+
+        Called by the janitor, so ``/api/history`` never lists dead image
+        URLs and the table stays as large as the output folder.
+
+        Returns:
+            Number of deleted rows
+        """
+        if not self.enabled or not filenames:
+            return 0
+        db = self._db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            return sum(db.execute('DELETE FROM generations WHERE filename = ?', (filename,)).rowcount
+                       for filename in filenames)
+
+    def flush(self):
+        """Wait until every queued record is written"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def query(self, limit: int = 20, cursor: str = None, text: str = None,
+              aspect_ratio: str = None, since: float = None, until: float = None) -> Dict[str, Any]:
+        """
+        List generations newest first
+
+        Args:
+            limit: Page size, at most ``MAX_PAGE_SIZE``
+            cursor: ``next_cursor`` of the previous page
+            text: Words that must all appear in the prompt
+            aspect_ratio: Only this aspect ratio
+            since: Only generations at or after this Unix time
+            until: Only generations before this Unix time
+
+        Returns:
+            Dict with ``items`` and ``next_cursor`` (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        db = self._db()
+        where, params = [], []
+        if cursor:
+            where.append('g.id < ?')
+            params.append(decode_cursor(cursor))
+        if since is not None:
+            first = self._first_id(db, since)
+            if first is None:
+                return {'items': [], 'next_cursor': None}
+            where.append('g.id >= ?')
+            params.append(first)
+        if until is not None:
+            end = self._first_id(db, until)
+            if end is not None:
+                where.append('g.id < ?')
+                params.append(end)
+        if aspect_ratio:
+            where.append('g.aspect_ratio = ?')
+            params.append(aspect_ratio)
+
+        match, likes = self._text_filter(text) if text else (None, [])
+        for like in likes:
+            where.append("g.prompt LIKE ? ESCAPE '\\'")
+            params.append(like)
+        if match:
+            # Drive the query from the full-text index in rowid order
+            sql = ('SELECT g.* FROM generations_fts JOIN generations g ON g.id = generations_fts.rowid '
+                   'WHERE generations_fts MATCH ?')
+            params.insert(0, match)
+            where = [w.replace('g.id', 'generations_fts.rowid') for w in where]
+            order = 'generations_fts.rowid'
+        else:
+            sql = 'SELECT g.* FROM generations g WHERE 1'
+            order = 'g.id'
+        for clause in where:
+            sql += ' AND ' + clause
+        sql += f' ORDER BY {order} DESC LIMIT ?'
+        rows = db.execute(sql, params + [limit + 1]).fetchall()
+
+        items = [self._item(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1]['id']) if len(rows) > limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _first_id(db: sqlite3.Connection, at: float) -> Optional[int]:
+        """Id of the first generation at or after ``at``, None if there is none"""
+        row = db.execute('SELECT id FROM generations WHERE created >= ? ORDER BY created, id LIMIT 1',
+                         (at,)).fetchone()
+        return row['id'] if row else None
+
+    def _text_filter(self, text: str) -> Tuple[Optional[str], List[str]]:
+        """
+        Split a search into an FTS5 query and LIKE patterns
+
+        With the trigram tokenizer, words shorter than 3 characters cannot
+        use the index and are matched with LIKE on the rows it selects.
+        """
+        words = text.split()
+        indexed = [w for w in words if len(w) >= 3 or not self.trigram]
+        short = [w for w in words if w not in indexed]
+        match = ' '.join('"{}"'.format(w.replace('"', '""')) for w in indexed) or None
+        return match, [f'%{_like_escape(w)}%' for w in short]
+
+    @staticmethod
+    def _item(row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        item['placeholder'] = bool(item['placeholder'])
+        item['reference_images'] = json.loads(item['reference_images'] or '[]')
+        item['url'] = f"/output/{item['filename']}"
+        return item
+
+    def summary(self) -> Dict[str, Any]:
+        """Row count and writer backlog of this process"""
+        if not self.enabled:
+            return {'enabled': False}
+        # MAX(id) reads one index entry; COUNT(*) would scan millions of rows
+        rows = self._db().execute('SELECT MAX(id) FROM generations').fetchone()[0] or 0
+        with self._lock:
+            return {
+                'enabled': True,
+                'rows': rows,
+                'queued': self._queue.qsize() if self._queue else 0,
+                'dropped': self._dropped,
+                'search': 'trigram' if self.trigram else 'unicode61',
+            }
+
+
+history = HistoryStore()
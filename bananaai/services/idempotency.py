@@ -0,0 +1,210 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# begin() outcomes
+RUN = 'run'
+REPLAY = 'replay'
+CONFLICT = 'conflict'
+IN_PROGRESS = 'in_progress'
+
+PENDING, DONE = 0, 1
+
+# How often a duplicate re-reads a record owned by another worker
+POLL_SECONDS = 0.25
+
+# Expired records are deleted every this many writes
+PURGE_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL,
+    state INTEGER NOT NULL,
+    status INTEGER,
+    body BLOB,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idempotency_expires ON idempotency (expires);
+CREATE TABLE IF NOT EXISTS idempotency_counts (
+    state INTEGER PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO idempotency_counts SELECT state, COUNT(*) FROM idempotency GROUP BY state;
+INSERT OR IGNORE INTO idempotency_counts VALUES (0, 0), (1, 0);
+CREATE TRIGGER IF NOT EXISTS idempotency_count_insert AFTER INSERT ON idempotency BEGIN
+    UPDATE idempotency_counts SET count = count + 1 WHERE state = new.state;
+END;
+CREATE TRIGGER IF NOT EXISTS idempotency_count_delete AFTER DELETE ON idempotency BEGIN
+    UPDATE idempotency_counts SET count = count - 1 WHERE state = old.state;
+END;
+CREATE TRIGGER IF NOT EXISTS idempotency_count_state AFTER UPDATE OF state ON idempotency BEGIN
+    UPDATE idempotency_counts SET count = count - 1 WHERE state = old.state;
+    UPDATE idempotency_counts SET count = count + 1 WHERE state = new.state;
+END;
+"""
+
+
+class IdempotencyStore:
+    """Responses of requests sent with an ``Idempotency-Key``, shared by all workers
+
+    Records live in a SQLite database in WAL mode, so every worker process
+    on the host sees the same keys. The first request with a key inserts a
+    pending record and runs; a duplicate waits for that record to be
+    completed (woken directly when the owner is in the same process,
+    otherwise by polling) and replays its stored response. Successful
+    responses are kept zlib-compressed for ``ttl`` seconds, and the table
+    is capped at ``max_entries``. A failed request releases its key so a
+    retry runs again, and a pending record whose owner died is taken over
+    once its lease runs out. Triggers keep a count of records per state, so
+    ``summary`` reads two rows instead of the table.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.ttl = 86400
+        self.lease = 300
+        self.max_entries = 10000
+        self._local = threading.local()
+        self._events: Dict[str, threading.Event] = {}
+        self._events_lock = threading.Lock()
+        self._writes = 0
+
+    def init_app(self, app):
+        """Open (and create) the database from the app config"""
+        cfg = app.config
+        self.enabled = cfg.get('IDEMPOTENCY_ENABLED', True)
+        self.path = cfg.get('IDEMPOTENCY_DB')
+        self.ttl = cfg.get('IDEMPOTENCY_TTL_SECONDS', 86400)
+        self.lease = cfg.get('IDEMPOTENCY_LEASE_SECONDS', 300)
+        self.max_entries = cfg.get('IDEMPOTENCY_MAX_ENTRIES', 10000)
+        self._local = threading.local()
+        if self.enabled:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db().executescript(SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """This thread's connection; reopened after a fork"""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def begin(self, key: str, fingerprint: bytes, wait: float) -> Tuple[str, Optional[Tuple[int, bytes]]]:
+        """
+        Claim ``key`` or wait for the request that holds it
+
+        Args:
+            key: The client's idempotency key
+            fingerprint: Hash of the request body; a key reused for a
+                different body is a conflict
+            wait: Most seconds to wait for an in-flight duplicate
+
+        Returns:
+            Tuple of (outcome, (status, body) for ``REPLAY`` else None)
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            now = time.time()
+            db = self._db()
+            inserted = db.execute(
+                'INSERT OR IGNORE INTO idempotency (key, fingerprint, state, expires) '
+                'VALUES (?, ?, ?, ?)', (key, fingerprint, PENDING, now + self.lease)
+            ).rowcount
+            if inserted:
+                self._claimed(key)
+                return RUN, None
+
+            row = db.execute('SELECT fingerprint, state, status, body, expires FROM idempotency '
+                             'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                continue  # released or purged in between; try to claim again
+            stored_fingerprint, state, status, body, expires = row
+            if stored_fingerprint != fingerprint:
+                return CONFLICT, None
+            if state == DONE:
+                if expires > now:
+                    return REPLAY, (status, zlib.decompress(body))
+                db.execute('DELETE FROM idempotency WHERE key = ? AND expires = ?', (key, expires))
+                continue
+            if expires <= now:
+                # The owner died or hung past its lease: take the key over
+                taken = db.execute('UPDATE idempotency SET expires = ? WHERE key = ? '
+                                   'AND state = ? AND expires = ?',
+                                   (now + self.lease, key, PENDING, expires)).rowcount
+                if taken:
+                    logger.warning("Taking over idempotency key %s after its lease expired", key)
+                    self._claimed(key)
+                    return RUN, None
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return IN_PROGRESS, None
+            with self._events_lock:
+                event = self._events.get(key)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(POLL_SECONDS, remaining))
+
+    def complete(self, key: str, status: int, body: bytes):
+        """Store the response of the request that claimed ``key``"""
+        self._db().execute(
+            'UPDATE idempotency SET state = ?, status = ?, body = ?, expires = ? WHERE key = ?',
+            (DONE, status, zlib.compress(body), time.time() + self.ttl, key)
+        )
+        self._wake(key)
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.purge()
+
+    def release(self, key: str):
+        """Forget a claimed key without a response, so a retry runs again"""
+        self._db().execute('DELETE FROM idempotency WHERE key = ? AND state = ?', (key, PENDING))
+        self._wake(key)
+
+    def purge(self) -> int:
+        """Delete expired records and the oldest beyond ``max_entries``"""
+        db = self._db()
+        removed = db.execute('DELETE FROM idempotency WHERE state = ? AND expires <= ?',
+                             (DONE, time.time())).rowcount
+        removed += db.execute(
+            'DELETE FROM idempotency WHERE key IN (SELECT key FROM idempotency WHERE state = ? '
+            'ORDER BY expires DESC LIMIT -1 OFFSET ?)', (DONE, self.max_entries)
+        ).rowcount
+        return removed
+
+    def _claimed(self, key: str):
+        with self._events_lock:
+            self._events[key] = threading.Event()
+
+    def _wake(self, key: str):
+        with self._events_lock:
+            event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def summary(self) -> dict:
+        """Record counts of the shared store, from the counters the triggers keep"""
+        if not self.enabled:
+            return {'enabled': False}
+        counts = dict(self._db().execute('SELECT state, count FROM idempotency_counts'))
+        return {'enabled': True, 'pending': counts.get(PENDING, 0), 'stored': counts.get(DONE, 0),
+                'max_entries': self.max_entries}
+
+
+idempotency = IdempotencyStore()
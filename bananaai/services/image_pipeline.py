@@ -0,0 +1,243 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any
+
+from .file_index import file_index
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+def preview_filename(filename: str) -> str:
+    """
+    Build the preview filename for a generated image
+
+    Args:
+        filename: Generated image filename
+
+    Returns:
+        Filename of the low-quality JPEG preview
+    """
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}_preview.jpg"
+
+
+class ImagePipeline:
+    """Background post-processing for generated images
+
+    The request thread only writes the raw upstream bytes. The small
+    preview, the full re-encode and its atomic swap run in a small worker
+    pool, so clients fall back to the full image until the preview exists.
+    """
+
+    def __init__(self, max_workers: int = 2, max_stats: int = 1000):
+        self.enabled = True
+        self.max_workers = max_workers
+        self.max_stats = max_stats
+        self.preview_max_edge = 512
+        self.preview_quality = 60
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = OrderedDict()
+        self._pending = 0
+        self._totals = {
+            'processed': 0,
+            'failed': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'encode_seconds': 0.0,
+        }
+
+    def init_app(self, app):
+        """Read pipeline settings from the app config"""
+        cfg = app.config
+        self.enabled = cfg.get('IMAGE_OPTIMIZE', True)
+        self.max_workers = cfg.get('IMAGE_PIPELINE_WORKERS', self.max_workers)
+        self.preview_max_edge = cfg.get('PREVIEW_MAX_EDGE', self.preview_max_edge)
+        self.preview_quality = cfg.get('PREVIEW_QUALITY', self.preview_quality)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the worker pool on first use (after any fork)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix='image-pipeline'
+                )
+            return self._executor
+
+    def submit(self, filepath: str) -> Optional[str]:
+        """
+        Queue the preview and optimization of a saved image
+
+        Returns at once: the image is not decoded on the calling thread.
+
+        Args:
+            filepath: Path of the raw image already written to disk
+
+        Returns:
+            Filename the preview will have once written, or None if the
+            pipeline is disabled
+        """
+        if not self.enabled:
+            return None
+
+        filename = os.path.basename(filepath)
+        record = {'filename': filename, 'status': 'queued'}
+        with self._lock:
+            self._pending += 1
+            self._stats[filename] = record
+        self._get_executor().submit(self._process, filepath, dict(record))
+        return preview_filename(filename)
+
+    def _process(self, filepath: str, record: Dict[str, Any]):
+        """Worker entry point: the preview first, then the full re-encode"""
+        filename = os.path.basename(filepath)
+        record['status'] = 'processing'
+        try:
+            start = time.perf_counter()
+            self._write_preview(filepath)
+            record['preview_time'] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            logger.warning(f"Could not write preview for {filename}: {e}")
+        try:
+            start = time.perf_counter()
+            before, after = self._optimize(filepath)
+            encode_time = time.perf_counter() - start
+
+            record.update({
+                'status': 'optimized' if after < before else 'kept_original',
+                'encode_time': round(encode_time, 4),
+                'bytes_before': before,
+                'bytes_after': after,
+                'bytes_saved': before - after,
+                'saved_ratio': round((before - after) / before, 4) if before else 0.0,
+            })
+            with self._lock:
+                self._totals['processed'] += 1
+                self._totals['bytes_before'] += before
+                self._totals['bytes_after'] += after
+                self._totals['encode_seconds'] += encode_time
+
+            logger.info("Optimized %s: %d -> %d bytes in %.3fs",
+                        filename, before, after, encode_time)
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+            with self._lock:
+                self._totals['failed'] += 1
+            logger.error(f"Image pipeline failed for {filename}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats[filename] = record
+                while len(self._stats) > self.max_stats:
+                    self._stats.popitem(last=False)
+
+    def _write_preview(self, filepath: str) -> str:
+        """
+        Write a small low-quality JPEG next to the original
+
+        Returns:
+            Filename of the preview
+        """
+        from PIL import Image
+
+        folder = os.path.dirname(filepath)
+        target = os.path.join(folder, preview_filename(os.path.basename(filepath)))
+
+        with Image.open(filepath) as img:
+            # draft() lets the JPEG decoder skip most of the work for big inputs
+            img.draft('RGB', (self.preview_max_edge, self.preview_max_edge))
+            img = img.convert('RGB')
+            img.thumbnail((self.preview_max_edge, self.preview_max_edge), Image.BILINEAR)
+            tmp_path = self._encode_to_temp(img, folder, 'JPEG', quality=self.preview_quality)
+        os.replace(tmp_path, target)
+        file_index.record_write(folder, os.path.basename(target))
+        storage.publish(folder, os.path.basename(target))
+        return os.path.basename(target)
+
+    def _optimize(self, filepath: str):
+        """
+        Re-encode the image and swap it in only when it got smaller
+
+        Returns:
+            Tuple of (bytes_before, bytes_after)
+        """
+        from PIL import Image
+
+        before = os.path.getsize(filepath)
+        with Image.open(filepath) as img:
+            fmt = img.format or 'PNG'
+            img.load()
+            if fmt == 'JPEG':
+                options = {'quality': 'keep', 'optimize': True, 'progressive': True}
+            elif fmt == 'PNG':
+                options = {'optimize': True}
+            else:
+                # Nothing useful to do for other formats
+                return before, before
+
+            tmp_path = self._encode_to_temp(img, os.path.dirname(filepath), fmt, **options)
+
+        after = os.path.getsize(tmp_path)
+        if after < before:
+            os.replace(tmp_path, filepath)
+            file_index.record_write(os.path.dirname(filepath), os.path.basename(filepath), after)
+            storage.publish(os.path.dirname(filepath), os.path.basename(filepath))
+            return before, after
+
+        os.unlink(tmp_path)
+        return before, before
+
+    @staticmethod
+    def _encode_to_temp(img, folder: str, format: str, **options) -> str:
+        """
+        Encode an image into a fsynced temp file inside ``folder``
+
+        Keeping the temp file in the destination folder makes the final
+        ``os.replace`` an atomic rename on the same filesystem.
+
+        Returns:
+            Path of the temp file
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=folder or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format=format, **options)
+                f.flush()
+                os.fsync(f.fileno())
+            return tmp_path
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get_stats(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Get the post-processing record for a single file"""
+        with self._lock:
+            record = self._stats.get(filename)
+            return dict(record) if record else None
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate pipeline statistics"""
+        with self._lock:
+            totals = dict(self._totals)
+            pending = self._pending
+
+        processed = totals['processed']
+        return {
+            'enabled': self.enabled,
+            'pending': pending,
+            'processed': processed,
+            'failed': totals['failed'],
+            'bytes_saved': totals['bytes_before'] - totals['bytes_after'],
+            'avg_encode_time': round(totals['encode_seconds'] / processed, 4) if processed else None,
+        }
+
+
+image_pipeline = ImagePipeline()
@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict
+
+from .file_index import file_index
+from .history import history
+from .storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class StorageJanitor:
+    """Background cleanup of the upload and output folders
+
+    Runs every ``interval`` seconds and, for each folder, deletes files older
+    than ``max_age_hours`` and then evicts least recently used files until
+    the folder is back under its size quota. Candidates come from the file
+    index shared by all workers, so files any worker wrote or served
+    recently count, and deletions are throttled to ``deletes_per_second``
+    to avoid I/O spikes. Deleted output files are also dropped from the
+    generation history.
+
+    Every gunicorn worker starts the thread, but only the one holding an
+    exclusive ``flock`` on ``lock_path`` sweeps; the others keep trying, so
+    another worker takes over when the holder exits.
+    """
+
+    def __init__(self, interval: int = 300, max_age_hours: int = 24,
+                 deletes_per_second: float = 20):
+        self.enabled = True
+        self.interval = interval
+        self.max_age_hours = max_age_hours
+        self.deletes_per_second = deletes_per_second
+        self.quotas: Dict[str, int] = {}
+        self.output_folder = None
+        self.lock_path = os.path.join(tempfile.gettempdir(), 'bananaai-janitor.lock')
+        self._lock_file = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_delete = 0.0
+        self.last_run = None
+
+    def init_app(self, app):
+        """Configure folders and quotas from the app config"""
+        cfg = app.config
+        self.enabled = cfg.get('JANITOR_ENABLED', True)
+        self.interval = cfg.get('JANITOR_INTERVAL_SECONDS', self.interval)
+        self.max_age_hours = cfg.get('FILE_CLEANUP_HOURS', self.max_age_hours)
+        self.deletes_per_second = cfg.get('JANITOR_DELETES_PER_SECOND', self.deletes_per_second)
+        self.lock_path = cfg.get('JANITOR_LOCK_FILE', self.lock_path)
+
+        self.output_folder = cfg.get('OUTPUT_FOLDER', 'output')
+
+        # Quota of 0 means "age limit only"
+        self.quotas = {
+            cfg.get('UPLOAD_FOLDER', 'uploads'): cfg.get('UPLOAD_QUOTA_MB', 0) * 1024 * 1024,
+            cfg.get('OUTPUT_FOLDER', 'output'): cfg.get('OUTPUT_QUOTA_MB', 0) * 1024 * 1024,
+        }
+        for folder in self.quotas:
+            file_index.track(folder)
+
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='storage-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.acquire_lock():
+                    self.run_once()
+            except Exception as e:
+                logger.error(f"Storage janitor run failed: {e}")
+
+    def acquire_lock(self) -> bool:
+        """
+        Try to become the one process that sweeps the folders
+
+        The lock is held until this process exits, so the janitor rate limit
+        applies once per host instead of once per worker.
+
+        Returns:
+            True if this process holds the lock
+        """
+        if self._lock_file is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            # No flock (Windows): the development server is a single process
+            return True
+
+        lock_file = open(self.lock_path, 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info(f"Storage janitor running in process {os.getpid()}")
+        return True
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Enforce age limits and quotas once
+
+        Returns:
+            Number of deleted files per folder
+        """
+        cutoff = time.time() - self.max_age_hours * 3600
+        deleted = {}
+
+        for folder, quota in self.quotas.items():
+            count = 0
+            gone = []
+            for filename in file_index.expired(folder, cutoff):
+                if self._stop.is_set():
+                    break
+                if self._delete(folder, filename, storage.delete):
+                    count += 1
+                    gone.append(filename)
+
+            # Quotas bound the local folder; with a remote backend this only
+            # evicts the local copy and the file can still be served
+            if quota:
+                for filename in file_index.over_quota(folder, quota):
+                    if self._stop.is_set():
+                        break
+                    if self._delete(folder, filename, storage.evict_local):
+                        count += 1
+                        if storage.is_local:
+                            gone.append(filename)
+
+            deleted[folder] = count
+            if count:
+                logger.info(f"Storage janitor removed {count} files from {folder}")
+            if gone and folder == self.output_folder:
+                self._forget(gone)
+
+        self.last_run = time.time()
+        return deleted
+
+    @staticmethod
+    def _forget(filenames):
+        """Drop deleted images from the generation history"""
+        try:
+            history.forget(filenames)
+        except Exception as e:
+            logger.warning(f"Could not remove {len(filenames)} deleted images from the history: {e}")
+
+    def _throttle(self):
+        """Space out deletions to at most ``deletes_per_second``"""
+        if not self.deletes_per_second:
+            return
+        min_gap = 1.0 / self.deletes_per_second
+        wait = self._last_delete + min_gap - time.monotonic()
+        if wait > 0:
+            self._stop.wait(wait)
+        self._last_delete = time.monotonic()
+
+    def _delete(self, folder: str, filename: str, remove) -> int:
+        """Remove one file with ``remove`` (which also updates the index)"""
+        self._throttle()
+        try:
+            remove(folder, filename)
+        except Exception as e:
+            logger.warning(f"Could not delete {filename}: {e}")
+            return 0
+        return 1
+
+
+janitor = StorageJanitor()
@@ -1,7 +1,15 @@
 import time
+import asyncio
 import logging
-import google.generativeai as genai
 from typing import Optional
+from ..utils.lazy_import import LazyModule
+from .metrics import track_upstream, UPSTREAM_RETRIES
+from .reference_images import load_reference_images
+from .upstream_pool import routed, generative_model
+from ..middleware.tracing import span
+
+# The SDK pulls in gRPC and protobuf; load it on first use, not at app start
+genai = LazyModule('google.generativeai')
 
 
 logger = logging.getLogger(__name__)
@@ -10,117 +18,182 @@ logger = logging.getLogger(__name__)
 class LLMClient:
     """Enhanced LLM client with error handling and retry logic"""
 
-    def __init__(self, api_key: str, model: str = "gemini-2.0-flash"):
+    def __init__(self, api_key: str, model: str = "gemini-2.0-flash", upload_folder: str = 'uploads',
+                 pool=None):
+        """
+        Args:
+            pool: ``UpstreamPool`` to route each call through; without one
+                every call uses ``api_key`` and ``model``
+        """
         if not api_key:
             raise ValueError("GEMINI_API_KEY is missing")
         
         self.api_key = api_key
         self.model_name = model
+        self.upload_folder = upload_folder
+        self.pool = pool
         genai.configure(api_key=api_key)
-        self._model = None
 
-    def _get_model(self):
-        """Lazy loading of model"""
-        if self._model is None:
-            self._model = genai.GenerativeModel(self.model_name)
-        return self._model
+    def _prepare(self, system_prompt: str, user_prompt: str, temperature: float,
+                 max_tokens: int, images: list = None, lease=None, asynchronous: bool = False):
+        """Build the model, content parts and request options for one attempt"""
+        # Use system_instruction for better context
+        model = generative_model(
+            lease, self.model_name, asynchronous,
+            system_instruction=system_prompt
+        )
+        
+        # Prepare content - reference images first, then the prompt
+        content_parts = list(images or [])
+        
+        # Add the text prompt
+        content_parts.append(user_prompt)
+        
+        options = {
+            "generation_config": {
+                "temperature": temperature,
+                "max_output_tokens": max_tokens,
+                "top_p": 0.95,
+                "top_k": 40,
+            },
+            "safety_settings": [
+                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+            ]
+        }
+        return model, content_parts, options
+
+    def _extract_text(self, response, attempt: int, max_retries: int) -> Optional[str]:
+        """
+        Get the expanded text from a response
+
+        Returns:
+            The text, or None if the attempt should be retried with a
+            softened prompt after a safety block
+        """
+        # Check if response has candidates and parts
+        if response.candidates:
+            candidate = response.candidates[0]
+            if candidate.content and candidate.content.parts:
+                text = candidate.content.parts[0].text
+                if text:
+                    logger.info("Successfully expanded prompt (attempt %d)", attempt + 1)
+                    return text.strip()
+            
+            # Check finish reason
+            if hasattr(candidate, 'finish_reason'):
+                if candidate.finish_reason == 2:  # SAFETY
+                    logger.warning("Response blocked by safety filters")
+                    # Try with modified prompt
+                    if attempt < max_retries - 1:
+                        return None
+                    raise ValueError("Content was blocked by safety filters")
+                elif candidate.finish_reason == 3:  # MAX_TOKENS
+                    logger.warning("Response hit max token limit")
+                    # Still try to get partial response
+                    if candidate.content and candidate.content.parts:
+                        text = candidate.content.parts[0].text
+                        if text:
+                            return text.strip()
+        
+        raise ValueError("Empty or invalid response from API")
+
+    def _handle_error(self, e: Exception, attempt: int, max_retries: int) -> int:
+        """
+        Translate an upstream error into a final exception or a backoff
+
+        Returns:
+            Seconds to wait before the next attempt
+        """
+        if isinstance(e, genai.types.BlockedPromptException):
+            logger.error(f"Prompt was blocked by safety filters: {e}")
+            raise ValueError("Prompt contains inappropriate content")
+        
+        if isinstance(e, genai.types.StopCandidateException):
+            logger.error(f"Response generation stopped: {e}")
+            raise ValueError("Could not generate appropriate response")
+        
+        logger.warning("API call failed (attempt %d/%d): %s", attempt + 1, max_retries, e)
+        
+        if attempt == max_retries - 1:
+            logger.error("All retry attempts failed")
+            raise RuntimeError(f"Failed to expand prompt after {max_retries} attempts: {str(e)}")
+        
+        # Exponential backoff
+        return 2 ** attempt
 
     def expand(self, system_prompt: str, user_prompt: str, 
                temperature: float = 0.6, max_tokens: int = 512, 
-               max_retries: int = 3, reference_images: list = None) -> str:
+               max_retries: int = 3, reference_images: list = None,
+               images: list = None) -> str:
         """
         Expand prompt with retry logic and comprehensive error handling
+
+        ``images`` takes reference images already loaded by
+        ``load_reference_images`` instead of the ``reference_images`` filenames.
         """
+        if images is None:
+            images = load_reference_images(self.upload_folder, reference_images)
         for attempt in range(max_retries):
+            if attempt:
+                UPSTREAM_RETRIES.inc(client='llm', model=self.model_name)
             try:
-                # Use system_instruction for better context
-                model = genai.GenerativeModel(
-                    self.model_name, 
-                    system_instruction=system_prompt
-                )
-                
-                # Prepare content - include images if provided
-                content_parts = []
-                
-                # Add images if provided
-                if reference_images:
-                    import os
-                    from PIL import Image
-                    upload_folder = os.getenv('UPLOAD_FOLDER', 'uploads')
-                    
-                    for img_filename in reference_images:
-                        img_path = os.path.join(upload_folder, img_filename)
-                        if os.path.exists(img_path):
-                            try:
-                                img = Image.open(img_path)
-                                content_parts.append(img)
-                                logger.info(f"Added reference image: {img_filename}")
-                            except Exception as e:
-                                logger.warning(f"Failed to load image {img_filename}: {e}")
-                
-                # Add the text prompt
-                content_parts.append(user_prompt)
-                
-                response = model.generate_content(
-                    content_parts,
-                    generation_config={
-                        "temperature": temperature,
-                        "max_output_tokens": max_tokens,
-                        "top_p": 0.95,
-                        "top_k": 40,
-                    },
-                    safety_settings=[
-                        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-                    ]
-                )
+                with routed(self.pool, 'llm') as lease:
+                    model, content_parts, options = self._prepare(
+                        system_prompt, user_prompt, temperature, max_tokens, images=images,
+                        lease=lease
+                    )
+                    with span('upstream', client='llm', attempt=attempt + 1), \
+                            track_upstream('llm', lease.model if lease else self.model_name):
+                        response = model.generate_content(content_parts, **options)
                 
-                # Check if response has candidates and parts
-                if response.candidates:
-                    candidate = response.candidates[0]
-                    if candidate.content and candidate.content.parts:
-                        text = candidate.content.parts[0].text
-                        if text:
-                            logger.info(f"Successfully expanded prompt (attempt {attempt + 1})")
-                            return text.strip()
-                    
-                    # Check finish reason
-                    if hasattr(candidate, 'finish_reason'):
-                        if candidate.finish_reason == 2:  # SAFETY
-                            logger.warning("Response blocked by safety filters")
-                            # Try with modified prompt
-                            if attempt < max_retries - 1:
-                                user_prompt = f"Please help me with this creative writing task: {user_prompt}"
-                                continue
-                            raise ValueError("Content was blocked by safety filters")
-                        elif candidate.finish_reason == 3:  # MAX_TOKENS
-                            logger.warning("Response hit max token limit")
-                            # Still try to get partial response
-                            if candidate.content and candidate.content.parts:
-                                text = candidate.content.parts[0].text
-                                if text:
-                                    return text.strip()
-                
-                raise ValueError("Empty or invalid response from API")
+                text = self._extract_text(response, attempt, max_retries)
+                if text is None:
+                    user_prompt = f"Please help me with this creative writing task: {user_prompt}"
+                    continue
+                return text
 
-            except genai.types.BlockedPromptException as e:
-                logger.error(f"Prompt was blocked by safety filters: {e}")
-                raise ValueError("Prompt contains inappropriate content")
-            
-            except genai.types.StopCandidateException as e:
-                logger.error(f"Response generation stopped: {e}")
-                raise ValueError("Could not generate appropriate response")
-            
             except Exception as e:
-                logger.warning(f"API call failed (attempt {attempt + 1}/{max_retries}): {e}")
-                
-                if attempt == max_retries - 1:
-                    logger.error("All retry attempts failed")
-                    raise RuntimeError(f"Failed to expand prompt after {max_retries} attempts: {str(e)}")
+                time.sleep(self._handle_error(e, attempt, max_retries))
+        
+        raise RuntimeError("Unexpected error in retry loop")
+
+    async def expand_async(self, system_prompt: str, user_prompt: str, 
+                           temperature: float = 0.6, max_tokens: int = 512, 
+                           max_retries: int = 3, reference_images: list = None,
+                           images: list = None) -> str:
+        """
+        Async variant of ``expand`` using the SDK's async generation call
+
+        Retries and backoff yield to the event loop instead of blocking a thread.
+        """
+        if images is None:
+            # Reference images may be read from disk or object storage
+            images = await asyncio.to_thread(
+                load_reference_images, self.upload_folder, reference_images
+            )
+        for attempt in range(max_retries):
+            if attempt:
+                UPSTREAM_RETRIES.inc(client='llm', model=self.model_name)
+            try:
+                with routed(self.pool, 'llm') as lease:
+                    model, content_parts, options = self._prepare(
+                        system_prompt, user_prompt, temperature, max_tokens, images=images,
+                        lease=lease, asynchronous=True
+                    )
+                    with span('upstream', client='llm', attempt=attempt + 1), \
+                            track_upstream('llm', lease.model if lease else self.model_name):
+                        response = await model.generate_content_async(content_parts, **options)
                 
-                # Exponential backoff
-                time.sleep(2 ** attempt)
+                text = self._extract_text(response, attempt, max_retries)
+                if text is None:
+                    user_prompt = f"Please help me with this creative writing task: {user_prompt}"
+                    continue
+                return text
+
+            except Exception as e:
+                await asyncio.sleep(self._handle_error(e, attempt, max_retries))
         
-        raise RuntimeError("Unexpected error in retry loop")
\ No newline at end of file
+        raise RuntimeError("Unexpected error in retry loop")
@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import glob
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds; upstream image calls routinely take 10-60s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+ARCHIVE_FILE = 'archive.json'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help_text: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by labels"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self.name, self._key(labels), amount)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.registry._observe(self.name, self._key(labels), index, len(self.buckets) + 1, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+class MetricsRegistry:
+    """Process-local metrics with optional cross-process aggregation
+
+    Updates are a dict lookup under a lock. With ``METRICS_DIR`` set (gunicorn
+    sets it), each worker writes a snapshot of its values to
+    ``metrics-<pid>.json`` every ``METRICS_FLUSH_SECONDS`` and on exit, and a
+    scrape sums every snapshot in the directory. Snapshots left by workers
+    that have exited are folded into ``archive.json`` so counters never go
+    backwards when workers are recycled.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.directory: Optional[str] = None
+        self.flush_interval = 5
+        self._metrics: Dict[str, _Metric] = {}
+        self._values: Dict[str, Dict[Tuple[str, ...], object]] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        self._values[metric.name] = {}
+        return metric
+
+    def _add(self, name, key, amount):
+        if not self.enabled:
+            return
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + amount
+
+    def _observe(self, name, key, index, size, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            values = self._values[name]
+            # Per-bucket counts (not cumulative), then sum and count
+            state = values.get(key)
+            if state is None:
+                state = values[key] = [0] * size + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def init_app(self, app):
+        """Read settings from the app config and time every request"""
+        cfg = app.config
+        self.enabled = cfg.get('METRICS_ENABLED', True)
+        self.directory = cfg.get('METRICS_DIR') or None
+        self.flush_interval = cfg.get('METRICS_FLUSH_SECONDS', self.flush_interval)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        app.before_request(_start_timer)
+        app.after_request(_observe_request)
+
+    def start(self):
+        """Start the background flusher (only needed with ``METRICS_DIR``)"""
+        if not self.directory or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Metrics flush failed: {e}")
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Copy this process's values, keyed by JSON-encoded label values"""
+        with self._lock:
+            return {
+                name: {
+                    json.dumps(key): list(value) if isinstance(value, list) else value
+                    for key, value in values.items()
+                }
+                for name, values in self._values.items() if values
+            }
+
+    def flush(self):
+        """Write this process's snapshot to ``METRICS_DIR``"""
+        if not self.directory:
+            return
+        _write_json(os.path.join(self.directory, f"metrics-{os.getpid()}.json"), self.snapshot())
+
+    def collect(self) -> Dict[str, Dict[str, object]]:
+        """
+        Aggregate values across all worker processes
+
+        Returns:
+            Summed snapshot of every live worker, plus the archive of workers
+            that have exited
+        """
+        if not self.directory:
+            return self.snapshot()
+
+        import fcntl
+
+        self.flush()
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            # Serialise scrapes so a dead worker is only archived once
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = _read_json(archive_path) or {}
+            live, dead = [], []
+            for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+                data = _read_json(path)
+                if data is None:
+                    continue
+                (live if _pid_alive(_pid_of(path)) else dead).append((path, data))
+
+            if dead:
+                for _, data in dead:
+                    _merge(archive, data)
+                _write_json(archive_path, archive)
+                for path, _ in dead:
+                    os.unlink(path)
+
+        merged = {}
+        _merge(merged, archive)
+        for _, data in live:
+            _merge(merged, data)
+        return merged
+
+    def render(self) -> str:
+        """Render aggregated values in the Prometheus text format"""
+        values = self.collect()
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(values.get(name, {}).items()):
+                labels = dict(zip(metric.labelnames, json.loads(key)))
+                if metric.kind == 'counter':
+                    lines.append(f"{name}{_labels(labels)} {value}")
+                    continue
+
+                cumulative = 0
+                bounds = [str(b) for b in metric.buckets] + ['+Inf']
+                for bound, count in zip(bounds, value[:-2]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+                lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        f'{k}="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for k, v in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _merge(target: dict, source: dict):
+    """Sum ``source`` into ``target`` (counters add, histograms add per bucket)"""
+    for name, values in source.items():
+        merged = target.setdefault(name, {})
+        for key, value in values.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = current + value
+
+
+def _pid_of(path: str) -> int:
+    try:
+        return int(os.path.basename(path)[len('metrics-'):-len('.json')])
+    except ValueError:
+        return -1
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logger.warning(f"Ignoring unreadable metrics file {path}: {e}")
+        return None
+
+
+def _write_json(path: str, data: dict):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    'bananaai_http_request_duration_seconds', 'Request latency by route',
+    ('route', 'method', 'status'))
+UPSTREAM_REQUEST_SECONDS = metrics.histogram(
+    'bananaai_upstream_request_duration_seconds', 'Latency of single Gemini calls',
+    ('client', 'model', 'outcome'))
+UPSTREAM_RETRIES = metrics.counter(
+    'bananaai_upstream_retries_total', 'Gemini call retries', ('client', 'model'))
+UPSTREAM_ERRORS = metrics.counter(
+    'bananaai_upstream_errors_total', 'Failed Gemini calls by error class',
+    ('client', 'model', 'error'))
+CACHE_HITS = metrics.counter('bananaai_cache_hits_total', 'Cache hits', ('cache',))
+CACHE_MISSES = metrics.counter('bananaai_cache_misses_total', 'Cache misses', ('cache',))
+CACHE_EVICTIONS = metrics.counter(
+    'bananaai_cache_evictions_total', 'Cache entries dropped before use', ('cache', 'reason'))
+RATE_LIMIT_REJECTS = metrics.counter(
+    'bananaai_rate_limit_rejects_total', 'Requests rejected by the rate limiter', ('endpoint',))
+ADMISSION_SHED = metrics.counter(
+    'bananaai_admission_shed_total', 'Requests shed because they would miss their deadline',
+    ('endpoint', 'reason'))
+ADMISSION_QUEUE_SECONDS = metrics.histogram(
+    'bananaai_admission_queue_seconds', 'Time admitted requests waited for a slot', ('endpoint',))
+HISTORY_RECORDS = metrics.counter(
+    'bananaai_history_records_total', 'Generation history records by outcome', ('outcome',))
+IDEMPOTENCY_REQUESTS = metrics.counter(
+    'bananaai_idempotency_requests_total', 'Requests sent with an Idempotency-Key by outcome',
+    ('outcome',))
+UPLOADED_BYTES = metrics.counter('bananaai_uploaded_bytes_total', 'Bytes of uploaded images')
+GENERATED_BYTES = metrics.counter('bananaai_generated_bytes_total', 'Bytes of generated images')
+PLACEHOLDER_FALLBACKS = metrics.counter(
+    'bananaai_placeholder_fallbacks_total', 'Generations answered with a placeholder image',
+    ('model',))
+ASSIST_EXPANSIONS = metrics.counter(
+    'bananaai_assist_expansions_total', 'Prompt expansions answered by tier', ('tier', 'preset'))
+ASSIST_UPSTREAM_SECONDS_SAVED = metrics.counter(
+    'bananaai_assist_upstream_seconds_saved_total',
+    'Estimated Gemini time avoided by local prompt expansions')
+
+
+@contextmanager
+def track_upstream(client: str, model: str):
+    """Time one upstream call and count its error class if it raises"""
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception as e:
+        outcome = 'error'
+        UPSTREAM_ERRORS.inc(client=client, model=model, error=type(e).__name__)
+        raise
+    finally:
+        UPSTREAM_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                         client=client, model=model, outcome=outcome)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _observe_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        # Label by URL rule, not path, to keep the number of series bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route,
+                                     method=request.method, status=response.status_code)
+    return response
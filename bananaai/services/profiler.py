@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sort keys accepted by pstats.Stats.sort_stats
+SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> str:
+    """
+    Sample the stacks of every thread for ``seconds``
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+
+    Returns:
+        Collapsed stacks (``thread;outer;...;inner count`` per line), the
+        input format of flamegraph.pl, speedscope and similar tools
+    """
+    me = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+
+    return ''.join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class MemoryTracker:
+    """Numbered ``tracemalloc`` snapshots that can be diffed
+
+    Tracing is off until ``start`` is called and stops with ``stop``, so an
+    idle tracker costs nothing. Only the latest ``max_snapshots`` are kept.
+    """
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[int, tracemalloc.Snapshot]" = OrderedDict()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def snapshot(self, limit: int = 20) -> Dict:
+        """
+        Take a snapshot and summarise its largest allocation sites
+
+        Raises:
+            RuntimeError: If tracing has not been started
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = snap
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'id': snapshot_id,
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'top': [_stat(s) for s in snap.statistics('lineno')[:limit]],
+        }
+
+    def diff(self, old_id: int, new_id: int, limit: int = 20, key_type: str = 'lineno') -> List[Dict]:
+        """
+        Allocation sites that grew the most between two snapshots
+
+        Raises:
+            KeyError: If either snapshot is unknown or was discarded
+        """
+        with self._lock:
+            old, new = self._snapshots[old_id], self._snapshots[new_id]
+        return [_stat(s) for s in new.compare_to(old, key_type)[:limit]]
+
+
+def _stat(stat) -> Dict:
+    frame = stat.traceback[0]
+    entry = {'site': f"{frame.filename}:{frame.lineno}", 'size': stat.size, 'count': stat.count}
+    if hasattr(stat, 'size_diff'):
+        entry['size_diff'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+class RequestProfiler:
+    """cProfile a single flagged request and keep the result on disk
+
+    Only the request thread is profiled; in ``UPSTREAM_MODE=async`` time
+    spent on the upstream event loop shows up as waiting.
+    """
+
+    def __init__(self, directory: str, keep: int = 20):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        """Start profiling, or return None if another request holds the profiler"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is active
+            self._lock.release()
+            return None
+        return profile
+
+    def end(self, profile: cProfile.Profile, profile_id: str) -> str:
+        """Stop profiling and save the stats; returns the file path"""
+        try:
+            profile.disable()
+        finally:
+            self._lock.release()
+        path = self.path(profile_id)
+        profile.dump_stats(path)
+        self._prune()
+        logger.info("Saved request profile %s", path)
+        return path
+
+    def path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}.prof")
+
+    def report(self, profile_id: str, sort: str = 'cumulative', limit: int = 50) -> str:
+        """Render saved stats as text"""
+        from io import StringIO
+        out = StringIO()
+        stats = pstats.Stats(self.path(profile_id), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def _prune(self):
+        files = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory)
+             if name.endswith('.prof')),
+            key=os.path.getmtime,
+        )
+        for path in files[:-self.keep]:
+            os.unlink(path)
@@ -1,3 +1,6 @@
+import re
+from typing import Dict, Optional, Tuple
+
 from .aspect_ratio import AR_MAP
 
 SYSTEM_GUIDE = (
@@ -13,28 +16,200 @@ BASE_STYLE = (
     "respect human diversity; avoid unsafe or explicit content."
 )
 
+# Style presets for the local expansion tier. Keywords are matched
+# case-insensitively; English keywords on word boundaries, Thai keywords
+# anywhere (Thai is written without spaces).
+STYLE_PRESETS = {
+    'cinematic': {
+        'keywords': ('cinematic', 'film still', 'movie', 'blockbuster', 'ภาพยนตร์', 'หนัง'),
+        'lighting': 'motivated key light, soft rim light, gentle haze catching the light',
+        'color': 'teal and orange grade, deep blacks, filmic highlight roll-off',
+        'camera': 'anamorphic lens, shallow depth of field, subtle film grain',
+        'atmosphere': 'dramatic, story-driven mood',
+    },
+    'food': {
+        'keywords': ('food', 'dish', 'meal', 'dessert', 'drink', 'coffee', 'cake',
+                     'อาหาร', 'ขนม', 'เครื่องดื่ม', 'กาแฟ'),
+        'lighting': 'soft window light from the side, bright specular highlights on textures',
+        'color': 'appetizing warm tones, natural saturation, clean whites',
+        'camera': '100mm macro lens, 45-degree angle, creamy background bokeh',
+        'atmosphere': 'fresh, inviting editorial food styling',
+    },
+    'portrait': {
+        'keywords': ('portrait', 'headshot', 'selfie', 'close-up', 'ภาพบุคคล', 'พอร์ตเทรต', 'หน้าตรง'),
+        'lighting': 'large softbox key with fill, catchlights in the eyes',
+        'color': 'natural skin tones, soft contrast, gentle warmth',
+        'camera': '85mm lens at f/1.8, eye-level, background softly blurred',
+        'atmosphere': 'intimate, flattering and natural',
+    },
+    'product': {
+        'keywords': ('product', 'packshot', 'advert', 'commercial', 'e-commerce', 'สินค้า', 'โฆษณา'),
+        'lighting': 'clean three-point studio lighting, controlled reflections, soft gradient shadow',
+        'color': 'accurate neutral colors, crisp whites, brand-safe palette',
+        'camera': 'tack-sharp focus across the product, straight-on or three-quarter view',
+        'atmosphere': 'premium, minimal, catalog-ready',
+    },
+    'landscape': {
+        'keywords': ('landscape', 'mountain', 'beach', 'sea', 'forest', 'sunset', 'sunrise',
+                     'วิว', 'ทิวทัศน์', 'ภูเขา', 'ทะเล', 'ป่า', 'พระอาทิตย์'),
+        'lighting': 'golden hour sunlight, long soft shadows, glowing sky',
+        'color': 'rich natural greens and blues, warm highlights, graduated sky',
+        'camera': 'wide-angle lens, deep depth of field, strong foreground interest',
+        'atmosphere': 'vast, serene, awe-inspiring',
+    },
+    'anime': {
+        'keywords': ('anime', 'manga', 'cartoon', 'ghibli', 'อนิเมะ', 'การ์ตูน', 'มังงะ'),
+        'lighting': 'cel-shaded lighting with crisp shadow shapes and bloom',
+        'color': 'vibrant saturated palette, clean line art, painted backgrounds',
+        'camera': 'dynamic framing, expressive perspective',
+        'atmosphere': 'lively, whimsical storytelling mood',
+    },
+    'watercolor': {
+        'keywords': ('watercolor', 'watercolour', 'painting', 'painted', 'สีน้ำ', 'ภาพวาด'),
+        'lighting': 'soft diffused light with luminous paper white',
+        'color': 'translucent washes, soft bleeding edges, harmonious pastel palette',
+        'camera': 'flat artwork view, visible paper texture and brush strokes',
+        'atmosphere': 'gentle, airy, hand-crafted',
+    },
+    'neon': {
+        'keywords': ('neon', 'cyberpunk', 'synthwave', 'night city', 'นีออน', 'ไซเบอร์พังก์'),
+        'lighting': 'neon signage glow, colored rim lights, wet reflective surfaces',
+        'color': 'magenta and cyan palette, deep shadows, high contrast',
+        'camera': 'low angle, wide lens, light bloom and lens flare',
+        'atmosphere': 'futuristic, electric night-time energy',
+    },
+    'vintage': {
+        'keywords': ('vintage', 'retro', 'film', 'analog', 'polaroid', '35mm', 'วินเทจ', 'ย้อนยุค', 'ฟิล์ม'),
+        'lighting': 'natural available light, slightly soft and nostalgic',
+        'color': 'faded warm tones, lifted blacks, subtle color shifts',
+        'camera': '35mm film look, visible grain, gentle vignette',
+        'atmosphere': 'nostalgic, timeless',
+    },
+    'monochrome': {
+        'keywords': ('black and white', 'monochrome', 'b&w', 'noir', 'ขาวดำ'),
+        'lighting': 'hard directional light, sculpted shadows',
+        'color': 'black and white, full tonal range, deep blacks and bright highlights',
+        'camera': 'classic prime lens, strong graphic composition',
+        'atmosphere': 'moody, timeless, dramatic',
+    },
+}
+
+# Used when no preset matches; the same text expand_prompt always produced
+_DEFAULT_STYLE = {
+    'lighting': 'professional studio lighting, soft shadows, highlight details',
+    'color': 'cinematic color palette, balanced tones, rich contrast',
+    'camera': 'professional photography techniques, depth of field control',
+    'atmosphere': 'mood and tone matching the style requested',
+}
+
+
+def _compile_template(style: dict, ar_conf: dict) -> str:
+    """Build the expansion text for one style and aspect ratio; ``{subject}`` is filled per request"""
+    body = (
+        f"\nStyle Enhancement:\n"
+        f"- Lighting: {style['lighting']}\n"
+        f"- Color Grading: {style['color']}\n"
+        f"- Composition: {ar_conf['composition_hint']}, {ar_conf['aspect_ratio']} format\n"
+        f"- Technical Quality: ultra sharp focus, high detail, professional grade\n"
+        f"- Atmosphere: {style['atmosphere']}\n"
+        f"- Camera: {style['camera']}\n"
+    )
+    # Escape braces so str.format only substitutes the subject
+    return "{subject}\n" + body.replace('{', '{{').replace('}', '}}')
+
+
+def _compile_matcher() -> 're.Pattern':
+    """One alternation with a named group per preset, scanned in a single pass"""
+    groups = []
+    for name, preset in STYLE_PRESETS.items():
+        terms = []
+        for keyword in sorted(preset['keywords'], key=len, reverse=True):
+            escaped = re.escape(keyword)
+            terms.append(rf'\b{escaped}\b' if keyword.isascii() else escaped)
+        groups.append(f"(?P<{name}>{'|'.join(terms)})")
+    return re.compile('|'.join(groups), re.IGNORECASE)
+
+
+# Templates are precompiled for every preset and AR_MAP entry at import
+_TEMPLATES: Dict[Tuple[Optional[str], str], str] = {
+    (name, ar): _compile_template(style, ar_conf)
+    for name, style in [*STYLE_PRESETS.items(), (None, _DEFAULT_STYLE)]
+    for ar, ar_conf in AR_MAP.items()
+}
+_MATCHER = _compile_matcher()
+
+
+def match_style(user_text: str) -> Optional[str]:
+    """
+    Find the style preset a prompt asks for
+
+    Args:
+        user_text: The user's original prompt
+
+    Returns:
+        Name of the preset with the most keyword hits (earliest preset on a
+        tie), or None when no keyword matches
+    """
+    hits: Dict[str, int] = {}
+    for match in _MATCHER.finditer(user_text):
+        hits[match.lastgroup] = hits.get(match.lastgroup, 0) + 1
+    if not hits:
+        return None
+    order = list(STYLE_PRESETS)
+    return max(hits, key=lambda name: (hits[name], -order.index(name)))
+
+
+def expand_local(user_text: str, ar: str = '9:16') -> Tuple[str, Optional[str]]:
+    """
+    Expand a prompt from the precompiled presets without calling the LLM
+
+    Args:
+        user_text: The user's original prompt
+        ar: Aspect ratio (9:16 or 16:9)
+
+    Returns:
+        Tuple of (expanded prompt, matched preset name or None)
+    """
+    preset = match_style(user_text)
+    if ar not in AR_MAP:
+        ar = '9:16'
+    return _TEMPLATES[(preset, ar)].format(subject=user_text.strip()), preset
+
+
 def expand_prompt(user_text: str, ar: str = '9:16') -> str:
     """
     Expand user prompt focusing ONLY on style, not adding new objects
-    
+
     Args:
         user_text: The user's original prompt (e.g., "cinematic food photography")
         ar: Aspect ratio (9:16 or 16:9)
-    
+
     Returns:
         Expanded prompt with style and technical details ONLY
     """
-    ar_conf = AR_MAP.get(ar, AR_MAP['9:16'])
-    
-    # Build style-focused expansion
-    expanded = (
-        f"{user_text.strip()}\n"
-        f"\nStyle Enhancement:\n"
-        f"- Lighting: professional studio lighting, soft shadows, highlight details\n"
-        f"- Color Grading: cinematic color palette, balanced tones, rich contrast\n"
-        f"- Composition: {ar_conf['composition_hint']}, {ar_conf['aspect_ratio']} format\n"
-        f"- Technical Quality: ultra sharp focus, high detail, professional grade\n"
-        f"- Atmosphere: mood and tone matching the style requested\n"
-        f"- Camera: professional photography techniques, depth of field control\n"
-    )
-    return expanded
\ No newline at end of file
+    return expand_local(user_text, ar)[0]
+
+
+def should_use_llm(preset: Optional[str], mode: str, refine: bool = False,
+                   reference_images: Optional[list] = None) -> bool:
+    """
+    Decide whether /assist needs the LLM or can answer with the local expansion
+
+    Args:
+        preset: Preset matched by ``match_style`` (None when nothing matched)
+        mode: ``ASSIST_LOCAL_MODE``: ``auto``, ``always`` (never call the LLM,
+            even when refinement is requested) or ``off`` (always call the LLM)
+        refine: The client explicitly asked for LLM refinement
+        reference_images: Uploaded images the LLM should look at
+
+    Returns:
+        True if the LLM should be called
+    """
+    if mode == 'off':
+        return True
+    if mode == 'always':
+        return False
+    if refine:
+        return True
+    # The local tier cannot see images and has nothing to add to unmatched prompts
+    return preset is None or bool(reference_images)
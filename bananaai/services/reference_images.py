@@ -0,0 +1,192 @@
+import os
+import io
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .storage import storage
+from .metrics import CACHE_HITS, CACHE_MISSES, CACHE_EVICTIONS
+from ..middleware.tracing import span
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'reference_images'
+
+# (path, device, inode, size, mtime_ns): a rewritten file gets a new identity
+Identity = Tuple[str, int, int, int, int]
+
+
+class ReferenceImageCache:
+    """Process-wide LRU of upstream-ready reference image payloads
+
+    Values are ``{'mime_type', 'data'}`` blobs, which the Gemini SDK sends as
+    they are. Entries are keyed by content hash, so the same brand asset
+    uploaded under several names is stored once, and the total size of the
+    cached bytes is bounded. A second map from file identity (stat
+    fields) to hash lets repeat reads skip reading and hashing the file;
+    any change to the file changes its identity, so stale entries are
+    never served.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_identities: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_identities = max_identities
+        self._lock = threading.Lock()
+        self._blobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._identities: 'OrderedDict[Identity, str]' = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def init_app(self, app):
+        """Read the cache size from the app config"""
+        self.max_bytes = app.config.get('REFERENCE_CACHE_MB', 64) * 1024 * 1024
+        self.clear()
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the upstream-ready payload of an image file
+
+        Args:
+            path: Local path of the image
+
+        Returns:
+            Blob dict with ``mime_type`` and ``data``, or None if the file is
+            missing or not a readable image
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        identity = (path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+        with self._lock:
+            digest = self._identities.get(identity)
+            blob = self._blobs.get(digest) if digest else None
+            if blob is not None:
+                self._touch(identity, digest)
+                self._hits += 1
+        if blob is not None:
+            CACHE_HITS.inc(cache=CACHE_NAME)
+            return blob
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            logger.warning("Failed to read image %s: %s", path, e)
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            blob = self._blobs.get(digest)
+            if blob is not None:
+                # Same content under another name or rewritten unchanged
+                self._identities[identity] = digest
+                self._touch(identity, digest)
+                self._hits += 1
+        if blob is not None:
+            CACHE_HITS.inc(cache=CACHE_NAME)
+            return blob
+
+        mime_type = _sniff_mime_type(data)
+        if mime_type is None:
+            logger.warning("Not a readable image: %s", path)
+            return None
+        blob = {'mime_type': mime_type, 'data': data}
+
+        with self._lock:
+            self._misses += 1
+            self._insert(identity, digest, blob)
+        CACHE_MISSES.inc(cache=CACHE_NAME)
+        return blob
+
+    def _touch(self, identity: Identity, digest: str):
+        self._identities.move_to_end(identity)
+        self._blobs.move_to_end(digest)
+
+    def _insert(self, identity: Identity, digest: str, blob: Dict[str, Any]):
+        size = len(blob['data'])
+        if size > self.max_bytes:
+            # Larger than the whole cache: use it once, keep nothing
+            CACHE_EVICTIONS.inc(cache=CACHE_NAME, reason='too_large')
+            return
+
+        if digest not in self._blobs:
+            self._blobs[digest] = blob
+            self._bytes += size
+        self._identities[identity] = digest
+        self._touch(identity, digest)
+
+        while self._bytes > self.max_bytes:
+            _, evicted = self._blobs.popitem(last=False)
+            self._bytes -= len(evicted['data'])
+            CACHE_EVICTIONS.inc(cache=CACHE_NAME, reason='lru')
+        while len(self._identities) > self.max_identities:
+            # Identities only point at blobs; a dangling one is just a miss
+            self._identities.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._blobs.clear()
+            self._identities.clear()
+            self._bytes = 0
+
+    def summary(self) -> Dict[str, Any]:
+        """Cache size and hit rate of this process"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._blobs),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else None,
+            }
+
+
+def _sniff_mime_type(data: bytes) -> Optional[str]:
+    """MIME type of encoded image bytes, reading only the header"""
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return Image.MIME.get(img.format)
+    except Exception:
+        return None
+
+
+reference_cache = ReferenceImageCache()
+
+
+def load_reference_images(upload_folder: str, filenames: List[str]) -> list:
+    """
+    Get upstream-ready payloads for uploaded reference images
+
+    Payloads come from ``reference_cache``, so popular images are read
+    once per process, and the same objects can be handed to the LLM and
+    the image client.
+
+    Args:
+        upload_folder: Folder the images were uploaded to
+        filenames: Uploaded image filenames
+
+    Returns:
+        List of blob dicts; missing or unreadable files are skipped
+    """
+    if not filenames:
+        return []
+
+    images = []
+    with span('ref_load', images=len(filenames)):
+        for filename in filenames:
+            path = storage.local_path(upload_folder, filename)
+            blob = reference_cache.get(path) if path else None
+            if blob is None:
+                logger.warning("Reference image not found or unreadable: %s", filename)
+                continue
+            images.append(blob)
+            logger.debug("Loaded reference image: %s", filename)
+    return images
@@ -0,0 +1,247 @@
+import os
+import logging
+import tempfile
+import threading
+from typing import Optional
+
+from flask import send_from_directory, redirect, abort
+
+from .file_index import file_index
+from ..utils.validators import is_safe_filename
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStorage:
+    """Storage backend that keeps files in the local upload/output folders
+
+    The folders are the source of truth, so publishing is a no-op and every
+    file is served straight from disk.
+    """
+
+    name = 'local'
+
+    def publish(self, folder: str, filename: str):
+        """Make a file written to ``folder`` durable in the backend"""
+
+    def fetch(self, folder: str, filename: str) -> bool:
+        """Bring a missing file into ``folder``; returns True if it now exists"""
+        return os.path.isfile(os.path.join(folder, filename))
+
+    def delete(self, folder: str, filename: str):
+        """Delete a file from the backend"""
+
+    def download_url(self, folder: str, filename: str) -> Optional[str]:
+        """URL to redirect downloads to, or None to serve from disk"""
+        return None
+
+
+class S3Storage:
+    """Storage backend for S3-compatible object stores
+
+    The local upload/output folders act as a read-through cache in front of
+    the bucket: writes land on disk first and are uploaded (multipart for
+    large files), reads download missing objects into the folder, and
+    downloads are redirected to presigned URLs. ``boto3`` is an optional
+    dependency and only imported when this backend is configured.
+    """
+
+    name = 's3'
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, max_pool_connections: int = 32,
+                 multipart_threshold_mb: int = 8, presign_expiry: int = 3600,
+                 redirect_downloads: bool = True):
+        if not bucket:
+            raise ValueError("S3_BUCKET is required for the s3 storage backend")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.max_pool_connections = max_pool_connections
+        self.multipart_threshold = multipart_threshold_mb * 1024 * 1024
+        self.presign_expiry = presign_expiry
+        self.redirect_downloads = redirect_downloads
+        self._client = None
+        self._client_pid = None
+        self._transfer_config = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        """Create the pooled client once per process (clients do not survive fork)"""
+        with self._lock:
+            if self._client is None or self._client_pid != os.getpid():
+                import boto3
+                from botocore.config import Config
+                from boto3.s3.transfer import TransferConfig
+
+                self._client = boto3.client(
+                    's3',
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region,
+                    config=Config(
+                        max_pool_connections=self.max_pool_connections,
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                    ),
+                )
+                self._transfer_config = TransferConfig(
+                    multipart_threshold=self.multipart_threshold,
+                    multipart_chunksize=self.multipart_threshold,
+                    max_concurrency=4,
+                )
+                self._client_pid = os.getpid()
+            return self._client
+
+    def key(self, folder: str, filename: str) -> str:
+        """Object key for a file, namespaced by folder name"""
+        folder_name = os.path.basename(os.path.normpath(folder))
+        return f"{self.prefix}{folder_name}/{filename}"
+
+    def publish(self, folder: str, filename: str):
+        client = self._get_client()
+        client.upload_file(
+            os.path.join(folder, filename), self.bucket, self.key(folder, filename),
+            Config=self._transfer_config,
+        )
+
+    def fetch(self, folder: str, filename: str) -> bool:
+        path = os.path.join(folder, filename)
+        if os.path.isfile(path):
+            return True
+
+        from botocore.exceptions import ClientError
+
+        client = self._get_client()
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        os.close(fd)
+        try:
+            client.download_file(
+                self.bucket, self.key(folder, filename), tmp_path,
+                Config=self._transfer_config,
+            )
+            os.replace(tmp_path, path)
+        except ClientError as e:
+            os.unlink(tmp_path)
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+                return False
+            raise
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        file_index.record_write(folder, filename)
+        return True
+
+    def delete(self, folder: str, filename: str):
+        self._get_client().delete_object(Bucket=self.bucket, Key=self.key(folder, filename))
+
+    def download_url(self, folder: str, filename: str) -> Optional[str]:
+        if not self.redirect_downloads:
+            return None
+        return self._get_client().generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self.key(folder, filename)},
+            ExpiresIn=self.presign_expiry,
+        )
+
+
+class Storage:
+    """Facade over the configured storage backend
+
+    All file access for uploads and generated images goes through here:
+    writers call ``publish`` after writing to the local folder, readers call
+    ``local_path`` and routes call ``send``.
+    """
+
+    def __init__(self):
+        self.backend = LocalStorage()
+
+    def init_app(self, app):
+        """Select the backend from ``STORAGE_BACKEND``"""
+        cfg = app.config
+        backend = cfg.get('STORAGE_BACKEND', 'local')
+
+        if backend == 's3':
+            self.backend = S3Storage(
+                bucket=cfg.get('S3_BUCKET'),
+                prefix=cfg.get('S3_PREFIX', ''),
+                endpoint_url=cfg.get('S3_ENDPOINT_URL'),
+                region=cfg.get('S3_REGION'),
+                max_pool_connections=cfg.get('S3_MAX_POOL_CONNECTIONS', 32),
+                multipart_threshold_mb=cfg.get('S3_MULTIPART_THRESHOLD_MB', 8),
+                presign_expiry=cfg.get('S3_PRESIGN_EXPIRY', 3600),
+                redirect_downloads=cfg.get('S3_REDIRECT_DOWNLOADS', True),
+            )
+        elif backend == 'local':
+            self.backend = LocalStorage()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+        logger.info(f"Using {self.backend.name} storage backend")
+
+    @property
+    def is_local(self) -> bool:
+        return isinstance(self.backend, LocalStorage)
+
+    def publish(self, folder: str, filename: str) -> bool:
+        """
+        Push a file that was just written to the local folder to the backend
+
+        Returns:
+            True on success, False if the upload failed
+        """
+        try:
+            self.backend.publish(folder, filename)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to publish {filename} to {self.backend.name} storage: {e}")
+            return False
+
+    def local_path(self, folder: str, filename: str) -> Optional[str]:
+        """
+        Get a local path for reading a file, fetching it if needed
+
+        Args:
+            folder: Upload or output folder
+            filename: File name inside the folder
+
+        Returns:
+            Local file path, or None if the file does not exist anywhere
+        """
+        if not is_safe_filename(filename):
+            return None
+        try:
+            if self.backend.fetch(folder, filename):
+                file_index.record_access(folder, filename)
+                return os.path.join(folder, filename)
+        except Exception as e:
+            logger.error(f"Failed to fetch {filename} from {self.backend.name} storage: {e}")
+        return None
+
+    def delete(self, folder: str, filename: str):
+        """Delete a file from the backend and the local folder"""
+        self.backend.delete(folder, filename)
+        self.evict_local(folder, filename)
+
+    def evict_local(self, folder: str, filename: str):
+        """Drop the local copy only; for the local backend this deletes the file"""
+        try:
+            os.unlink(os.path.join(folder, filename))
+        except FileNotFoundError:
+            pass
+        file_index.record_delete(folder, filename)
+
+    def send(self, folder: str, filename: str):
+        """Build the response for downloading a file"""
+        url = self.backend.download_url(folder, filename)
+        if url:
+            file_index.record_access(folder, filename)
+            return redirect(url)
+
+        if self.local_path(folder, filename) is None:
+            abort(404)
+        return send_from_directory(folder, filename)
+
+
+storage = Storage()
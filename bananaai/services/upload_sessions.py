@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import secrets
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{22}$')
+
+# Expired sessions are swept at most this often, by one worker per host
+PURGE_INTERVAL_SECONDS = 60
+
+# Written by each sweep and read by ``summary``
+SUMMARY_FILE = '.summary'
+
+# Bytes read from the request per write
+COPY_BUFFER = 64 * 1024
+
+
+class UploadSessionNotFound(LookupError):
+    """The upload id is unknown, expired or already completed"""
+
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the stored data ends"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class ChecksumMismatch(ValueError):
+    """The assembled file does not have the SHA-256 the client declared"""
+
+
+class SessionLimitExceeded(Exception):
+    """A new session would go over the per-client or overall limits
+
+    ``per_client`` tells whether the client's own sessions are the reason.
+    """
+
+    def __init__(self, message: str, per_client: bool):
+        super().__init__(message)
+        self.per_client = per_client
+
+
+class UploadSessions:
+    """Resumable uploads assembled from chunks, shared by all workers
+
+    A session is two files in ``folder``: ``<id>.json`` with the declared
+    name, size and SHA-256, and ``<id>.part`` with the bytes received so
+    far. The size of the part file is the offset, so a client that lost a
+    connection asks for it and continues from there, whichever worker
+    answers. A chunk is appended only if it starts at that offset (under a
+    file lock, so a retried chunk racing the original cannot be written
+    twice). Completing checks the size and hash and hands the file over;
+    sessions not completed within ``ttl`` are deleted.
+
+    The folder sits outside the janitor's quotas, so each client may have at
+    most ``max_sessions_per_client`` open sessions, and all open sessions
+    together may declare at most ``max_pending_bytes``.
+
+    A background sweep deletes expired sessions and writes the session count
+    and pending bytes to ``SUMMARY_FILE``, which ``/health/stats`` reads
+    instead of scanning the folder. Every worker runs the sweep, but one
+    that finds the file newer than ``PURGE_INTERVAL_SECONDS`` skips it.
+    """
+
+    def __init__(self):
+        self.folder = None
+        self.ttl = 86400
+        self.max_bytes = 20 * 1024 * 1024
+        self.chunk_bytes = 1024 * 1024
+        self.max_sessions_per_client = 4
+        self.max_pending_bytes = 512 * 1024 * 1024
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        """Read the session folder and limits from the app config"""
+        cfg = app.config
+        self.folder = cfg.get('UPLOAD_PARTIAL_FOLDER') or os.path.join(
+            cfg.get('UPLOAD_FOLDER', 'uploads'), '.partial')
+        self.ttl = cfg.get('UPLOAD_SESSION_TTL_SECONDS', 86400)
+        self.max_bytes = cfg.get('MAX_CONTENT_LENGTH') or self.max_bytes
+        self.chunk_bytes = cfg.get('UPLOAD_CHUNK_BYTES', self.chunk_bytes)
+        self.max_sessions_per_client = cfg.get('UPLOAD_SESSIONS_PER_CLIENT', self.max_sessions_per_client)
+        self.max_pending_bytes = cfg.get('UPLOAD_PENDING_MB', 512) * 1024 * 1024
+        self._last_purge = 0.0
+
+    def start(self):
+        """Start the background sweep (no-op if already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='upload-session-sweep', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to exit"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(PURGE_INTERVAL_SECONDS):
+            try:
+                self._maybe_purge()
+            except Exception as e:
+                logger.error(f"Upload session sweep failed: {e}")
+
+    def _paths(self, upload_id: str):
+        if not isinstance(upload_id, str) or not SESSION_ID.match(upload_id):
+            raise UploadSessionNotFound(upload_id)
+        base = os.path.join(self.folder, upload_id)
+        return base + '.json', base + '.part'
+
+    def _meta(self, upload_id: str) -> Dict[str, Any]:
+        meta_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadSessionNotFound(upload_id)
+        if meta['expires'] <= time.time():
+            self.discard(upload_id)
+            raise UploadSessionNotFound(upload_id)
+        return meta
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self._paths(upload_id)[1])
+        except OSError:
+            raise UploadSessionNotFound(upload_id)
+
+    def _open_sessions(self) -> List[Dict[str, Any]]:
+        """Metadata of every unexpired session in the folder"""
+        sessions = []
+        now = time.time()
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(entry.path, encoding='utf-8') as f:
+                        meta = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if meta.get('expires', 0) > now:
+                    sessions.append(meta)
+        return sessions
+
+    def create(self, filename: str, size: int, sha256: str, client: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Start a resumable upload
+
+        Args:
+            filename: The client's file name (sanitized when completed)
+            size: Total bytes the client will send
+            sha256: Hex SHA-256 of the whole file
+            client: Key the per-client session limit is kept for
+
+        Returns:
+            Session status: ``upload_id``, ``offset``, ``size``,
+            ``chunk_size`` and ``expires``
+
+        Raises:
+            ValueError: If the size or hash is invalid or too large
+            SessionLimitExceeded: If the client has too many open sessions
+                or the folder is full
+        """
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise ValueError("size must be a positive integer")
+        if size > self.max_bytes:
+            raise ValueError(f"File exceeds the maximum size of {self.max_bytes // (1024 * 1024)} MB")
+        if not isinstance(sha256, str) or not re.match(r'^[0-9a-fA-F]{64}$', sha256):
+            raise ValueError("sha256 must be 64 hex characters")
+        self._maybe_purge()
+
+        import fcntl
+
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, '.lock'), 'w') as lock:
+            # Serialise creation across workers so the limits cannot be raced
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            sessions = self._open_sessions()
+            if client is not None and \
+                    sum(1 for s in sessions if s.get('client') == client) >= self.max_sessions_per_client:
+                raise SessionLimitExceeded(
+                    f"At most {self.max_sessions_per_client} uploads may be in progress at once", True)
+            if sum(s['size'] for s in sessions) + size > self.max_pending_bytes:
+                raise SessionLimitExceeded("Too many uploads in progress, please try again later", False)
+
+            upload_id = secrets.token_urlsafe(16)
+            meta_path, part_path = self._paths(upload_id)
+            meta = {'filename': filename, 'size': size, 'sha256': sha256.lower(),
+                    'client': client, 'expires': time.time() + self.ttl}
+            open(part_path, 'wb').close()
+            # Written under a temporary name so other workers never read half of it
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        return self._status(upload_id, meta, 0)
+
+    def _status(self, upload_id: str, meta: Dict[str, Any], offset: int) -> Dict[str, Any]:
+        return {'upload_id': upload_id, 'offset': offset, 'size': meta['size'],
+                'chunk_size': self.chunk_bytes, 'expires': meta['expires']}
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Raises:
+            UploadSessionNotFound: If there is no such session
+        """
+        meta = self._meta(upload_id)
+        return self._status(upload_id, meta, self._offset(upload_id))
+
+    def append(self, upload_id: str, offset: int, stream, length: Optional[int] = None) -> int:
+        """
+        Append one chunk
+
+        Args:
+            upload_id: Session id
+            offset: Where the client says the chunk starts
+            stream: File-like object with the chunk's bytes
+            length: Declared chunk length, if known
+
+        Returns:
+            The new offset
+
+        Raises:
+            UploadSessionNotFound: If there is no such session
+            OffsetMismatch: If ``offset`` is not the stored size
+            ValueError: If the chunk would go past the declared size
+        """
+        import fcntl
+
+        meta = self._meta(upload_id)
+        _, part_path = self._paths(upload_id)
+        try:
+            part = open(part_path, 'r+b')
+        except OSError:
+            raise UploadSessionNotFound(upload_id)
+        with part:
+            fcntl.flock(part, fcntl.LOCK_EX)
+            current = os.fstat(part.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(f"Expected offset {current}, got {offset}", current)
+            remaining = meta['size'] - current
+            if length is not None and length > remaining:
+                raise ValueError(f"Chunk of {length} bytes exceeds the {remaining} bytes remaining")
+            part.seek(current)
+            written = 0
+            try:
+                while True:
+                    data = stream.read(COPY_BUFFER)
+                    if not data:
+                        break
+                    written += len(data)
+                    if written > remaining:
+                        raise ValueError(f"Chunk exceeds the {remaining} bytes remaining")
+                    part.write(data)
+            except Exception:
+                # A chunk cut off half way is dropped; the client resends it
+                part.truncate(current)
+                raise
+            part.flush()
+            return current + written
+
+    def complete(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Verify a fully received upload and hand it over
+
+        Returns:
+            Dict with ``path`` (the assembled file, now owned by the caller)
+            and the declared ``filename`` and ``size``
+
+        Raises:
+            UploadSessionNotFound: If there is no such session
+            OffsetMismatch: If bytes are still missing
+            ChecksumMismatch: If the hash differs; the session is discarded
+        """
+        meta = self._meta(upload_id)
+        meta_path, part_path = self._paths(upload_id)
+        offset = self._offset(upload_id)
+        if offset != meta['size']:
+            raise OffsetMismatch(f"Received {offset} of {meta['size']} bytes", offset)
+
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(COPY_BUFFER * 16), b''):
+                digest.update(block)
+        if digest.hexdigest() != meta['sha256']:
+            self.discard(upload_id)
+            raise ChecksumMismatch("Uploaded data does not match its SHA-256")
+
+        # Claim the file; a concurrent completion of the same id finds nothing
+        claimed = part_path + '.done'
+        try:
+            os.replace(part_path, claimed)
+        except OSError:
+            raise UploadSessionNotFound(upload_id)
+        self._remove(meta_path)
+        return {'path': claimed, 'filename': meta['filename'], 'size': meta['size']}
+
+    def discard(self, upload_id: str):
+        """Delete a session and its data"""
+        for path in self._paths(upload_id):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _maybe_purge(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+                return
+            self._last_purge = now
+        try:
+            # Another worker swept within the interval
+            if os.path.getmtime(os.path.join(self.folder, SUMMARY_FILE)) > now - PURGE_INTERVAL_SECONDS:
+                return
+        except OSError:
+            pass
+        self.purge()
+
+    def purge(self) -> int:
+        """Delete expired sessions and write the summary; returns how many were deleted"""
+        removed = sessions = pending = 0
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return 0
+        now = time.time()
+        for name in names:
+            if name.endswith('.done'):
+                # Claimed by a completion whose worker died before moving it
+                path = os.path.join(self.folder, name)
+                try:
+                    if os.path.getmtime(path) < now - self.ttl:
+                        self._remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                with open(os.path.join(self.folder, name), encoding='utf-8') as f:
+                    expired = json.load(f)['expires'] <= now
+            except (OSError, ValueError, KeyError):
+                continue
+            if expired and SESSION_ID.match(upload_id):
+                self.discard(upload_id)
+                removed += 1
+                continue
+            try:
+                pending += os.path.getsize(os.path.join(self.folder, upload_id + '.part'))
+                sessions += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info("Deleted %d expired upload sessions", removed)
+
+        summary_path = os.path.join(self.folder, SUMMARY_FILE)
+        tmp_path = f'{summary_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sessions': sessions, 'pending_bytes': pending, 'updated_at': now}, f)
+        os.replace(tmp_path, summary_path)
+        return removed
+
+    def summary(self) -> Dict[str, Any]:
+        """Open sessions and bytes waiting in the session folder, as of the last sweep"""
+        try:
+            with open(os.path.join(self.folder, SUMMARY_FILE), encoding='utf-8') as f:
+                counts = json.load(f)
+        except (OSError, ValueError):
+            counts = {'sessions': 0, 'pending_bytes': 0, 'updated_at': None}
+        return {**counts, 'chunk_size': self.chunk_bytes}
+
+
+upload_sessions = UploadSessions()
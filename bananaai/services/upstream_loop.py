@@ -0,0 +1,65 @@
+import os
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Coroutine, Optional
+from ..middleware.tracing import bind_trace
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamLoop:
+    """Shared event loop for async upstream calls
+
+    One daemon thread per process runs an asyncio loop. Request handlers hand
+    their upstream coroutine to it and wait for the result, so all in-flight
+    Gemini calls (and their retry backoffs) are multiplexed on that loop
+    instead of each holding a blocking gRPC call.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # Threads do not survive fork, so each worker starts its own loop
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self._run, args=(loop,), name='upstream-loop', daemon=True
+                )
+                thread.start()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                logger.info("Started upstream event loop")
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the shared loop and wait for its result
+
+        Args:
+            coro: Coroutine to run
+            timeout: Seconds to wait before cancelling it
+
+        Returns:
+            The coroutine's result (exceptions are re-raised)
+        """
+        # Carry the request's trace over so spans on the loop are recorded
+        future = asyncio.run_coroutine_threadsafe(bind_trace(coro), self._ensure_started())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise RuntimeError("Upstream call timed out")
+
+
+upstream_loop = UpstreamLoop()
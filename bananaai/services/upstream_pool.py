@@ -0,0 +1,294 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from ..utils.lazy_import import LazyModule
+from .metrics import metrics
+
+# The SDK pulls in gRPC and protobuf; load it on first use, not at app start
+genai = LazyModule('google.generativeai')
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_POOL_REQUESTS = metrics.counter(
+    'bananaai_upstream_pool_requests_total', 'Gemini calls routed through the key pool',
+    ('key', 'model', 'outcome'))
+UPSTREAM_POOL_COOLDOWNS = metrics.counter(
+    'bananaai_upstream_pool_cooldowns_total', 'Keys taken out of rotation after quota errors',
+    ('key', 'model'))
+
+# Error classes from google.api_core that mean "this key is out of quota"
+QUOTA_ERRORS = ('ResourceExhausted', 'TooManyRequests')
+# ... and that mean the key itself is unusable
+KEY_ERRORS = ('PermissionDenied', 'Unauthenticated')
+
+MAX_COOLDOWN_SECONDS = 600
+
+
+class PoolExhausted(RuntimeError):
+    """No key in the pool can take a request right now"""
+
+    def __init__(self, kind: str, retry_after: float):
+        super().__init__(f"All upstream keys for {kind} are busy or out of quota")
+        self.retry_after = retry_after
+
+
+class PoolKey:
+    """One API key: its weight, request budget and per-model cooldowns"""
+
+    def __init__(self, name: str, api_key: str, weight: float = 1.0, rpm: int = 0):
+        self.name = name
+        self.api_key = api_key
+        self.weight = weight
+        self.rpm = rpm
+        self.inflight = 0
+        self.recent: Deque[float] = deque()
+        self.cooldowns: Dict[Optional[str], float] = {}  # model (None = all) -> until
+        self.strikes: Dict[Optional[str], int] = {}
+        self.totals = {'ok': 0, 'error': 0, 'quota': 0}
+        self._clients = None
+
+    def _trim(self, now: float):
+        while self.recent and self.recent[0] <= now - 60:
+            self.recent.popleft()
+
+    def available(self, model: str, now: float) -> bool:
+        self._trim(now)
+        if self.rpm and len(self.recent) >= self.rpm:
+            return False
+        return self.cooldowns.get(model, 0) <= now and self.cooldowns.get(None, 0) <= now
+
+    def free_at(self, model: str, now: float) -> float:
+        """Earliest time this key could take a request for ``model``"""
+        at = max(self.cooldowns.get(model, 0), self.cooldowns.get(None, 0), now)
+        if self.rpm and len(self.recent) >= self.rpm:
+            at = max(at, self.recent[0] + 60)
+        return at
+
+    def load(self) -> float:
+        return (self.inflight + len(self.recent) / 60) / self.weight
+
+    def clients(self):
+        """SDK client manager bound to this key, independent of ``genai.configure``"""
+        # The SDK has no public per-model API key; _ClientManager and the
+        # model's _client/_async_client are private, which is why
+        # google-generativeai is pinned exactly in requirements.txt
+        if self._clients is None:
+            from google.generativeai.client import _ClientManager
+            manager = _ClientManager()
+            manager.configure(api_key=self.api_key)
+            self._clients = manager
+        return self._clients
+
+
+class Lease:
+    """A routed call: the key and model to use, released when the call ends"""
+
+    def __init__(self, pool: 'UpstreamPool', key: PoolKey, model: str):
+        self.pool = pool
+        self.key = key
+        self.model = model
+
+    def generative_model(self, asynchronous: bool = False, **kwargs):
+        """
+        A ``GenerativeModel`` for the leased model that sends with the leased key
+
+        Args:
+            asynchronous: Bind the async client, for ``generate_content_async``;
+                it is created on the calling event loop
+        """
+        model = genai.GenerativeModel(self.model, **kwargs)
+        clients = self.key.clients()
+        if asynchronous:
+            model._async_client = clients.get_default_client('generative_async')
+        else:
+            model._client = clients.get_default_client('generative')
+        return model
+
+    def __enter__(self) -> 'Lease':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.release(self, exc)
+        return False
+
+
+class UpstreamPool:
+    """Routes Gemini calls across several API keys and models
+
+    Each call leases the least-loaded key (in-flight and recent calls,
+    divided by its weight) that is under its per-minute budget and not
+    cooling down. Quota errors take the key out of rotation for that model
+    with a growing cooldown; when no key can serve the primary model the
+    call fails over to the next model in the list.
+
+    The pool lives in each process, so a key's ``rpm`` is split evenly
+    across the ``processes`` (gunicorn workers) sharing it.
+
+    Configured from ``UPSTREAM_POOL``, either JSON or a path to a JSON file::
+
+        {"keys": [{"name": "main", "key_env": "GEMINI_KEY_MAIN", "weight": 2, "rpm": 60},
+                  {"name": "spare", "key_env": "GEMINI_KEY_SPARE", "rpm": 15}],
+         "models": {"llm": ["gemini-2.5-flash", "gemini-2.0-flash"],
+                    "banana": ["gemini-2.5-flash-image-preview"]}}
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.keys: List[PoolKey] = []
+        self.models: Dict[str, List[str]] = {}
+        self.cooldown_seconds = 60
+        self.processes = 1
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Build the pool from the app config; disabled when ``UPSTREAM_POOL`` is unset"""
+        cfg = app.config
+        self.cooldown_seconds = cfg.get('UPSTREAM_POOL_COOLDOWN_SECONDS', 60)
+        self.processes = max(1, cfg.get('UPSTREAM_POOL_PROCESSES', 1))
+        spec = cfg.get('UPSTREAM_POOL')
+        if not spec:
+            self.enabled = False
+            self.keys = []
+            return
+        if not spec.lstrip().startswith('{'):
+            with open(spec) as f:
+                spec = f.read()
+        self.configure(json.loads(spec), defaults={
+            'llm': [cfg.get('LLM_MODEL')],
+            'banana': [cfg.get('BANANA_MODEL')],
+        })
+        logger.info("Upstream pool: %d keys, models %s", len(self.keys), self.models)
+
+    def configure(self, spec: Dict[str, Any], defaults: Dict[str, List[str]] = None):
+        """
+        Set keys and models from a parsed pool specification
+
+        Raises:
+            ValueError: If a key has no value or the spec lists no keys
+        """
+        keys = []
+        for index, entry in enumerate(spec.get('keys', [])):
+            name = entry.get('name', f'key{index + 1}')
+            api_key = entry.get('key') or os.getenv(entry.get('key_env', ''), '')
+            if not api_key:
+                raise ValueError(f"Upstream pool key '{name}' has no key or key_env value")
+            rpm = int(entry.get('rpm', 0))
+            if rpm:
+                # This process's share of the key's budget. Below one call per
+                # process any share would let the workers together go over,
+                # so the key is left to its 429 cooldown instead
+                if rpm < self.processes:
+                    logger.warning("Upstream pool key '%s': rpm %d is below the %d worker processes; "
+                                   "not limiting its rate", name, rpm, self.processes)
+                rpm //= self.processes
+            keys.append(PoolKey(name, api_key, float(entry.get('weight', 1)), rpm))
+        if not keys:
+            raise ValueError("UPSTREAM_POOL must list at least one key")
+
+        models = {kind: list(names) for kind, names in (defaults or {}).items() if names}
+        models.update({kind: list(names) for kind, names in spec.get('models', {}).items()})
+        with self._lock:
+            self.keys = keys
+            self.models = models
+            self.enabled = True
+
+    def acquire(self, kind: str) -> Lease:
+        """
+        Lease a key and model for one call
+
+        Args:
+            kind: ``llm`` or ``banana``
+
+        Raises:
+            PoolExhausted: If no key can serve any model of this kind
+        """
+        now = time.monotonic()
+        with self._lock:
+            for model in self.models[kind]:
+                ready = [key for key in self.keys if key.available(model, now)]
+                if ready:
+                    key = min(ready, key=PoolKey.load)
+                    key.inflight += 1
+                    key.recent.append(now)
+                    if model != self.models[kind][0]:
+                        logger.info("Upstream pool: failing over %s to %s on %s", kind, model, key.name)
+                    return Lease(self, key, model)
+            free_at = min(key.free_at(model, now) for key in self.keys for model in self.models[kind])
+        raise PoolExhausted(kind, max(1.0, free_at - now))
+
+    def release(self, lease: Lease, error: Optional[BaseException] = None):
+        """End a lease, cooling the key down if the call hit its quota"""
+        key, model = lease.key, lease.model
+        name = type(error).__name__ if error else None
+        outcome = 'quota' if name in QUOTA_ERRORS else 'error' if error else 'ok'
+        with self._lock:
+            key.inflight -= 1
+            key.totals[outcome] += 1
+            if name in QUOTA_ERRORS or name in KEY_ERRORS:
+                scope = model if name in QUOTA_ERRORS else None
+                strikes = key.strikes.get(scope, 0) + 1
+                key.strikes[scope] = strikes
+                cooldown = min(self.cooldown_seconds * 2 ** (strikes - 1), MAX_COOLDOWN_SECONDS)
+                key.cooldowns[scope] = time.monotonic() + cooldown
+            elif not error:
+                key.strikes.pop(model, None)
+                key.strikes.pop(None, None)
+        UPSTREAM_POOL_REQUESTS.inc(key=key.name, model=model, outcome=outcome)
+        if name in QUOTA_ERRORS or name in KEY_ERRORS:
+            UPSTREAM_POOL_COOLDOWNS.inc(key=key.name, model=model)
+            logger.warning("Upstream pool: %s out of rotation for %s for %ds (%s)",
+                           key.name, model if name in QUOTA_ERRORS else 'all models', cooldown, name)
+
+    def summary(self) -> Dict[str, Any]:
+        """Utilization and health of every key in this process"""
+        now = time.monotonic()
+        with self._lock:
+            keys = []
+            for key in self.keys:
+                key._trim(now)
+                keys.append({
+                    'name': key.name,
+                    'weight': key.weight,
+                    'inflight': key.inflight,
+                    'requests_last_minute': len(key.recent),
+                    'rpm_limit': key.rpm or None,
+                    'utilization': round(len(key.recent) / key.rpm, 3) if key.rpm else None,
+                    'cooling_down': {model or 'all': round(until - now, 1)
+                                     for model, until in key.cooldowns.items() if until > now},
+                    'totals': dict(key.totals),
+                })
+            return {'enabled': self.enabled, 'models': self.models, 'processes': self.processes,
+                    'keys': keys}
+
+
+upstream_pool = UpstreamPool()
+
+
+class _NoLease:
+    """Stands in for a lease when no pool is configured"""
+    model = None
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def routed(pool: Optional[UpstreamPool], kind: str):
+    """Lease from ``pool`` if one is in use; otherwise a context yielding None"""
+    if pool is None or not pool.enabled:
+        return _NoLease()
+    return pool.acquire(kind)
+
+
+def generative_model(lease: Optional[Lease], model_name: str, asynchronous: bool = False, **kwargs):
+    """A model from ``lease``, or ``model_name`` on the globally configured key"""
+    if lease is not None:
+        return lease.generative_model(asynchronous, **kwargs)
+    return genai.GenerativeModel(model_name, **kwargs)
@@ -0,0 +1 @@
+"""Command-line tools for operating the Banana AI application"""
\ No newline at end of file
@@ -0,0 +1,124 @@
+"""Static asset build: minify, fingerprint and precompress JS and CSS
+
+Usage:
+    python -m bananaai.tools.build_assets [--static static]
+
+Writes ``static/dist/<name>.<hash>.<ext>`` plus ``.gz`` and ``.br``
+siblings for every entry in ``ASSETS`` and a ``manifest.json`` that maps
+source paths to built names. The app serves built files under ``/assets/``
+with immutable caching and falls back to the plain files under
+``/static/`` when no manifest exists (e.g. during development).
+"""
+import os
+import sys
+import gzip
+import json
+import hashlib
+import argparse
+from typing import Dict
+
+try:
+    import rjsmin
+    import rcssmin
+except ImportError:  # optional: whitespace-only minification
+    rjsmin = rcssmin = None
+
+try:
+    import brotli
+except ImportError:  # optional: no .br siblings
+    brotli = None
+
+ASSETS = ('js/main.js', 'css/styles.css')
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+
+def _strip_lines(text: str) -> str:
+    """Conservative fallback: drop indentation and blank lines only"""
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip()) + '\n'
+
+
+def minify(path: str, text: str) -> str:
+    """Minify JS or CSS source, by file extension"""
+    if path.endswith('.js'):
+        return rjsmin.jsmin(text) if rjsmin else _strip_lines(text)
+    if path.endswith('.css'):
+        return rcssmin.cssmin(text) if rcssmin else _strip_lines(text)
+    return text
+
+
+def _write(path: str, data: bytes):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_folder: str = 'static') -> Dict[str, Dict]:
+    """
+    Build every asset and write the manifest
+
+    Args:
+        static_folder: Flask static folder containing the sources
+
+    Returns:
+        Per-asset report with the built name and sizes
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+
+    manifest, report = {}, {}
+    for source in ASSETS:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            original = f.read()
+        data = minify(source, original).encode('utf-8')
+
+        stem, ext = os.path.splitext(os.path.basename(source))
+        name = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        path = os.path.join(dist, name)
+
+        _write(path, data)
+        # mtime=0 keeps the .gz byte-identical between builds
+        _write(f"{path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(f"{path}.br", brotli.compress(data, quality=11))
+
+        manifest[source] = name
+        report[source] = {
+            'name': name,
+            'source_bytes': len(original.encode('utf-8')),
+            'min_bytes': len(data),
+            'gzip_bytes': os.path.getsize(f"{path}.gz"),
+            'br_bytes': os.path.getsize(f"{path}.br") if brotli is not None else None,
+        }
+
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+
+    # Drop outputs of earlier builds
+    keep = set(manifest.values())
+    for entry in os.listdir(dist):
+        base = entry[:-3] if entry.endswith(('.gz', '.br')) else entry
+        if entry != MANIFEST and base not in keep:
+            os.unlink(os.path.join(dist, entry))
+
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--static', default='static', help='Flask static folder')
+    args = parser.parse_args(argv)
+
+    if rjsmin is None:
+        print("rjsmin/rcssmin not installed, only stripping whitespace", file=sys.stderr)
+
+    report = build(args.static)
+    print(f"{'asset':<16} {'built':<28} {'source':>8} {'min':>8} {'gzip':>7} {'br':>7}")
+    for source, info in report.items():
+        print(f"{source:<16} {info['name']:<28} {info['source_bytes']:>8} {info['min_bytes']:>8} "
+              f"{info['gzip_bytes']:>7} {info['br_bytes'] or '-':>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,477 @@
+"""Replay captured traffic against local builds with an offline upstream
+
+Usage:
+    python -m bananaai.tools.replay CAPTURE [--build PATH [--build PATH]] [--speed 10] [--json]
+
+Reads a capture written with ``CAPTURE_ENABLED=true`` and sends the same
+requests at the same offsets (divided by ``--speed``) to each build in turn.
+A build is a checkout of this repository; it is served in a child process
+in which ``google.generativeai.GenerativeModel`` is replaced by a stub that
+answers after latencies drawn from the captured upstream calls (also
+divided by ``--speed``), so no API key or network is needed.
+
+Prompts are synthesized from the hashed cache keys: a prompt that repeated
+in the capture repeats in the replay, with the same length, aspect ratio,
+options and reference image sizes, and still matches the style preset it
+matched. Latency is measured from each request's scheduled arrival, so a
+build that falls behind is charged for the queueing it causes. With two
+builds the report shows the change from the first to the second.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..services.prompt_builder import STYLE_PRESETS
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Filler for synthetic prompts; none of these match a style preset
+WORDS = ('lantern', 'harbor', 'meadow', 'glass', 'copper', 'velvet', 'orchard', 'comet',
+         'quiet', 'amber', 'tower', 'paper', 'marble', 'signal', 'kite', 'window')
+
+# Upstream latency used when the capture has no call of that kind
+DEFAULT_UPSTREAM_MS = {'llm': 1500.0, 'banana': 8000.0}
+
+_CHILD_SCRIPT = r"""
+import io, sys, json, time, random, asyncio, threading, types
+config = json.loads(sys.argv[1])
+sys.path.insert(0, config['build'])
+import google.generativeai as genai
+from PIL import Image
+
+ns = types.SimpleNamespace
+rng = random.Random(config['seed'])
+lock = threading.Lock()
+calls = {'llm': 0, 'banana': 0}
+png = io.BytesIO()
+Image.new('RGB', (64, 64), (250, 214, 64)).save(png, 'PNG')
+png = png.getvalue()
+
+
+def delay(kind):
+    with lock:
+        calls[kind] += 1
+        return rng.choice(config['latencies'][kind]) / 1000 / config['speed']
+
+
+class StubModel:
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name or ''
+
+    def _kind(self):
+        return 'banana' if 'image' in self.model_name else 'llm'
+
+    @staticmethod
+    def _response(kind, generation_config):
+        if kind == 'banana':
+            count = (generation_config or {}).get('candidate_count', 1)
+            part = ns(text=None, inline_data=ns(data=png, mime_type='image/png'))
+        else:
+            count = 1
+            part = ns(text='Replayed prompt expansion', inline_data=None)
+        return ns(candidates=[ns(content=ns(parts=[part]), finish_reason=1)] * count)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        kind = self._kind()
+        time.sleep(delay(kind))
+        return self._response(kind, generation_config)
+
+    async def generate_content_async(self, contents, generation_config=None, **kwargs):
+        kind = self._kind()
+        await asyncio.sleep(delay(kind))
+        return self._response(kind, generation_config)
+
+
+genai.GenerativeModel = StubModel
+from app import create_app
+app = create_app()
+app.config['WTF_CSRF_ENABLED'] = False
+app.add_url_rule('/__replay/upstream', 'replay_upstream', lambda: dict(calls))
+
+from werkzeug.serving import make_server
+server = make_server('127.0.0.1', 0, app, threaded=True)
+with open(config['port_file'], 'w') as f:
+    f.write(str(server.server_port))
+server.serve_forever()
+"""
+
+
+def load_capture(path: str, limit: int = None) -> List[Dict[str, Any]]:
+    """Capture records in arrival order"""
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r['t'])
+    return records[:limit] if limit else records
+
+
+def _preset_keyword(preset: str) -> Optional[str]:
+    keywords = STYLE_PRESETS.get(preset, {}).get('keywords', ())
+    return next((k for k in keywords if k.isascii()), None)
+
+
+def synthetic_text(seed: str, chars: int, preset: str = None) -> str:
+    """
+    Deterministic stand-in for a captured string
+
+    The same seed always gives the same text, about ``chars`` long,
+    starting with a keyword of ``preset`` when one is given.
+    """
+    rng = random.Random(seed)
+    keyword = _preset_keyword(preset) if preset else None
+    words = [keyword] if keyword else []
+    while len(' '.join(words)) < max(chars, 1):
+        words.append(rng.choice(WORDS))
+    text = ' '.join(words)
+    return text if keyword else text[:max(chars, 1)]
+
+
+def reference_name(ref_id: str) -> str:
+    return f'replay-{ref_id}.png'
+
+
+def synthetic_image(size: Optional[int], seed: str) -> bytes:
+    """A PNG of random pixels, about ``size`` bytes"""
+    from PIL import Image
+    side = max(8, int(((size or 12288) / 3) ** 0.5))
+    rng = random.Random(seed)
+    image = Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3))
+    out = io.BytesIO()
+    image.save(out, 'PNG', compress_level=1)
+    return out.getvalue()
+
+
+def _multipart(files: Dict[str, Dict[str, Any]], seed: str) -> Tuple[bytes, str]:
+    boundary = f'replay{random.Random(seed).getrandbits(64):x}'
+    body = b''
+    for name, info in files.items():
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                 f'filename="{name}.png"\r\nContent-Type: image/png\r\n\r\n').encode()
+        body += synthetic_image(info.get('bytes'), f'{seed}:{name}') + b'\r\n'
+    body += f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def build_requests(records: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[bytes], Dict[str, str]]]:
+    """
+    Turn capture records into (method, path, body, headers)
+
+    Raises:
+        ValueError: If a record has no route
+    """
+    presets = {}
+    for record in records:
+        preset = (record.get('expansion') or {}).get('preset')
+        if preset and record.get('cache_key'):
+            presets[record['cache_key']] = preset
+
+    requests = []
+    for index, record in enumerate(records):
+        if not record.get('route'):
+            raise ValueError(f"Capture record {index} has no route")
+        method, path, params = record.get('method', 'GET'), record['route'], record.get('params') or {}
+        seed = record.get('cache_key') or str(index)
+
+        def value(key, shaped):
+            if key == 'reference_images' and isinstance(shaped, list):
+                return [reference_name(ref['id']) for ref in shaped]
+            if isinstance(shaped, dict) and 'chars' in shaped:
+                if key == 'prompt':
+                    return synthetic_text(seed, shaped['chars'], presets.get(record.get('cache_key')))
+                return synthetic_text(f'{seed}:{key}', shaped['chars'])
+            return shaped
+
+        if record.get('files'):
+            body, content_type = _multipart(record['files'], str(index))
+            requests.append((method, path, body, {'Content-Type': content_type}))
+        elif method == 'GET':
+            query = {key: value(key, shaped) for key, shaped in params.items() if key != 'cursor'}
+            query = {key: v for key, v in query.items() if not isinstance(v, (dict, list))}
+            if query:
+                path += '?' + urllib.parse.urlencode(query)
+            requests.append((method, path, None, {}))
+        else:
+            data = {key: value(key, shaped) for key, shaped in params.items()
+                    if not (isinstance(shaped, dict) and 'type' in shaped)}
+            requests.append((method, path, json.dumps(data).encode(), {'Content-Type': 'application/json'}))
+    return requests
+
+
+def upstream_latencies(records: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    """Captured upstream call latencies (ms) by client"""
+    latencies = {'llm': [], 'banana': []}
+    for record in records:
+        for call in record.get('upstream') or []:
+            if call.get('client') in latencies:
+                latencies[call['client']].append(call['ms'])
+    return {kind: values or [DEFAULT_UPSTREAM_MS[kind]] for kind, values in latencies.items()}
+
+
+def _expansion_outcome(content_type: str, body: bytes) -> Optional[str]:
+    """hit, local or llm for a prompt expansion response, else None"""
+    try:
+        if content_type.startswith('text/event-stream'):
+            for line in body.decode('utf-8', 'replace').split('\n\n'):
+                if line.startswith('event: expanded\n'):
+                    data = json.loads(line.split('data: ', 1)[1])
+                    break
+            else:
+                return None
+        elif content_type.startswith('application/json'):
+            data = json.loads(body)
+        else:
+            return None
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'cached' not in data:
+        return None
+    return 'hit' if data['cached'] else ('local' if data.get('source') == 'local' else 'llm')
+
+
+def _send(base_url: str, request: tuple, scheduled: float) -> Dict[str, Any]:
+    method, path, body, headers = request
+    status, content_type, payload = None, '', b''
+    try:
+        with urllib.request.urlopen(urllib.request.Request(base_url + path, data=body, headers=headers,
+                                                           method=method), timeout=600) as response:
+            status, content_type, payload = response.status, response.headers.get('Content-Type', ''), response.read()
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        pass
+    route = path.split('?', 1)[0]
+    return {'route': route, 'status': status, 'ms': (time.perf_counter() - scheduled) * 1000,
+            'expansion': _expansion_outcome(content_type, payload) if status == 200 else None}
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 and max"""
+    values = sorted(values)
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+
+    def pick(q):
+        return round(values[min(len(values) - 1, max(0, int(q * len(values) + 0.5) - 1))], 1)
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1], 1)}
+
+
+def summarize(results: List[Dict[str, Any]], duration: float,
+              upstream: Dict[str, int] = None) -> Dict[str, Any]:
+    """Throughput, latency, error and cache figures for one run (or the capture itself)"""
+    ok = [r for r in results if r['status'] is not None and r['status'] < 500]
+    outcomes = Counter(r['expansion'] for r in results if r.get('expansion'))
+    expansions = sum(outcomes.values())
+    routes = {}
+    for route in sorted({r['route'] for r in results}):
+        latencies = [r['ms'] for r in ok if r['route'] == route]
+        routes[route] = {'requests': sum(r['route'] == route for r in results), **percentiles(latencies)}
+    return {
+        'requests': len(results),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(ok) / duration, 3) if duration > 0 else None,
+        'latency_ms': percentiles([r['ms'] for r in ok]),
+        'routes': routes,
+        'statuses': dict(Counter(str(r['status']) for r in results)),
+        'errors': sum(r['status'] is None or (r['status'] >= 500 and r['status'] != 503) for r in results),
+        'shed': sum(r['status'] == 503 for r in results),
+        'cache_hit_rate': round(outcomes['hit'] / expansions, 4) if expansions else None,
+        'local_rate': round(outcomes['local'] / expansions, 4) if expansions else None,
+        'upstream_calls': upstream,
+    }
+
+
+def summarize_capture(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The same figures as measured in production when the capture was taken"""
+    results = [{'route': r['route'], 'status': r.get('status'), 'ms': r.get('ms', 0.0),
+                'expansion': (r.get('expansion') or {}).get('outcome')} for r in records]
+    last = max(r['t'] + r.get('ms', 0.0) / 1000 for r in records)
+    upstream = Counter(call.get('client') for r in records for call in r.get('upstream') or [])
+    return summarize(results, last - records[0]['t'],
+                     {'llm': upstream['llm'], 'banana': upstream['banana']})
+
+
+def _wait_for_server(proc: subprocess.Popen, port_file: str, log_path: str, timeout: float = 120) -> int:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            with open(log_path, encoding='utf-8', errors='replace') as f:
+                raise RuntimeError(f"Replay server exited with {proc.returncode}:\n{f.read()[-2000:]}")
+        if os.path.exists(port_file) and os.path.getsize(port_file):
+            with open(port_file) as f:
+                port = int(f.read())
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/health/check', timeout=5).read()
+                return port
+            except OSError:
+                pass
+        time.sleep(0.05)
+    raise RuntimeError("Replay server did not start in time")
+
+
+def run_build(records: List[Dict[str, Any]], build: str = PROJECT_ROOT, speed: float = 1.0,
+              concurrency: int = 64, seed: int = 0) -> Dict[str, Any]:
+    """
+    Replay the capture against one build
+
+    Args:
+        records: Capture records in arrival order
+        build: Checkout to serve
+        speed: Time compression of arrivals and upstream latency
+        concurrency: Most requests in flight from the replay client
+        seed: Seed for the stub's latency draws
+
+    Returns:
+        ``summarize`` figures plus the stub's upstream call counts
+
+    Raises:
+        RuntimeError: If the build's server does not start
+    """
+    build = os.path.abspath(build)
+    requests = build_requests(records)
+    workdir = tempfile.mkdtemp(prefix='bananaai-replay-')
+    try:
+        uploads = os.path.join(workdir, 'uploads')
+        os.makedirs(uploads)
+        for record in records:
+            for ref in (record.get('params') or {}).get('reference_images') or []:
+                path = os.path.join(uploads, reference_name(ref['id']))
+                if not os.path.exists(path):
+                    with open(path, 'wb') as f:
+                        f.write(synthetic_image(ref.get('bytes'), ref['id']))
+
+        env = dict(os.environ)
+        env.update({
+            'GEMINI_API_KEY': 'replay',
+            'UPLOAD_FOLDER': uploads,
+            'OUTPUT_FOLDER': os.path.join(workdir, 'output'),
+            'LOG_FOLDER': os.path.join(workdir, 'logs'),
+            'HISTORY_DB': os.path.join(workdir, 'history.db'),
+            'IDEMPOTENCY_DB': os.path.join(workdir, 'idempotency.db'),
+            'CAPTURE_ENABLED': 'false',
+            'RATE_LIMIT_ASSIST': '1000000',
+            'RATE_LIMIT_UPLOAD': '1000000',
+            # Probes and warm-up would call the stub outside the replayed traffic
+            'START_BACKGROUND_SERVICES': 'false',
+            'WARMUP_IMPORTS': 'false',
+        })
+        env['PYTHONPATH'] = build + os.pathsep + env.get('PYTHONPATH', '')
+        config = {'build': build, 'port_file': os.path.join(workdir, 'port'), 'speed': speed,
+                  'seed': seed, 'latencies': upstream_latencies(records)}
+        log_path = os.path.join(workdir, 'server.log')
+        with open(log_path, 'wb') as log:
+            proc = subprocess.Popen([sys.executable, '-c', _CHILD_SCRIPT, json.dumps(config)],
+                                    cwd=build, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base_url = f'http://127.0.0.1:{_wait_for_server(proc, config["port_file"], log_path)}'
+            t0 = records[0]['t']
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = []
+                for record, request in zip(records, requests):
+                    scheduled = start + (record['t'] - t0) / speed
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(pool.submit(_send, base_url, request, scheduled))
+                results = [future.result() for future in futures]
+            duration = time.perf_counter() - start
+            with urllib.request.urlopen(base_url + '/__replay/upstream', timeout=5) as response:
+                upstream = json.loads(response.read())
+        finally:
+            proc.terminate()
+            proc.wait(10)
+        report = summarize(results, duration, upstream)
+        report['build'] = build
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _change(before, after) -> str:
+    if before is None or after is None:
+        return ''
+    if before == 0:
+        return '' if after == 0 else 'new'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def format_report(capture: Dict[str, Any], runs: List[Dict[str, Any]], speed: float) -> str:
+    """Side-by-side table of the capture and each build, with the change between two builds"""
+    rows = [
+        ('requests', lambda r: r['requests']),
+        ('throughput (req/s)', lambda r: r['throughput_rps']),
+        ('latency p50 (ms)', lambda r: r['latency_ms']['p50']),
+        ('latency p95 (ms)', lambda r: r['latency_ms']['p95']),
+        ('latency p99 (ms)', lambda r: r['latency_ms']['p99']),
+        ('errors', lambda r: r['errors']),
+        ('shed (503)', lambda r: r['shed']),
+        ('cache hit rate', lambda r: r['cache_hit_rate']),
+        ('local preset rate', lambda r: r['local_rate']),
+        ('LLM calls', lambda r: (r['upstream_calls'] or {}).get('llm')),
+        ('image calls', lambda r: (r['upstream_calls'] or {}).get('banana')),
+    ]
+    names = ['capture'] + [os.path.basename(run['build'].rstrip(os.sep)) or run['build'] for run in runs]
+    header = f"{'':<20}" + ''.join(f'{name[:14]:>15}' for name in names)
+    if len(runs) == 2:
+        header += f"{'change':>10}"
+    lines = [f"Replayed at {speed:g}x speed; capture figures are in real time", header]
+
+    def fmt(v):
+        if v is None:
+            return '-'
+        if isinstance(v, float):
+            return f'{v:.3f}' if v < 1 else f'{v:.1f}'
+        return str(v)
+
+    for label, get in rows:
+        values = [get(capture)] + [get(run) for run in runs]
+        line = f'{label:<20}' + ''.join(f'{fmt(v):>15}' for v in values)
+        if len(runs) == 2:
+            line += f'{_change(values[1], values[2]):>10}'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='JSON Lines file written with CAPTURE_ENABLED=true')
+    parser.add_argument('--build', action='append', default=None,
+                        help='checkout to replay against; give twice to compare (default: this tree)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='divide arrival gaps and upstream latency by this factor')
+    parser.add_argument('--concurrency', type=int, default=64, help='most requests in flight')
+    parser.add_argument('--limit', type=int, default=None, help='replay only the first N requests')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the upstream latency draws')
+    parser.add_argument('--json', action='store_true', help='print the raw reports as JSON')
+    args = parser.parse_args(argv)
+
+    builds = args.build or [PROJECT_ROOT]
+    if len(builds) > 2:
+        parser.error('at most two builds can be compared')
+    records = load_capture(args.capture, args.limit)
+    if not records:
+        parser.error('the capture is empty')
+
+    capture = summarize_capture(records)
+    runs = [run_build(records, build, args.speed, args.concurrency, args.seed) for build in builds]
+    if args.json:
+        print(json.dumps({'capture': capture, 'builds': runs}, indent=2))
+        return
+    print(format_report(capture, runs, args.speed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Startup profile: import time per module and time to first healthy response
+
+Usage:
+    python -m bananaai.tools.startup_profile [--top 20] [--json]
+
+Starts a fresh interpreter with ``-X importtime``, builds the app, serves
+``GET /health/check`` through the test client and reports where the time
+went. Background warm-up is disabled in the child so the numbers reflect
+what a cold start has to do before it can answer.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, Any, List
+
+# Modules that must not be loaded before the first health check
+HEAVY_MODULES = ('google.generativeai', 'grpc', 'google.protobuf', 'PIL.Image', 'boto3')
+
+_CHILD_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+from app import create_app
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/health/check')
+healthy = time.perf_counter()
+print(json.dumps({
+    'create_app': created - start,
+    'first_response': healthy - created,
+    'status': response.status_code,
+    'heavy_loaded': [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parse ``-X importtime`` output
+
+    Returns:
+        One entry per module with self and cumulative time in milliseconds
+        and its nesting depth
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        head, cumulative_us, name = line.split('|', 2)
+        self_us = head.split(':', 1)[1]
+        name = name[1:]  # leading spaces after the separator encode nesting
+        modules.append({
+            'module': name.strip(),
+            'depth': (len(name) - len(name.lstrip(' '))) // 2,
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+        })
+    return modules
+
+
+def profile_startup(project_root: str = None) -> Dict[str, Any]:
+    """
+    Measure a cold start in a child interpreter
+
+    Returns:
+        Dictionary with ``time_to_healthy`` (seconds from process spawn to
+        the first successful health response), the in-process breakdown,
+        the heavy modules that were loaded and the parsed import times
+    """
+    project_root = project_root or os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env.setdefault('GEMINI_API_KEY', 'startup-profile')
+    env['WARMUP_IMPORTS'] = 'false'
+    env['START_BACKGROUND_SERVICES'] = 'false'
+    env['PYTHONPATH'] = project_root + os.pathsep + env.get('PYTHONPATH', '')
+
+    spawned = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD_SCRIPT],
+        cwd=project_root, env=env, capture_output=True, text=True, timeout=120,
+    )
+    elapsed = time.perf_counter() - spawned
+    if proc.returncode != 0:
+        raise RuntimeError(f"Startup profile child failed:\n{proc.stderr[-2000:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['time_to_healthy'] = elapsed
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=20, help='number of modules to list')
+    parser.add_argument('--json', action='store_true', help='print the raw result as JSON')
+    args = parser.parse_args(argv)
+
+    result = profile_startup()
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"Time to first healthy response: {result['time_to_healthy'] * 1000:.0f} ms "
+          f"(create_app {result['create_app'] * 1000:.0f} ms, "
+          f"first request {result['first_response'] * 1000:.0f} ms)")
+    print(f"Heavy modules loaded at startup: {', '.join(result['heavy_loaded']) or 'none'}")
+    print()
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    top = sorted(result['imports'], key=lambda m: m['cumulative_ms'], reverse=True)[:args.top]
+    for module in top:
+        print(f"{module['cumulative_ms']:>14.1f} {module['self_ms']:>9.1f}  {module['module']}")
+
+
+if __name__ == '__main__':
+    main()
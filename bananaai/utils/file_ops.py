@@ -1,9 +1,14 @@
 import os
 import time
+import shutil
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional
+from ..services.file_index import file_index
+from ..services.storage import storage
+from ..services.metrics import UPLOADED_BYTES, GENERATED_BYTES
+from ..middleware.tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -24,17 +29,55 @@ def save_uploaded_file(file, upload_folder: str) -> Optional[str]:
     try:
         filename = sanitize_filename(file.filename)
         filepath = os.path.join(upload_folder, filename)
-        file.save(filepath)
-        logger.info(f"File saved: {filename}")
-        return filename
+        with span('disk_write'):
+            file.save(filepath)
+        return _register_upload(upload_folder, filename)
     except Exception as e:
         logger.error(f"Error saving file: {e}")
         return None
 
 
+def save_uploaded_path(path: str, original_name: str, upload_folder: str) -> Optional[str]:
+    """
+    Move a file assembled elsewhere (a chunked upload) into the upload folder
+    
+    Args:
+        path: The assembled file; it is moved, not copied
+        original_name: The client's file name
+        upload_folder: Directory to save files
+    
+    Returns:
+        Saved filename or None if error
+    """
+    from .validators import sanitize_filename
+    
+    try:
+        filename = sanitize_filename(original_name)
+        with span('disk_write'):
+            shutil.move(path, os.path.join(upload_folder, filename))
+        return _register_upload(upload_folder, filename)
+    except Exception as e:
+        logger.error(f"Error saving file: {e}")
+        return None
+
+
+def _register_upload(upload_folder: str, filename: str) -> Optional[str]:
+    """Index, count and publish a file just written to the upload folder"""
+    size = os.path.getsize(os.path.join(upload_folder, filename))
+    file_index.record_write(upload_folder, filename, size)
+    UPLOADED_BYTES.inc(size)
+    if not storage.publish(upload_folder, filename):
+        return None
+    logger.debug("File saved: %s", filename)
+    return filename
+
+
 def cleanup_old_files(upload_folder: str, hours: int = 24):
     """
-    Remove files older than specified hours
+    Remove files older than specified hours in one pass
+    
+    The app itself relies on the background janitor
+    (``bananaai.services.janitor``); this is a one-shot helper for scripts.
     
     Args:
         upload_folder: Directory containing uploaded files
@@ -48,6 +91,7 @@ def cleanup_old_files(upload_folder: str, hours: int = 24):
                 file_age = file_path.stat().st_mtime
                 if file_age < cutoff_time:
                     file_path.unlink()
+                    file_index.record_delete(upload_folder, file_path.name)
                     logger.info(f"Deleted old file: {file_path.name}")
     except Exception as e:
         logger.error(f"Error during file cleanup: {e}")
@@ -69,13 +113,14 @@ def get_file_url(filename: str, base_url: str = '') -> str:
     return f"/uploads/{filename}"
 
 
-def generate_output_filename(prompt: str, aspect_ratio: str = "9:16") -> str:
+def generate_output_filename(prompt: str, aspect_ratio: str = "9:16", variant: int = 0) -> str:
     """
     Generate filename for generated image
     
     Args:
         prompt: Original prompt text
         aspect_ratio: Image aspect ratio
+        variant: Index of the image among variants generated together
     
     Returns:
         Generated filename
@@ -91,8 +136,9 @@ def generate_output_filename(prompt: str, aspect_ratio: str = "9:16") -> str:
     # Add timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     ar_suffix = aspect_ratio.replace(':', 'x')
+    variant_suffix = f"_v{variant + 1}" if variant else ""
     
-    return f"{timestamp}_{clean_prompt}_{ar_suffix}.png"
+    return f"{timestamp}_{clean_prompt}_{ar_suffix}{variant_suffix}.png"
 
 
 def save_generated_image(image_data, output_folder: str, filename: str) -> Optional[str]:
@@ -107,51 +153,25 @@ def save_generated_image(image_data, output_folder: str, filename: str) -> Optio
     Returns:
         Full filepath if successful, None otherwise
     """
-    import base64
     from pathlib import Path
+    from .image_codec import write_inline_data
     
     try:
         # Ensure output folder exists
         Path(output_folder).mkdir(exist_ok=True)
         
-        # Handle different input types
-        if isinstance(image_data, bytes):
-            # Check if it's raw image data (starts with image magic numbers)
-            # PNG: 0x89 0x50 0x4E 0x47 (‰PNG)
-            # JPEG: 0xFF 0xD8 0xFF
-            # GIF: 0x47 0x49 0x46 (GIF)
-            if (image_data[:4] == b'\x89PNG' or 
-                image_data[:3] == b'\xff\xd8\xff' or 
-                image_data[:3] == b'GIF'):
-                # It's already raw image binary data
-                final_image_data = image_data
-            else:
-                # It's base64 encoded bytes - decode it
-                try:
-                    final_image_data = base64.b64decode(image_data)
-                except:
-                    # Try decoding as UTF-8 first then base64
-                    image_str = image_data.decode('utf-8')
-                    final_image_data = base64.b64decode(image_str)
-        elif isinstance(image_data, str):
-            # String input - handle data URL or plain base64
-            if image_data.startswith('data:image'):
-                # Remove data URL prefix
-                image_data = image_data.split(',')[1]
-            
-            # Decode base64 string
-            final_image_data = base64.b64decode(image_data)
-        else:
-            raise ValueError(f"Unsupported image data type: {type(image_data)}")
-        
         # Full file path
         filepath = os.path.join(output_folder, filename)
         
-        # Save to file
-        with open(filepath, 'wb') as f:
-            f.write(final_image_data)
+        # Decode (if base64) in chunks straight into the file and fsync it,
+        # post-processing happens later in the image pipeline
+        size = write_inline_data(image_data, filepath)
+        file_index.record_write(output_folder, filename, size)
+        GENERATED_BYTES.inc(size)
+        if not storage.publish(output_folder, filename):
+            return None
         
-        logger.info(f"Generated image saved: {filepath}")
+        logger.info("Generated image saved: %s", filepath)
         return filepath
         
     except Exception as e:
@@ -0,0 +1,194 @@
+import os
+import time
+import base64
+import binascii
+import logging
+from typing import Optional, Union
+from ..middleware.tracing import add_span
+
+logger = logging.getLogger(__name__)
+
+# Base64 characters decoded per step; a multiple of 4 so chunks stay aligned
+DECODE_CHUNK_CHARS = 1024 * 1024
+
+# Longest data URL header we look for (e.g. "data:image/png;base64,")
+MAX_DATA_URL_HEADER = 128
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+InlineData = Union[bytes, bytearray, memoryview, str]
+
+
+def sniff_image_type(head) -> Optional[str]:
+    """
+    Detect the image MIME type from the first bytes of a file
+
+    Args:
+        head: At least the first 12 bytes of the image (bytes-like)
+
+    Returns:
+        MIME type or None if the bytes are not a supported image
+    """
+    head = bytes(head[:12])
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _base64_offset(data: InlineData) -> int:
+    """Return where the base64 payload starts, skipping a data URL header"""
+    header = data[:MAX_DATA_URL_HEADER]
+    if not isinstance(header, str):
+        # Copies at most MAX_DATA_URL_HEADER bytes, never the payload
+        header = bytes(header)
+    if header[:5] not in ('data:', b'data:'):
+        return 0
+
+    pos = header.find(',' if isinstance(header, str) else b',')
+    if pos < 0:
+        raise ValueError("Malformed data URL")
+    return pos + 1
+
+
+def _base64_source(data: InlineData):
+    """
+    Classify ``data`` as raw image bytes or base64
+
+    Returns:
+        Tuple of (raw_view, base64_source, payload_offset); exactly one of
+        raw_view and base64_source is set
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = memoryview(data).cast('B')
+        if sniff_image_type(view[:12]):
+            return view, None, 0
+        return None, view, _base64_offset(view)
+    if isinstance(data, str):
+        return None, data, _base64_offset(data)
+    raise ValueError(f"Unsupported image data type: {type(data)}")
+
+
+def _iter_base64_chunks(source, start: int):
+    """
+    Decode base64 ``DECODE_CHUNK_CHARS`` characters at a time
+
+    Only one chunk of input and output is alive at once. Raises
+    ``binascii.Error`` if embedded whitespace breaks chunk alignment; callers
+    then fall back to a one-shot decode.
+    """
+    for pos in range(start, len(source), DECODE_CHUNK_CHARS):
+        yield binascii.a2b_base64(source[pos:pos + DECODE_CHUNK_CHARS])
+
+
+def _check_image(head):
+    if not sniff_image_type(head[:12]):
+        raise ValueError("Decoded data is not a supported image")
+
+
+def write_inline_data(data: InlineData, filepath: str) -> int:
+    """
+    Decode ``inline_data`` from Gemini straight into a file
+
+    Accepts raw image bytes or base64 (str or bytes, optionally as a data
+    URL). The payload is validated against known image signatures before
+    anything is written, and the file is fsynced before returning.
+
+    Args:
+        data: Raw or base64-encoded image data
+        filepath: Destination path
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        ValueError: If the data is not a supported image
+    """
+    started = time.perf_counter()
+    raw, source, start = _base64_source(data)
+    written = 0
+    # Decoding and writing interleave per chunk; time the writes and
+    # attribute the rest to decoding
+    write_seconds = 0.0
+    try:
+        with open(filepath, 'wb') as f:
+            if raw is not None:
+                t = time.perf_counter()
+                written = f.write(raw)
+                write_seconds += time.perf_counter() - t
+            else:
+                try:
+                    for chunk in _iter_base64_chunks(source, start):
+                        if written == 0:
+                            _check_image(chunk)
+                        t = time.perf_counter()
+                        written += f.write(chunk)
+                        write_seconds += time.perf_counter() - t
+                except binascii.Error:
+                    logger.debug("Chunked base64 decode misaligned, decoding in one pass")
+                    payload = base64.b64decode(source[start:])
+                    _check_image(payload)
+                    f.seek(0)
+                    f.truncate()
+                    t = time.perf_counter()
+                    written = f.write(payload)
+                    write_seconds = time.perf_counter() - t
+
+            if written == 0:
+                raise ValueError("Image data is empty")
+            t = time.perf_counter()
+            f.flush()
+            os.fsync(f.fileno())
+            write_seconds += time.perf_counter() - t
+    except Exception:
+        if os.path.exists(filepath):
+            os.unlink(filepath)
+        raise
+
+    if raw is None:
+        add_span('b64_decode', time.perf_counter() - started - write_seconds)
+    add_span('disk_write', write_seconds, bytes=written)
+    return written
+
+
+def decode_inline_data(data: InlineData) -> memoryview:
+    """
+    Decode ``inline_data`` into a single pre-sized buffer
+
+    For callers that need the image in memory rather than on disk. Raw bytes
+    are returned as a view of the input without copying.
+
+    Args:
+        data: Raw or base64-encoded image data
+
+    Returns:
+        Read-only memoryview over the decoded image
+
+    Raises:
+        ValueError: If the data is not a supported image
+    """
+    raw, source, start = _base64_source(data)
+    if raw is not None:
+        return raw.toreadonly()
+
+    # 3 bytes per 4 base64 characters is an upper bound for the output
+    buffer = bytearray((len(source) - start) * 3 // 4 + 3)
+    pos = 0
+    try:
+        for chunk in _iter_base64_chunks(source, start):
+            buffer[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+    except binascii.Error:
+        buffer = bytearray(base64.b64decode(source[start:]))
+        pos = len(buffer)
+
+    view = memoryview(buffer)[:pos]
+    _check_image(view)
+    return view.toreadonly()
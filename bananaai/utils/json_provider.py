@@ -0,0 +1,62 @@
+import typing as t
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib provider
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by ``orjson``
+
+    Keeps Flask's output contract (sorted keys, the same ``default``
+    fallback for dates, Decimal, ``__html__`` and friends) but serialises
+    several times faster and builds the response body as bytes directly.
+    Non-ASCII text (Thai prompts) is written as UTF-8 rather than ``\\u``
+    escapes, which is also smaller on the wire.
+    """
+
+    def _options(self, **kwargs) -> int:
+        # Dates go through ``default`` so they keep Flask's HTTP date format
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj: t.Any, **kwargs: t.Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options(**kwargs)).decode()
+
+    def loads(self, s: t.Union[str, bytes], **kwargs: t.Any) -> t.Any:
+        return orjson.loads(s)
+
+    def response(self, *args: t.Any, **kwargs: t.Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent=pretty))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'default': DefaultJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def init_json_provider(app):
+    """
+    Install the JSON provider named by ``JSON_PROVIDER``
+
+    ``orjson`` (the default) falls back to Flask's provider when the package
+    is not installed.
+    """
+    name = app.config.get('JSON_PROVIDER', 'orjson')
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f"Unknown JSON_PROVIDER: {name}")
+    if name == 'orjson' and orjson is None:
+        name = 'default'
+    app.json = JSON_PROVIDERS[name](app)
+    app.logger.info(f"Using {name} JSON provider")
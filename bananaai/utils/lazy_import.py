@@ -0,0 +1,26 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access
+
+    Lets modules keep a top-level ``genai = LazyModule('google.generativeai')``
+    without paying for the SDK (gRPC, protobuf, ...) at app start.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<LazyModule {self._name} ({state})>"
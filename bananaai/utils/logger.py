@@ -1,30 +1,174 @@
 import logging
 import logging.handlers
 import os
+import json
+import queue
+import threading
+import traceback
 from pathlib import Path
+from typing import Dict, Optional
+from ..middleware.tracing import RequestIdFilter
+
+# Attributes every LogRecord has; anything else was passed via ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request id and any ``extra`` fields"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = ''.join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records below WARNING for selected loggers
+
+    Rates come from ``LOG_SAMPLING``, e.g.
+    ``bananaai.services.banana_client=10,bananaai.routes.api=5``. A rate
+    applies to the named logger and its children. Warnings and errors are
+    never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate > 1}
+        self._seen: Dict[str, int] = {}
+        self._resolved: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str) -> Dict[str, int]:
+        rates = {}
+        for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+            name, _, rate = item.partition('=')
+            rates[name.strip()] = int(rate)
+        return rates
+
+    def _rate(self, name: str) -> int:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, prefix = 1, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate == 1:
+            return True
+        with self._lock:
+            seen = self._seen.get(record.name, 0)
+            self._seen[record.name] = seen + 1
+        return seen % rate == 0
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """Hand records to a listener thread that formats and writes them
+
+    The request thread only runs the filters and enqueues the record; the
+    message is formatted and written to the console and file on the
+    listener thread. Threads do not survive fork, so the first record
+    logged in a new process starts that process's own listener.
+    """
+
+    def __init__(self, handlers, max_queue: int = 10000):
+        super().__init__(queue.Queue(max_queue))
+        self.handlers = handlers
+        self.max_queue = max_queue
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def _ensure_listener(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A queue inherited across fork may hold a lock taken by a
+            # thread that no longer exists; start over with a new one
+            self.queue = queue.Queue(self.max_queue)
+            self.listener = logging.handlers.QueueListener(
+                self.queue, *self.handlers, respect_handler_level=True
+            )
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Same process, so the record does not need to be pickled; leave the
+        # message unformatted for the listener thread
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request on logging
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        super().close()
+
+
+def _remove_installed_handlers(root_logger):
+    """Detach handlers added by an earlier ``setup_logging`` call"""
+    for handler in list(root_logger.handlers):
+        if getattr(handler, '_bananaai', False):
+            root_logger.removeHandler(handler)
+            handler.close()
 
 
 def setup_logging(app):
-    """Setup structured logging for the application"""
-    
+    """Setup structured logging for the application
+
+    Safe to call once per ``create_app()``: handlers from a previous call are
+    replaced, not stacked. With ``LOG_MODE=async`` (the default) formatting
+    and I/O run on a listener thread; ``LOG_FORMAT=json`` writes one JSON
+    object per line.
+    """
+
     log_level = os.getenv('LOG_LEVEL', 'INFO')
     log_folder = app.config.get('LOG_FOLDER', 'logs')
-    
+    json_logs = app.config.get('LOG_FORMAT', 'text') == 'json'
+
     # Create log directory if it doesn't exist
     Path(log_folder).mkdir(exist_ok=True)
-    
+
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level.upper()))
-    
+    _remove_installed_handlers(root_logger)
+
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
     console_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
     )
-    console_handler.setFormatter(console_formatter)
-    
+    console_handler.setFormatter(JsonFormatter() if json_logs else console_formatter)
+
     # File handler with rotation
     file_handler = logging.handlers.RotatingFileHandler(
         os.path.join(log_folder, 'app.log'),
@@ -33,16 +177,28 @@ def setup_logging(app):
     )
     file_handler.setLevel(logging.DEBUG)
     file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(funcName)s:%(lineno)d - %(message)s'
+        '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(funcName)s:%(lineno)d - %(message)s'
     )
-    file_handler.setFormatter(file_formatter)
-    
-    # Add handlers
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
+    file_handler.setFormatter(JsonFormatter() if json_logs else file_formatter)
+
+    if app.config.get('LOG_MODE', 'async') == 'async':
+        handlers = [AsyncQueueHandler([console_handler, file_handler],
+                                      app.config.get('LOG_QUEUE_SIZE', 10000))]
+    else:
+        handlers = [console_handler, file_handler]
+
+    # Add handlers; filters run before a record is queued, on the thread that
+    # logged it, where the request id is known
+    sampling = SamplingFilter.parse(app.config.get('LOG_SAMPLING', ''))
+    for handler in handlers:
+        handler.addFilter(RequestIdFilter())
+        if sampling:
+            handler.addFilter(SamplingFilter(sampling))
+        handler._bananaai = True
+        root_logger.addHandler(handler)
+
     # Reduce noise from libraries
     logging.getLogger('werkzeug').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
-    
-    app.logger.info("Logging initialized")
\ No newline at end of file
+
+    app.logger.info("Logging initialized")
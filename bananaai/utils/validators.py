@@ -66,6 +66,23 @@ def validate_image_file(file) -> Tuple[bool, str]:
     return True, ""
 
 
+def is_safe_filename(filename: str) -> bool:
+    """
+    Check that a client-supplied filename refers to a file inside a folder
+    
+    Args:
+        filename: Filename from a request (e.g. a reference image name)
+    
+    Returns:
+        True if the name has no path components
+    """
+    if not filename or not isinstance(filename, str):
+        return False
+    if filename in ('.', '..') or '\x00' in filename:
+        return False
+    return os.path.basename(filename) == filename and '\\' not in filename
+
+
 def sanitize_filename(filename: str) -> str:
     """
     Sanitize filename to prevent directory traversal attacks
@@ -0,0 +1,39 @@
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Modules deferred at startup that the first real request will need
+WARMUP_MODULES = (
+    'google.generativeai',
+    'PIL.Image',
+    'PIL.PngImagePlugin',
+    'PIL.JpegImagePlugin',
+)
+
+
+def _import_all(modules):
+    start = time.perf_counter()
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Warm-up import of {name} failed: {e}")
+    logger.info(f"Warm-up imports finished in {time.perf_counter() - start:.2f}s")
+
+
+def start_warmup(modules=WARMUP_MODULES) -> threading.Thread:
+    """
+    Import heavy modules on a background thread after startup
+    
+    The app can answer health checks right away; the first upstream request
+    usually finds the SDK already loaded.
+    
+    Returns:
+        The started daemon thread
+    """
+    thread = threading.Thread(target=_import_all, args=(modules,), name='import-warmup', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,111 @@
+"""Gunicorn configuration for production
+
+Started by ``gunicorn -c gunicorn.conf.py wsgi:app``. Worker and thread
+counts are derived from the CPUs and memory available to the container and
+can be overridden with ``WEB_CONCURRENCY`` and ``WEB_THREADS``.
+"""
+import gc
+import os
+import glob
+import tempfile
+
+
+def _cpu_count() -> int:
+    """CPUs available to this container, honouring cgroup quotas"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2 quota, e.g. "200000 100000" for 2 CPUs
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def _memory_limit_mb():
+    """Container memory limit in MB, or None if unlimited/unknown"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    return None
+
+
+def _worker_count(cpus: int, memory_mb) -> int:
+    """Workers for ``cpus`` CPUs and a memory limit in MB (None if unlimited)"""
+    if os.getenv('WEB_CONCURRENCY'):
+        return int(os.environ['WEB_CONCURRENCY'])
+
+    workers = 2 * cpus + 1
+    if memory_mb:
+        # Leave room for the master process and the page cache
+        per_worker_mb = int(os.getenv('WEB_WORKER_MEMORY_MB', '256'))
+        workers = min(workers, max(1, (memory_mb - 128) // per_worker_mb))
+    return max(1, workers)
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# Requests mostly wait on Gemini, so each worker runs a thread pool
+worker_class = 'gthread'
+workers = _worker_count(_cpu_count(), _memory_limit_mb())
+# The app splits per-process budgets (upstream key rpm) by the worker count
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('WEB_THREADS', '8'))
+
+# Import the app (SDKs, templates, file index) once in the master; workers
+# share those pages copy-on-write
+preload_app = True
+
+# Image generation can take a while; recycle workers gradually to bound
+# memory growth without restarting them all at once
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('WEB_MAX_REQUESTS_JITTER', '100'))
+
+accesslog = '-'
+errorlog = '-'
+
+# Background threads do not survive fork; start them in each worker instead
+os.environ.setdefault('APP_ENV', 'production')
+os.environ['START_BACKGROUND_SERVICES'] = 'false'
+
+# Workers write metric snapshots here and /health/metrics sums them
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'bananaai-metrics'))
+
+
+def on_starting(server):
+    # Snapshots from a previous run belong to other processes; start at zero
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.unlink(path)
+
+
+def when_ready(server):
+    # Move everything allocated during preload into the permanent generation
+    # so the collector never touches (and un-shares) those pages in workers
+    gc.freeze()
+    server.log.info(f"Frozen {gc.get_freeze_count()} objects after preload; "
+                    f"{workers} workers x {threads} threads")
+
+
+def post_worker_init(worker):
+    from app import start_background_services
+    start_background_services(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    # Keep this worker's counts after max_requests recycles it
+    from bananaai.services.metrics import metrics
+    metrics.flush()
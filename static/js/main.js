@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const charCount = document.getElementById('charCount');
     const assistBtn = document.getElementById('assistBtn');
     const generateBtn = document.getElementById('generateBtn');
+    const createBtn = document.getElementById('createBtn');
     const resultSection = document.getElementById('resultSection');
     const expandedPrompt = document.getElementById('expandedPrompt');
     const copyBtn = document.getElementById('copyBtn');
@@ -33,13 +34,30 @@ document.addEventListener('DOMContentLoaded', function() {
     const generatedSeed = document.getElementById('generatedSeed');
     const downloadBtn = document.getElementById('downloadBtn');
     const clearGeneratedBtn = document.getElementById('clearGeneratedBtn');
+    const generatedVariants = document.getElementById('generatedVariants');
+    const numImages = document.getElementById('numImages');
 
     // Store uploaded files
     let uploadedFiles = {};
     let imageCounter = 0;
 
-    // CSRF Token
+    // Upload settings rendered into the page from the server config
+    const maxUploadEdge = parseInt(uploadContainer.dataset.maxEdge, 10) || 0;
+    const uploadQuality = (parseInt(uploadContainer.dataset.jpegQuality, 10) || 90) / 100;
+    const uploadChunkBytes = parseInt(uploadContainer.dataset.chunkBytes, 10) || 1024 * 1024;
+
+    // Idempotency-Key for /api/generate; randomUUID needs a secure context
+    function newIdempotencyKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    // CSRF Token (set as a cookie by the index page, which is cached)
     function getCSRFToken() {
+        const match = document.cookie.match(/(?:^|;\s*)csrf_token=([^;]*)/);
+        if (match) return decodeURIComponent(match[1]);
         const meta = document.querySelector('meta[name="csrf-token"]');
         return meta ? meta.getAttribute('content') : '';
     }
@@ -175,22 +193,152 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Upload file to server
-    async function uploadFile(file, itemId) {
+    // Downscale to the configured long edge and re-encode before uploading,
+    // so a 10 MB phone photo is sent as a few hundred KB. GIFs and images the
+    // browser cannot decode are sent as they are.
+    async function downscaleImage(file) {
+        if (!maxUploadEdge || !window.createImageBitmap || !/^image\/(jpeg|png|webp)$/.test(file.type)) {
+            return file;
+        }
+        let bitmap;
+        try {
+            bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        } catch (error) {
+            return file;
+        }
+        const scale = Math.min(1, maxUploadEdge / Math.max(bitmap.width, bitmap.height));
+        if (scale === 1 && file.size <= uploadChunkBytes) {
+            bitmap.close();
+            return file;
+        }
+
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.max(1, Math.round(bitmap.width * scale));
+        canvas.height = Math.max(1, Math.round(bitmap.height * scale));
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+
+        // PNG keeps its transparency; everything else becomes JPEG
+        const type = file.type === 'image/png' ? 'image/png' : 'image/jpeg';
+        const blob = await new Promise(resolve => canvas.toBlob(resolve, type, uploadQuality));
+        if (!blob || blob.size >= file.size) {
+            return file;
+        }
+        const name = file.name.replace(/\.[^.]*$/, '') + (type === 'image/png' ? '.png' : '.jpg');
+        return new File([blob], name, { type: type });
+    }
+
+    async function sha256Hex(blob) {
+        const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+    // Whole file in one request
+    async function uploadWhole(file, itemId) {
         const formData = new FormData();
         formData.append('image_file', file);
         formData.append('image_id', itemId);
 
-        try {
-            const response = await fetch('/api/upload', {
-                method: 'POST',
-                headers: {
-                    'X-CSRFToken': getCSRFToken()
-                },
-                body: formData
-            });
+        const response = await fetch('/api/upload', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: formData
+        });
+        return { response, data: await response.json() };
+    }
 
-            const data = await response.json();
+    // Resumable upload: each chunk is sent at the offset the server reports,
+    // so a dropped connection costs one chunk instead of the whole file
+    async function uploadChunked(file) {
+        let response = await fetch('/api/upload/sessions', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCSRFToken()
+            },
+            body: JSON.stringify({ filename: file.name, size: file.size, sha256: await sha256Hex(file) })
+        });
+        let data = await response.json();
+        if (!response.ok) {
+            return { response, data };
+        }
+
+        const session = `/api/upload/sessions/${data.upload_id}`;
+        const chunkSize = data.chunk_size || uploadChunkBytes;
+        let offset = data.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            try {
+                response = await fetch(session, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(offset),
+                        'X-CSRFToken': getCSRFToken()
+                    },
+                    body: file.slice(offset, offset + chunkSize)
+                });
+                data = await response.json();
+                // 409: the server has a different offset; continue from there
+                if (response.ok || response.status === 409) {
+                    offset = data.offset;
+                    failures = 0;
+                    continue;
+                }
+                // Chunks are rate limited; wait it out and resend
+                if (response.status === 429) {
+                    await sleep(Math.ceil(data.retry_after || 60) * 1000);
+                    continue;
+                }
+                if (response.status < 500) {
+                    return { response, data };
+                }
+            } catch (networkError) {
+                // Resend after asking the server how much it has
+            }
+
+            failures++;
+            if (failures > 5) {
+                throw new Error('Chunked upload failed');
+            }
+            await sleep(Math.min(1000 * 2 ** failures, 15000));
+            try {
+                const status = await fetch(session);
+                if (status.status === 404) {
+                    return { response: status, data: await status.json() };
+                }
+                if (status.ok) {
+                    offset = (await status.json()).offset;
+                }
+            } catch (networkError) {
+                // Still offline; the next attempt retries
+            }
+        }
+
+        response = await fetch(`${session}/complete`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': getCSRFToken()
+            }
+        });
+        return { response, data: await response.json() };
+    }
+
+    // Upload file to server
+    async function uploadFile(file, itemId) {
+        try {
+            const prepared = await downscaleImage(file);
+            // Hashing needs a secure context; without it large files go whole
+            const chunked = prepared.size > uploadChunkBytes && window.crypto && crypto.subtle;
+            const { response, data } = chunked
+                ? await uploadChunked(prepared)
+                : await uploadWhole(prepared, itemId);
 
             if (response.ok) {
                 uploadedFiles[itemId] = {
@@ -269,7 +417,8 @@ document.addEventListener('DOMContentLoaded', function() {
             // Prepare request data with image references
             const requestData = {
                 prompt: prompt,
-                aspect_ratio: aspectRatio
+                aspect_ratio: aspectRatio,
+                refine: document.getElementById('refineWithAI').checked
             };
 
             // Add uploaded image references if available
@@ -298,6 +447,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 displayResult(data.expanded);
                 if (data.cached) {
                     showMessage('ใช้ผลลัพธ์จาก cache', 'info');
+                } else if (data.source === 'local') {
+                    showMessage(`ใช้สไตล์สำเร็จรูป: ${data.preset}`, 'info');
                 }
             } else if (response.status === 429) {
                 const retryAfter = Math.ceil(data.retry_after || 60);
@@ -369,7 +520,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 aspect_ratio: aspectRatio,
                 negative_prompt: negativePrompt.value.trim(),
                 guidance_scale: parseFloat(guidanceScale.value),
-                num_inference_steps: parseInt(inferenceSteps.value)
+                num_inference_steps: parseInt(inferenceSteps.value),
+                n: parseInt(numImages.value) || 1
             };
 
             // Add reference images if uploaded
@@ -385,14 +537,24 @@ document.addEventListener('DOMContentLoaded', function() {
 
             console.log('Sending generate request with aspect ratio:', aspectRatio);
 
-            const response = await fetch('/api/generate', {
+            // One key per click: a retry after a dropped connection gets the
+            // image already generated instead of paying for a new one
+            const idempotencyKey = newIdempotencyKey();
+            const sendGenerate = () => fetch('/api/generate', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
-                    'X-CSRFToken': getCSRFToken()
+                    'X-CSRFToken': getCSRFToken(),
+                    'Idempotency-Key': idempotencyKey
                 },
                 body: JSON.stringify(requestData)
             });
+            let response;
+            try {
+                response = await sendGenerate();
+            } catch (networkError) {
+                response = await sendGenerate();
+            }
 
             const data = await response.json();
 
@@ -415,14 +577,151 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Assist + Generate: one request, expanded prompt streamed before the image
+    createBtn.addEventListener('click', async function() {
+        const prompt = userPrompt.value.trim();
+        const aspectRatio = document.querySelector('input[name="aspect_ratio"]:checked').value;
+
+        if (!prompt) {
+            showError('กรุณาใส่ prompt');
+            return;
+        }
+
+        createBtn.disabled = true;
+        createBtn.querySelector('.btn-text').style.display = 'none';
+        createBtn.querySelector('.btn-loading').style.display = 'inline-block';
+
+        try {
+            const requestData = {
+                prompt: prompt,
+                aspect_ratio: aspectRatio,
+                negative_prompt: negativePrompt.value.trim(),
+                guidance_scale: parseFloat(guidanceScale.value),
+                num_inference_steps: parseInt(inferenceSteps.value),
+                n: parseInt(numImages.value) || 1,
+                refine: document.getElementById('refineWithAI').checked
+            };
+
+            const referenceImages = Object.values(uploadedFiles)
+                .filter(fileData => fileData.filename)
+                .map(fileData => fileData.filename);
+            if (referenceImages.length > 0) {
+                requestData.reference_images = referenceImages;
+            }
+
+            const response = await fetch('/api/create', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-CSRFToken': getCSRFToken()
+                },
+                body: JSON.stringify(requestData)
+            });
+
+            if (!response.ok) {
+                const data = await response.json();
+                if (response.status === 429) {
+                    const retryAfter = Math.ceil(data.retry_after || 60);
+                    showError(`คุณส่งคำขอบ่อยเกินไป กรุณารอ ${retryAfter} วินาที`);
+                } else {
+                    showError(data.error || 'เกิดข้อผิดพลาดในการประมวลผล');
+                }
+                return;
+            }
+
+            // Read server-sent events as they arrive
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let event = 'message';
+                    let payload = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) payload += line.slice(6);
+                    }
+                    const data = JSON.parse(payload);
+
+                    if (event === 'expanded') {
+                        displayResult(data.expanded);
+                    } else if (event === 'image') {
+                        displayGeneratedImage(data);
+                        showMessage('รูปภาพถูกสร้างเรียบร้อยแล้ว!', 'success');
+                    } else if (event === 'error') {
+                        showError(data.error || 'เกิดข้อผิดพลาดในการสร้างรูปภาพ');
+                    }
+                }
+            }
+        } catch (error) {
+            showError('ไม่สามารถเชื่อมต่อกับเซิร์ฟเวอร์');
+        } finally {
+            createBtn.disabled = false;
+            createBtn.querySelector('.btn-text').style.display = 'inline-block';
+            createBtn.querySelector('.btn-loading').style.display = 'none';
+        }
+    });
+
+    // The preview is written in the background after the response, so an
+    // image that asks for it too early falls back to the full image
+    function loadPreview(img, image) {
+        img.onerror = null;
+        img.src = image.preview_url || image.url;
+        if (image.preview_url) {
+            img.onerror = () => {
+                img.onerror = null;
+                img.src = image.url;
+            };
+        }
+    }
+
+    // Show one variant in the main image slot: the small preview right away,
+    // swapped for the full image once it has loaded
+    function showVariant(image) {
+        loadPreview(generatedImg, image);
+        if (image.preview_url) {
+            const full = new Image();
+            full.onload = () => {
+                if (generatedImg.src.endsWith(image.preview_url)) generatedImg.src = image.url;
+            };
+            full.src = image.url;
+        }
+        generatedFilename.textContent = image.filename;
+        generatedSize.textContent = `${image.width} x ${image.height}`;
+        generatedSeed.textContent = image.seed || 'N/A';
+        downloadBtn.href = image.url;
+        downloadBtn.download = image.filename;
+    }
+
     // Display generated image
     function displayGeneratedImage(data) {
-        generatedImg.src = data.url;
-        generatedFilename.textContent = data.filename;
-        generatedSize.textContent = `${data.width} x ${data.height}`;
-        generatedSeed.textContent = data.seed || 'N/A';
-        downloadBtn.href = data.url;
-        downloadBtn.download = data.filename;
+        const images = data.images || [data];
+        showVariant(images[0]);
+
+        generatedVariants.innerHTML = '';
+        generatedVariants.style.display = images.length > 1 ? 'flex' : 'none';
+        if (images.length > 1) {
+            images.forEach((image, index) => {
+                const thumb = document.createElement('img');
+                loadPreview(thumb, image);
+                thumb.alt = `Variant ${index + 1}`;
+                thumb.classList.toggle('active', index === 0);
+                thumb.addEventListener('click', () => {
+                    showVariant(image);
+                    generatedVariants.querySelectorAll('img').forEach(el => el.classList.remove('active'));
+                    thumb.classList.add('active');
+                });
+                generatedVariants.appendChild(thumb);
+            });
+        }
         
         generatedSection.style.display = 'block';
         generatedSection.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
@@ -432,6 +731,8 @@ document.addEventListener('DOMContentLoaded', function() {
     clearGeneratedBtn.addEventListener('click', function() {
         generatedSection.style.display = 'none';
         generatedImg.src = '';
+        generatedVariants.innerHTML = '';
+        generatedVariants.style.display = 'none';
         generatedFilename.textContent = '-';
         generatedSize.textContent = '-';
         generatedSeed.textContent = '-';
@@ -0,0 +1,70 @@
+"""Shared fixtures: an app whose state lives under the test's tmp_path"""
+import pytest
+
+from bananaai.middleware.rate_limiter import request_history
+from bananaai.services import banana_client
+
+# Every file and folder the app writes to; pointed at tmp_path for every
+# test, so no test writes into the checkout or sees another test's state
+STATE_PATHS = {
+    'UPLOAD_FOLDER': 'uploads',
+    'OUTPUT_FOLDER': 'output',
+    'LOG_FOLDER': 'logs',
+    'HISTORY_DB': 'history.db',
+    'IDEMPOTENCY_DB': 'idempotency.db',
+    'FILE_INDEX_DB': 'files.db',
+    'METRICS_DIR': 'metrics',
+    'CAPTURE_FILE': 'capture.jsonl',
+    'JANITOR_LOCK_FILE': 'janitor.lock',
+}
+
+# Settings every app test wants unless it says otherwise
+APP_DEFAULTS = {
+    'IMAGE_OPTIMIZE': 'false',
+    'RATE_LIMIT_ASSIST': '1000',
+}
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch, tmp_path):
+    for key, name in STATE_PATHS.items():
+        monkeypatch.setenv(key, str(tmp_path / name))
+
+
+@pytest.fixture
+def app_env():
+    """Environment for the ``app`` fixture; override in a module or parametrize it"""
+    return {}
+
+
+@pytest.fixture
+def fake_model():
+    """Class installed as ``genai.GenerativeModel`` by ``app``; None keeps the SDK's"""
+    return None
+
+
+@pytest.fixture
+def app(isolated_state, monkeypatch, app_env, fake_model):
+    # Requests isolated_state itself: pytest-flask's autouse fixtures build
+    # the app before other autouse fixtures run
+    if fake_model is not None:
+        genai = pytest.importorskip('google.generativeai')
+        monkeypatch.setattr(genai, 'GenerativeModel', fake_model)
+    for key, value in {**APP_DEFAULTS, **app_env}.items():
+        monkeypatch.setenv(key, value)
+
+    # Module-level state of earlier tests
+    request_history.clear()
+    banana_client._candidate_limits.clear()
+
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    yield app
+    request_history.clear()
+    banana_client._candidate_limits.clear()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
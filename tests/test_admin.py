@@ -0,0 +1,93 @@
+"""Tests for the admin profiling hooks"""
+import threading
+import tracemalloc
+
+import pytest
+
+from bananaai.services.profiler import sample_stacks
+
+TOKEN = 'secret-admin-token'
+
+
+@pytest.fixture
+def app_env():
+    return {'ADMIN_TOKEN': TOKEN}
+
+
+@pytest.mark.parametrize('app_env', [{'ADMIN_TOKEN': ''}])
+def test_admin_routes_absent_without_token(client):
+    assert client.get('/admin/cpu', headers={'X-Admin-Token': TOKEN}).status_code == 404
+
+
+def test_admin_requires_token(app):
+    client = app.test_client()
+    assert client.get('/admin/cpu?seconds=0').status_code == 401
+    assert client.get('/admin/cpu?seconds=0', headers={'X-Admin-Token': 'wrong'}).status_code == 401
+
+
+def test_memory_snapshots_and_profiled_request(app):
+    client = app.test_client()
+    auth = {'Authorization': f'Bearer {TOKEN}'}
+
+    assert client.post('/admin/memory/start', headers=auth).get_json() == {'tracing': True}
+    first = client.post('/admin/memory/snapshot', headers=auth).get_json()['id']
+    ballast = [bytearray(1024) for _ in range(1000)]
+    second = client.post('/admin/memory/snapshot', headers=auth).get_json()['id']
+    diff = client.get(f'/admin/memory/diff?from={first}&to={second}', headers=auth).get_json()['diff']
+    assert any(entry['size_diff'] >= 1000 * 1024 for entry in diff)
+    client.post('/admin/memory/stop', headers=auth)
+    del ballast
+
+    response = client.get('/health/check', headers=dict(auth, **{'X-Profile-Request': '1'}))
+    profile_id = response.headers['X-Profile-Id']
+    report = client.get(f'/admin/profiles/{profile_id}', headers=auth)
+    assert report.status_code == 200
+    assert 'health_check' in report.get_data(as_text=True)
+
+
+def test_sample_stacks_sees_busy_thread():
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_worker, name='busy')
+    thread.start()
+    try:
+        collapsed = sample_stacks(0.2, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+
+    busy = [line for line in collapsed.splitlines() if line.startswith('busy;')]
+    assert busy and 'busy_worker' in busy[0]
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in collapsed.splitlines())
+
+
+@pytest.mark.parametrize('method, url', [
+    ('get', '/admin/cpu?seconds=abc'),
+    ('get', '/admin/cpu?seconds=nan'),
+    ('get', '/admin/cpu?interval=-1'),
+    ('post', '/admin/memory/start?frames=ten'),
+    ('post', '/admin/memory/start?frames=0'),
+    ('post', '/admin/memory/snapshot?limit=1.5'),
+    ('get', '/admin/memory/diff?from=1&to=2&limit=x'),
+    ('get', '/admin/memory/diff?from=1&to=2&key=bogus'),
+])
+def test_bad_arguments_are_rejected(app, method, url):
+    client = app.test_client()
+    response = getattr(client, method)(url, headers={'X-Admin-Token': TOKEN})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert not tracemalloc.is_tracing()
+
+
+def test_unknown_profile_sort_is_rejected(app):
+    client = app.test_client()
+    auth = {'X-Admin-Token': TOKEN}
+    profile_id = client.get('/health/check', headers=dict(auth, **{'X-Profile-Request': '1'})).headers['X-Profile-Id']
+
+    response = client.get(f'/admin/profiles/{profile_id}?sort=bogus', headers=auth)
+    assert response.status_code == 400
+    assert client.get(f'/admin/profiles/{profile_id}?sort=tottime', headers=auth).status_code == 200
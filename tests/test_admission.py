@@ -0,0 +1,114 @@
+"""Tests for admission control, fair queuing and load shedding"""
+import time
+import threading
+
+import pytest
+
+from bananaai.middleware.admission import AdmissionQueue, Shed
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def _queue_behind(queue, client, order):
+    """Start a thread that waits for a slot, records it and frees it again"""
+    queued = queue.summary()['queued']
+
+    def run():
+        queue.acquire(client)
+        order.append(client)
+        queue.release(0.0)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_until(lambda: queue.summary()['queued'] == queued + 1)
+    return thread
+
+
+def test_admits_immediately_under_capacity():
+    queue = AdmissionQueue('assist', max_concurrency=2, deadline=1.0)
+    assert queue.acquire('a') == 0.0
+    assert queue.acquire('b') == 0.0
+    assert queue.summary()['inflight'] == 2
+    queue.release(0.1)
+    queue.release(0.3)
+    summary = queue.summary()
+    assert summary['inflight'] == 0 and summary['admitted'] == 2
+    assert summary['service_ms'] == pytest.approx(140.0)
+
+
+def test_sheds_up_front_when_deadline_cannot_be_met():
+    queue = AdmissionQueue('generate', max_concurrency=1, deadline=1.0)
+    queue.acquire('a')
+    queue.release(0.6)
+
+    queue.acquire('a')
+    with pytest.raises(Shed) as exc:
+        queue.acquire('b')
+    assert exc.value.reason == 'estimate' and exc.value.retry_after == 1
+    assert queue.summary()['shed'] == {'estimate': 1, 'timeout': 0}
+
+
+def test_sheds_queued_request_at_deadline():
+    queue = AdmissionQueue('assist', max_concurrency=1, deadline=0.05)
+    queue.acquire('a')
+    start = time.perf_counter()
+    with pytest.raises(Shed) as exc:
+        queue.acquire('b')
+    assert exc.value.reason == 'timeout'
+    assert time.perf_counter() - start >= 0.05
+    assert queue.summary()['queued'] == 0
+
+
+def test_heavy_client_cannot_starve_others():
+    queue = AdmissionQueue('generate', max_concurrency=1, deadline=5.0)
+    queue.acquire('holder')
+    order = []
+    threads = [_queue_behind(queue, 'heavy', order) for _ in range(4)]
+    threads.append(_queue_behind(queue, 'light', order))
+
+    queue.release(0.0)
+    for thread in threads:
+        thread.join()
+    assert order == ['heavy', 'light', 'heavy', 'heavy', 'heavy']
+    assert queue.summary()['queue_seconds_total'] > 0
+
+
+def test_weights_set_the_share():
+    queue = AdmissionQueue('generate', max_concurrency=1, deadline=5.0, weights={'partner': 3})
+    queue.acquire('holder')
+    order = []
+    threads = [_queue_behind(queue, 'other', order) for _ in range(2)]
+    threads += [_queue_behind(queue, 'partner', order) for _ in range(3)]
+
+    queue.release(0.0)
+    for thread in threads:
+        thread.join()
+    # Three partner requests per other request; ties go to the earlier arrival
+    assert order == ['partner', 'partner', 'other', 'partner', 'other']
+
+
+@pytest.fixture
+def app_env():
+    return {'ADMISSION_ASSIST_CONCURRENCY': '1', 'ADMISSION_ASSIST_DEADLINE_MS': '50'}
+
+
+def test_overloaded_endpoint_answers_503_with_retry_after(app):
+    queue = app.extensions['admission']['assist']
+    queue.acquire('busy client')
+
+    client = app.test_client()
+    response = client.post('/api/assist', json={'prompt': 'food photo of ramen'})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+    queue.release(0.01)
+    assert client.post('/api/assist', json={'prompt': 'food photo of ramen'}).status_code == 200
+    stats = client.get('/health/stats').get_json()['admission']['assist']
+    assert stats['shed'] == {'estimate': 0, 'timeout': 1}
+    assert stats['inflight'] == 0 and stats['admitted'] == 2
@@ -0,0 +1,76 @@
+"""Tests for the static asset build and the cached index page"""
+import gzip
+import json
+import shutil
+
+import pytest
+
+from bananaai.services.assets import assets
+from bananaai.tools.build_assets import build
+
+
+@pytest.fixture
+def app(app, tmp_path):
+    original = app.static_folder
+
+    static = tmp_path / 'static'
+    shutil.copytree(original, static, ignore=shutil.ignore_patterns('dist'))
+    build(str(static))
+    app.static_folder = str(static)
+    assets.load(app.static_folder)
+    yield app
+
+    app.static_folder = original
+    assets.load(original)
+
+
+def test_build_writes_hashed_files_and_manifest(app):
+    dist = app.static_folder + '/dist'
+    manifest = json.load(open(dist + '/manifest.json'))
+
+    assert set(manifest) == {'js/main.js', 'css/styles.css'}
+    name = manifest['js/main.js']
+    assert name.startswith('main.') and name.endswith('.js')
+    with open(f"{dist}/{name}", 'rb') as f:
+        minified = f.read()
+    assert len(minified) < len(open(app.static_folder + '/js/main.js', 'rb').read())
+    assert gzip.decompress(open(f"{dist}/{name}.gz", 'rb').read()) == minified
+
+    # Rebuilding is idempotent and keeps only the current outputs
+    build(app.static_folder)
+    assert json.load(open(dist + '/manifest.json')) == manifest
+
+
+@pytest.mark.parametrize('accept, encoding', [('br, gzip', 'br'), ('gzip', 'gzip'), ('', None)])
+def test_assets_are_precompressed_and_immutable(app, accept, encoding):
+    if encoding == 'br':
+        pytest.importorskip('brotli')
+    client = app.test_client()
+    url = assets.url('css/styles.css')
+    assert url.startswith('/assets/styles.')
+
+    response = client.get(url, headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers.get('Content-Encoding') == encoding
+    response.close()
+
+    assert client.get('/assets/manifest.json').status_code == 404
+    assert client.get('/assets/../../app.py').status_code == 404
+
+
+def test_index_is_cached_with_etag_and_csrf_cookie(app):
+    client = app.test_client()
+    first = client.get('/')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert assets.url('js/main.js').encode() in first.data
+    assert b'csrf-token' not in first.data
+    assert client.get_cookie('csrf_token').value
+
+    etag = first.headers['ETag']
+    again = client.get('/', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
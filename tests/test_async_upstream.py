@@ -0,0 +1,113 @@
+"""Tests for the async upstream execution mode"""
+import io
+import asyncio
+import threading
+import types
+
+import pytest
+from PIL import Image
+
+from bananaai.services import banana_client
+from bananaai.services.upstream_loop import UpstreamLoop
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), 'teal').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class FakeAsyncModel:
+    """Answers only through ``generate_content_async`` and records where it ran"""
+    threads = []
+    return_images = True
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.is_llm = 'system_instruction' in kwargs
+
+    def generate_content(self, *args, **kwargs):
+        raise AssertionError("blocking call in async mode")
+
+    async def generate_content_async(self, content, generation_config=None, **kwargs):
+        FakeAsyncModel.threads.append(threading.current_thread().name)
+        await asyncio.sleep(0.01)
+        if self.is_llm:
+            parts = [types.SimpleNamespace(text='expanded asynchronously')]
+            candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=parts), finish_reason=1)
+            return types.SimpleNamespace(candidates=[candidate])
+
+        candidates = []
+        if FakeAsyncModel.return_images:
+            for _ in range(generation_config['candidate_count']):
+                inline = types.SimpleNamespace(data=_png(), mime_type='image/png')
+                part = types.SimpleNamespace(text=None, inline_data=inline)
+                candidates.append(types.SimpleNamespace(content=types.SimpleNamespace(parts=[part])))
+        return types.SimpleNamespace(candidates=candidates)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(FakeAsyncModel, 'threads', [])
+    return FakeAsyncModel
+
+
+@pytest.fixture
+def app_env():
+    return {'UPSTREAM_MODE': 'async', 'ASSIST_LOCAL_MODE': 'off'}
+
+
+def test_assist_runs_on_the_upstream_loop(app):
+    response = app.test_client().post('/api/assist', json={'prompt': 'a windmill in the rain'})
+
+    assert response.status_code == 200
+    assert response.get_json()['expanded'] == 'expanded asynchronously'
+    assert FakeAsyncModel.threads == ['upstream-loop']
+
+
+def test_generate_runs_on_the_upstream_loop(app):
+    response = app.test_client().post('/api/generate', json={'prompt': 'a banana', 'n': 2})
+
+    data = response.get_json()
+    assert response.status_code == 200 and len(data['images']) == 2
+    assert FakeAsyncModel.threads == ['upstream-loop']
+
+
+def test_placeholder_is_rendered_off_the_loop(app, monkeypatch):
+    monkeypatch.setattr(FakeAsyncModel, 'return_images', False)
+    rendered_on = []
+    original = banana_client.BananaAIClient._create_placeholder_image
+
+    def create_placeholder_image(self, width, height, prompt):
+        rendered_on.append(threading.current_thread().name)
+        return original(self, width, height, prompt)
+
+    monkeypatch.setattr(banana_client.BananaAIClient, '_create_placeholder_image',
+                        create_placeholder_image)
+
+    response = app.test_client().post('/api/generate', json={'prompt': 'a banana'})
+
+    assert response.status_code == 200 and response.get_json()['success']
+    assert len(rendered_on) == 1 and rendered_on[0] != 'upstream-loop'
+
+
+def test_timed_out_call_is_cancelled_on_the_loop():
+    loop = UpstreamLoop()
+    cancelled = threading.Event()
+
+    async def slow_call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(RuntimeError, match='timed out'):
+        loop.run(slow_call(), timeout=0.05)
+    assert cancelled.wait(1)
+
+    # The loop keeps serving later calls
+    async def quick_call():
+        return 'ok'
+
+    assert loop.run(quick_call(), timeout=1) == 'ok'
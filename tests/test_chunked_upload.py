@@ -0,0 +1,156 @@
+"""Tests for resumable chunked uploads"""
+import io
+import random
+import hashlib
+import threading
+
+import pytest
+from PIL import Image
+
+
+# Noise does not compress, so this PNG spans several 4 KB chunks
+IMAGE = io.BytesIO()
+Image.frombytes('RGB', (64, 64), random.Random(0).randbytes(64 * 64 * 3)).save(IMAGE, 'PNG')
+IMAGE = IMAGE.getvalue()
+
+
+@pytest.fixture
+def app_env():
+    return {'UPLOAD_CHUNK_BYTES': '4096', 'RATE_LIMIT_UPLOAD': '1000'}
+
+
+def _start(client, data=IMAGE, **fields):
+    body = {'filename': 'phone photo.png', 'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(), **fields}
+    return client.post('/api/upload/sessions', json=body)
+
+
+def _put(client, upload_id, offset, chunk):
+    return client.put(f'/api/upload/sessions/{upload_id}', data=chunk,
+                      headers={'Upload-Offset': str(offset)}, content_type='application/octet-stream')
+
+
+def test_chunks_resume_from_the_server_offset(app, tmp_path):
+    client = app.test_client()
+    session = _start(client).get_json()
+    assert session['offset'] == 0 and session['chunk_size'] == 4096
+    upload_id = session['upload_id']
+
+    assert _put(client, upload_id, 0, IMAGE[:4096]).get_json()['offset'] == 4096
+    # The response to that chunk was lost: the retry is refused with the real offset
+    retry = _put(client, upload_id, 0, IMAGE[:4096])
+    assert retry.status_code == 409 and retry.get_json()['offset'] == 4096
+    # Not done yet
+    early = client.post(f'/api/upload/sessions/{upload_id}/complete')
+    assert early.status_code == 409 and early.get_json()['offset'] == 4096
+
+    offset = client.get(f'/api/upload/sessions/{upload_id}').get_json()['offset']
+    while offset < len(IMAGE):
+        offset = _put(client, upload_id, offset, IMAGE[offset:offset + 4096]).get_json()['offset']
+
+    done = client.post(f'/api/upload/sessions/{upload_id}/complete')
+    assert done.status_code == 200
+    filename = done.get_json()['filename']
+    assert filename.endswith('_phone_photo.png')
+    assert (tmp_path / 'uploads' / filename).read_bytes() == IMAGE
+    # The session is gone, and its partial file with it
+    assert client.get(f'/api/upload/sessions/{upload_id}').status_code == 404
+
+
+def test_stats_report_the_last_sweep_without_scanning(app, monkeypatch):
+    from bananaai.services.upload_sessions import upload_sessions
+    client = app.test_client()
+    upload_id = _start(client).get_json()['upload_id']
+    _put(client, upload_id, 0, IMAGE[:4096])
+    upload_sessions.purge()
+
+    def no_scan(*args):
+        raise AssertionError("session folder scanned")
+
+    monkeypatch.setattr('os.scandir', no_scan)
+    monkeypatch.setattr('os.listdir', no_scan)
+    stats = client.get('/health/stats').get_json()['upload_sessions']
+    assert stats['sessions'] == 1 and stats['pending_bytes'] == 4096
+    assert stats['updated_at'] is not None
+
+
+def test_hash_mismatch_is_rejected(app):
+    client = app.test_client()
+    upload_id = _start(client, sha256='0' * 64).get_json()['upload_id']
+    for offset in range(0, len(IMAGE), 4096):
+        _put(client, upload_id, offset, IMAGE[offset:offset + 4096])
+    assert client.post(f'/api/upload/sessions/{upload_id}/complete').status_code == 422
+    assert client.get(f'/api/upload/sessions/{upload_id}').status_code == 404
+
+
+def test_invalid_sessions_and_chunks(app):
+    client = app.test_client()
+    assert _start(client, filename='notes.txt').status_code == 400
+    assert _start(client, size=app.config['MAX_CONTENT_LENGTH'] + 1).status_code == 400
+    assert _start(client, sha256='abc').status_code == 400
+    assert client.get('/api/upload/sessions/..%2F..%2Fetc').status_code == 404
+
+    upload_id = _start(client).get_json()['upload_id']
+    assert _put(client, upload_id, 0, IMAGE + b'extra').status_code == 400
+    assert client.put(f'/api/upload/sessions/{upload_id}', data=b'x').status_code == 400
+    assert client.get(f'/api/upload/sessions/{upload_id}').get_json()['offset'] == 0
+
+    # Bytes that hash correctly but are not an image
+    junk = b'not an image' * 100
+    upload_id = _start(client, data=junk).get_json()['upload_id']
+    _put(client, upload_id, 0, junk)
+    assert client.post(f'/api/upload/sessions/{upload_id}/complete').status_code == 400
+
+
+def test_duplicate_chunk_racing_the_original_is_written_once(app):
+    client = app.test_client()
+    upload_id = _start(client).get_json()['upload_id']
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(
+        _put(app.test_client(), upload_id, 0, IMAGE[:4096]).status_code)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [200, 409, 409, 409]
+    assert client.get(f'/api/upload/sessions/{upload_id}').get_json()['offset'] == 4096
+
+
+def test_page_carries_upload_settings(app):
+    page = app.test_client().get('/').get_data(as_text=True)
+    assert 'data-max-edge="2048"' in page and 'data-chunk-bytes="4096"' in page
+
+
+def test_open_sessions_are_capped_per_client_and_overall(app, monkeypatch):
+    from bananaai.services.upload_sessions import upload_sessions
+    monkeypatch.setattr(upload_sessions, 'max_sessions_per_client', 2)
+    client = app.test_client()
+    ids = [_start(client).get_json()['upload_id'] for _ in range(2)]
+
+    refused = _start(client)
+    assert refused.status_code == 429 and 'in progress' in refused.get_json()['error']
+    # Another client still gets a session
+    other = app.test_client()
+    other_start = other.post('/api/upload/sessions', environ_base={'REMOTE_ADDR': '10.0.0.2'}, json={
+        'filename': 'a.png', 'size': len(IMAGE), 'sha256': hashlib.sha256(IMAGE).hexdigest()})
+    assert other_start.status_code == 201
+
+    # Finishing one frees a slot
+    upload_sessions.discard(ids[0])
+    assert _start(client).status_code == 201
+
+    # Declared bytes of all open sessions are bounded too
+    monkeypatch.setattr(upload_sessions, 'max_sessions_per_client', 100)
+    monkeypatch.setattr(upload_sessions, 'max_pending_bytes', 3 * len(IMAGE))
+    assert _start(client).status_code == 503
+
+
+def test_chunk_requests_are_rate_limited(app):
+    app.config['RATE_LIMIT_UPLOAD_CHUNK'] = 3
+    client = app.test_client()
+    upload_id = _start(client).get_json()['upload_id']
+
+    assert _put(client, upload_id, 0, IMAGE[:4096]).status_code == 200
+    assert client.get(f'/api/upload/sessions/{upload_id}').status_code == 200
+    assert client.post(f'/api/upload/sessions/{upload_id}/complete').status_code == 409
+    assert _put(client, upload_id, 4096, IMAGE[4096:8192]).status_code == 429
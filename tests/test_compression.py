@@ -0,0 +1,121 @@
+"""Tests and benchmark for response compression and the JSON provider"""
+import gzip
+import json
+import time
+import zlib
+import datetime
+
+import pytest
+from flask import Flask, Response, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+from bananaai.middleware.compression import register_compression
+from bananaai.utils.json_provider import init_json_provider, OrjsonProvider
+
+brotli = pytest.importorskip('brotli')
+
+EXPANDED_PROMPT = (
+    "A cinematic, ultra-detailed portrait of a banana astronaut floating above a neon "
+    "city at dusk, volumetric lighting, rim light, shallow depth of field, 85mm lens, "
+    "ภาพถ่ายสไตล์ภาพยนตร์ แสงนีออน บรรยากาศยามเย็น "
+) * 6
+
+
+def status_payload(items=50):
+    return {'jobs': [
+        {'id': f'job-{i:04d}', 'status': 'done', 'prompt': EXPANDED_PROMPT[:200],
+         'url': f'/output/20250101_000000_banana_{i}_9x16.png', 'width': 1080,
+         'height': 1920, 'seed': 123456 + i, 'progress': 1.0}
+        for i in range(items)
+    ]}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    init_json_provider(app)
+    register_compression(app)
+
+    @app.route('/expand')
+    def expand():
+        return jsonify({'expanded': EXPANDED_PROMPT, 'cached': False})
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/events')
+    def events():
+        return Response((f"data: {i}\n\n" for i in range(3)), mimetype='text/event-stream')
+
+    @app.route('/stream')
+    def stream():
+        return Response(stream_with_context(EXPANDED_PROMPT for _ in range(3)), mimetype='text/plain')
+
+    return app
+
+
+@pytest.mark.parametrize('encoding, decode', [
+    ('br', brotli.decompress),
+    ('gzip', gzip.decompress),
+])
+def test_negotiated_compression(app, encoding, decode):
+    response = app.test_client().get('/expand', headers={'Accept-Encoding': f'{encoding}, identity'})
+
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(decode(response.data))['expanded'] == EXPANDED_PROMPT
+
+
+def test_small_event_stream_and_identity_are_untouched(app):
+    client = app.test_client()
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/expand').headers
+
+    events = client.get('/events', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in events.headers
+    assert events.data == b"data: 0\n\ndata: 1\n\ndata: 2\n\n"
+
+
+def test_streamed_body_is_compressed_per_chunk(app):
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert zlib.decompress(response.data, 31).decode() == EXPANDED_PROMPT * 3
+
+
+def test_orjson_provider_matches_flask_output(app):
+    payload = {'b': 1, 'a': [1.5, None], 'when': datetime.datetime(2025, 1, 1), 'ไทย': 'ข้อความ'}
+    assert isinstance(app.json, OrjsonProvider)
+    assert json.loads(app.json.dumps(payload)) == json.loads(DefaultJSONProvider(app).dumps(payload))
+    assert app.json.loads(b'{"x": [1, 2]}') == {'x': [1, 2]}
+
+
+def _time_us(func, iterations=2000):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+@pytest.mark.slow
+def test_benchmark_serialization_and_wire_bytes():
+    """Serialization time and response size, run with ``pytest -m slow -s``"""
+    app = Flask(__name__)
+    default, fast = DefaultJSONProvider(app), OrjsonProvider(app)
+    payloads = {'assist': {'expanded': EXPANDED_PROMPT, 'cached': False}, 'status': status_payload()}
+
+    print(f"\n{'payload':>8} {'default us':>11} {'orjson us':>10} {'identity B':>11} "
+          f"{'gzip B':>7} {'br B':>6}")
+    for name, payload in payloads.items():
+        default_us = _time_us(lambda: default.response(payload))
+        fast_us = _time_us(lambda: fast.response(payload))
+        flask_body = default.response(payload).get_data()
+        body = fast.response(payload).get_data()
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31)
+        gz_size = len(gz.compress(body) + gz.flush())
+        br_size = len(brotli.compress(body, quality=4))
+
+        print(f"{name:>8} {default_us:>11.1f} {fast_us:>10.1f} {len(flask_body):>11} "
+              f"{gz_size:>7} {br_size:>6}")
+        assert fast_us < default_us
+        assert br_size < len(flask_body) and gz_size < len(flask_body)
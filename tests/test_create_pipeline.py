@@ -0,0 +1,122 @@
+"""Tests for the combined expand-and-generate pipeline"""
+import io
+import os
+import json
+import types
+
+import pytest
+from PIL import Image
+
+
+PNG = io.BytesIO()
+Image.new('RGB', (32, 32), 'orange').save(PNG, 'PNG')
+PNG = PNG.getvalue()
+
+
+def _response(text=None, image=None):
+    inline = types.SimpleNamespace(data=image, mime_type='image/png') if image else None
+    part = types.SimpleNamespace(text=text, inline_data=inline)
+    candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]), finish_reason=1)
+    return types.SimpleNamespace(candidates=[candidate])
+
+
+class FakeModel:
+    calls = []
+
+    def __init__(self, name, system_instruction=None, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, **kwargs):
+        FakeModel.calls.append((self.name, content))
+        if 'image' in self.name:
+            return _response(image=PNG)
+        return _response(text='expanded: ' + content[-1].splitlines()[0])
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(FakeModel, 'calls', [])
+    return FakeModel
+
+
+@pytest.fixture
+def app(app, tmp_path):
+    (tmp_path / 'uploads' / 'ref.png').write_bytes(PNG)
+    return app
+
+
+def _events(response):
+    """Yield (event, data) pairs from a streamed SSE response as they arrive"""
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode() if isinstance(chunk, bytes) else chunk
+        while '\n\n' in buffer:
+            block, buffer = buffer.split('\n\n', 1)
+            fields = dict(line.split(': ', 1) for line in block.splitlines())
+            yield fields['event'], json.loads(fields['data'])
+
+
+def test_create_streams_expansion_before_generating(app, monkeypatch):
+    opened = []
+    original_open = Image.open
+    monkeypatch.setattr(Image, 'open', lambda *a, **k: opened.append(a[0]) or original_open(*a, **k))
+
+    response = app.test_client().post('/api/create', buffered=False, json={
+        'prompt': 'a cat on a chair', 'aspect_ratio': '16:9', 'reference_images': ['ref.png']})
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response)
+
+    event, expanded = next(events)
+    assert event == 'expanded'
+    assert expanded['source'] == 'llm'
+    assert expanded['expanded'] == 'expanded: a cat on a chair'
+    # Generation has not started when the expanded prompt is delivered
+    assert [name for name, _ in FakeModel.calls] == [app.config['LLM_MODEL']]
+
+    event, image = next(events)
+    assert event == 'image'
+    assert image['prompt'] == 'expanded: a cat on a chair'
+    assert image['aspect_ratio'] == '16:9'
+    assert os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], image['filename']))
+    response.close()
+
+    # The reference image was read from disk once and sent to both models
+    assert len(opened) == 1
+    llm_content, image_content = FakeModel.calls[0][1], FakeModel.calls[1][1]
+    assert llm_content[0] is image_content[1]
+
+
+def test_create_reports_validation_and_stage_errors(app, monkeypatch):
+    client = app.test_client()
+    assert client.post('/api/create', json={'prompt': ''}).status_code == 400
+    assert client.post('/api/create', json={'prompt': 'x', 'guidance_scale': 50}).status_code == 400
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Image generation failed: quota")
+
+    monkeypatch.setattr('bananaai.services.banana_client.BananaAIClient.generate_images', fail)
+    response = client.post('/api/create', json={'prompt': 'food photo of ramen'})
+    events = list(_events(response))
+    assert [event for event, _ in events] == ['expanded', 'error']
+    assert events[0][1]['source'] == 'local'
+    assert events[1][1] == {'stage': 'generate', 'error': 'Image generation failed: quota'}
+
+
+def test_create_waits_in_the_generate_admission_queue(app, monkeypatch):
+    queue = app.extensions['admission']['generate']
+    monkeypatch.setattr(queue, 'max_concurrency', 1)
+    monkeypatch.setattr(queue, 'deadline', 0.05)
+    queue.acquire('busy client')
+
+    client = app.test_client()
+    events = list(_events(client.post('/api/create', json={'prompt': 'a cat on a chair'})))
+    assert [event for event, _ in events] == ['error']
+    assert events[0][1]['retry_after'] >= 1 and events[0][1]['stage'] == 'expand'
+    assert FakeModel.calls == []
+
+    queue.release(0.01)
+    events = list(_events(client.post('/api/create', json={'prompt': 'a cat on a chair'})))
+    assert [event for event, _ in events] == ['expanded', 'image']
+    summary = queue.summary()
+    assert summary['inflight'] == 0 and summary['admitted'] == 2
+    assert summary['shed'] == {'estimate': 0, 'timeout': 1}
@@ -0,0 +1,50 @@
+"""Tests for the readiness prober"""
+from bananaai.services.health_prober import HealthProber, READY, DEGRADED, NOT_READY
+
+
+def make_prober(tmp_path, probe):
+    prober = HealthProber(probe=probe)
+    prober.api_key = 'test'
+    prober.model = 'gemini-2.5-flash'
+    prober.folders = (str(tmp_path),)
+    prober.min_free_disk_mb = 0
+    return prober
+
+
+def test_status_follows_upstream_probe(tmp_path):
+    calls = []
+
+    def failing_probe(api_key, model, timeout):
+        calls.append(model)
+        raise ConnectionError("unreachable")
+
+    prober = make_prober(tmp_path, failing_probe)
+    assert prober.status()[0] == READY  # no probe yet: static checks only
+
+    prober.probe_once()
+    assert prober.status()[0] == READY  # one failure is tolerated
+    prober.probe_once()
+    status, details = prober.status()
+    assert status == NOT_READY
+    assert details['upstream']['error'] == 'ConnectionError'
+    assert calls == ['gemini-2.5-flash'] * 2
+
+    prober.probe = lambda *args: None
+    prober.probe_once()
+    assert prober.status()[0] == READY
+
+
+def test_status_degrades_when_overloaded(tmp_path):
+    prober = make_prober(tmp_path, lambda *args: None)
+    prober.max_inflight = 2
+    prober.probe_once()
+
+    prober._inflight = 3
+    status, details = prober.status()
+    assert status == DEGRADED
+    assert details['reasons'] == ['inflight']
+
+    prober._inflight = 1
+    prober.min_free_disk_mb = 1 << 40
+    prober.probe_once()
+    assert prober.status()[0] == NOT_READY
@@ -0,0 +1,90 @@
+"""Tests for the file statistics served by /health/stats"""
+import io
+import os
+import time
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from bananaai.services.file_index import FileIndex
+from bananaai.utils import file_ops
+from bananaai.utils.file_ops import save_uploaded_file, save_generated_image, cleanup_old_files
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 1024 * 1024
+
+
+def _stats(app, monkeypatch):
+    """GET /health/stats with folder scans turned into errors"""
+    def no_scan(*args, **kwargs):
+        raise AssertionError("folder scanned while serving /health/stats")
+
+    client = app.test_client()
+    with monkeypatch.context() as patch:
+        patch.setattr(FileIndex, '_scan', no_scan)
+        patch.setattr(file_ops, 'get_upload_stats', no_scan)
+        return client.get('/health/stats').get_json()
+
+
+def test_stats_follow_writes_and_deletes(app, monkeypatch):
+    uploads, outputs = app.config['UPLOAD_FOLDER'], app.config['OUTPUT_FOLDER']
+    before = time.time()
+
+    saved = [save_uploaded_file(FileStorage(io.BytesIO(PNG), filename=name), uploads)
+             for name in ('a.png', 'b.png')]
+    assert all(saved)
+    assert save_generated_image(PNG, outputs, 'generated.png')
+
+    stats = _stats(app, monkeypatch)
+    assert stats['uploads']['file_count'] == 2
+    assert stats['uploads']['total_size_mb'] == pytest.approx(2 * len(PNG) / (1024 * 1024), abs=0.01)
+    assert before <= stats['uploads']['oldest_file'] <= stats['uploads']['newest_file']
+    assert stats['outputs']['file_count'] == 1
+    assert stats['uploads']['reconciled_at']
+
+    old = time.time() - 2 * 3600
+    os.utime(os.path.join(uploads, saved[0]), (old, old))
+    cleanup_old_files(uploads, hours=1)
+
+    stats = _stats(app, monkeypatch)
+    assert stats['uploads']['file_count'] == 1
+    assert stats['uploads']['total_size_mb'] == pytest.approx(len(PNG) / (1024 * 1024), abs=0.01)
+    assert stats['outputs']['file_count'] == 1
+
+
+def test_background_reconcile_runs_without_the_janitor(tmp_path):
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    index = FileIndex(str(tmp_path / 'files.db'), reconcile_interval=0.01)
+    index.track(str(folder))
+    scanned_at = index.stats(str(folder))['reconciled_at']
+
+    # Copied in behind the app's back, unknown to the index until a reconcile
+    (folder / 'restored.png').write_bytes(PNG)
+    index.start()
+    try:
+        deadline = time.monotonic() + 2
+        while index.stats(str(folder))['file_count'] == 0:
+            assert time.monotonic() < deadline, "reconcile did not run"
+            time.sleep(0.01)
+    finally:
+        index.stop()
+    assert index.stats(str(folder))['reconciled_at'] > scanned_at
+
+
+def test_workers_report_the_same_stats_and_reconcile_once(tmp_path):
+    folder = str(tmp_path / 'uploads')
+    os.mkdir(folder)
+    first, second = (FileIndex(str(tmp_path / 'files.db'), reconcile_interval=3600) for _ in range(2))
+    first.record_write(folder, 'a.png', 100)
+    second.record_write(folder, 'b.png', 200)
+    second.record_delete(folder, 'a.png')
+
+    assert first.stats(folder) == second.stats(folder)
+    assert first.stats(folder)['file_count'] == 1 and first.total_bytes(folder) == 200
+
+    # Both were scanned (tracked) just now: no round is due on either worker
+    assert not first._claim(folder) and not second._claim(folder)
+    first.reconcile_interval = second.reconcile_interval = 0
+    assert first._claim(folder)
+    second.reconcile_interval = 60
+    assert not second._claim(folder)
@@ -0,0 +1,173 @@
+"""Tests and benchmark for the generation history store"""
+import io
+import os
+import time
+import types
+import random
+
+import pytest
+from PIL import Image
+
+from bananaai.services.history import HistoryStore, COLUMNS
+
+PNG = io.BytesIO()
+Image.new('RGB', (32, 32), 'orange').save(PNG, 'PNG')
+PNG = PNG.getvalue()
+
+
+def _store(path, **settings):
+    store = HistoryStore()
+    store.init_app(types.SimpleNamespace(config={'HISTORY_DB': str(path), **settings}))
+    return store
+
+
+def _row(created, prompt, aspect_ratio='9:16', **fields):
+    values = {'created': created, 'filename': f'{created}.png', 'prompt': prompt,
+              'aspect_ratio': aspect_ratio, 'variant': 0, 'placeholder': 0, **fields}
+    return tuple(values.get(column) for column in COLUMNS)
+
+
+def _pages(store, **filters):
+    items, cursor = [], None
+    while True:
+        page = store.query(limit=2, cursor=cursor, **filters)
+        items += page['items']
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items
+
+
+def test_keyset_pages_cover_every_row_once(tmp_path):
+    store = _store(tmp_path / 'history.db')
+    # Two rows share a timestamp; the id breaks the tie
+    store.write([_row(t, f'prompt {t}') for t in (1.0, 2.0, 2.0, 3.0, 4.0)])
+
+    items = _pages(store)
+    assert [item['created'] for item in items] == [4.0, 3.0, 2.0, 2.0, 1.0]
+    assert len({item['id'] for item in items}) == 5
+    assert store.query(limit=10)['next_cursor'] is None
+
+    with pytest.raises(ValueError):
+        store.query(cursor='not-a-cursor')
+
+
+def test_filters(tmp_path):
+    store = _store(tmp_path / 'history.db')
+    store.write([
+        _row(1.0, 'a red fox in the snow', '16:9'),
+        _row(2.0, 'portrait of a fox', '9:16'),
+        _row(3.0, 'ภาพวาดแมวสีส้ม', '9:16'),
+        _row(4.0, 'a red car at night', '16:9'),
+    ])
+    prompts = lambda **f: [item['prompt'] for item in _pages(store, **f)]
+
+    assert prompts(text='fox') == ['portrait of a fox', 'a red fox in the snow']
+    assert prompts(text='red fox') == ['a red fox in the snow']
+    # Thai has no spaces between words; any 3+ character substring matches
+    assert prompts(text='แมว') == ['ภาพวาดแมวสีส้ม']
+    # Words too short for the index are still matched
+    assert prompts(text='a fox') == ['portrait of a fox', 'a red fox in the snow']
+    assert prompts(aspect_ratio='16:9') == ['a red car at night', 'a red fox in the snow']
+    assert prompts(since=2.0, until=4.0) == ['ภาพวาดแมวสีส้ม', 'portrait of a fox']
+    assert prompts(text='"quoted" 100%') == []
+
+
+def test_writes_happen_off_the_request_thread(tmp_path):
+    store = _store(tmp_path / 'history.db')
+    store.record(filename='x.png', prompt='a cat', aspect_ratio='9:16', reference_images=['ref.png'])
+    store.flush()
+    assert store._writer.name == 'history-writer'
+    item = store.query()['items'][0]
+    assert item['reference_images'] == ['ref.png'] and item['url'] == '/output/x.png'
+    assert store.summary()['rows'] == 1
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    store = _store(tmp_path / 'history.db', HISTORY_QUEUE_SIZE=1)
+    store.write = lambda rows: time.sleep(0.2)
+    for _ in range(5):
+        store.record(filename='x.png', prompt='p', aspect_ratio='9:16')
+    assert store.summary()['dropped'] >= 3
+
+
+class FakeImageModel:
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, generation_config=None, **kwargs):
+        inline = types.SimpleNamespace(data=PNG, mime_type='image/png')
+        part = types.SimpleNamespace(text=None, inline_data=inline)
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]))
+        return types.SimpleNamespace(candidates=[candidate] * generation_config['candidate_count'])
+
+
+@pytest.fixture
+def fake_model():
+    return FakeImageModel
+
+
+def test_generations_are_listed(app):
+    from bananaai.services.history import history
+    client = app.test_client()
+    generated = client.post('/api/generate', json={
+        'prompt': 'a lighthouse at dusk', 'aspect_ratio': '16:9', 'n': 2, 'guidance_scale': 9}).get_json()
+    client.post('/api/generate', json={'prompt': 'a bowl of ramen'})
+    history.flush()
+
+    page = client.get('/api/history?q=lighthouse&limit=1').get_json()
+    item = page['items'][0]
+    assert item['filename'] in [image['filename'] for image in generated['images']]
+    assert item['aspect_ratio'] == '16:9' and item['guidance_scale'] == 9
+    assert item['model'] == app.config['BANANA_MODEL'] and item['placeholder'] is False
+    assert item['generation_ms'] >= 0 and item['request_id']
+
+    rest = client.get(f"/api/history?q=lighthouse&cursor={page['next_cursor']}").get_json()
+    assert len(rest['items']) == 1 and rest['next_cursor'] is None
+    assert len(client.get('/api/history').get_json()['items']) == 3
+    assert client.get('/api/history?since=2001-01-01T00:00:00Z').get_json()['items']
+    assert client.get('/api/history?since=yesterday').status_code == 400
+
+
+@pytest.mark.slow
+def test_benchmark_queries_over_a_large_history(tmp_path):
+    """Query latency per page, run with ``HISTORY_BENCH_ROWS=1000000 pytest -m slow -s``"""
+    rows = int(os.getenv('HISTORY_BENCH_ROWS', '100000'))
+    store = _store(tmp_path / 'history.db')
+    words = ['cat', 'dog', 'fox', 'sunset', 'mountain', 'city', 'neon', 'forest', 'ocean',
+             'portrait', 'ramen', 'castle', 'robot', 'flower', 'desert', 'river']
+    rng = random.Random(0)
+    start = time.perf_counter()
+    batch = []
+    for i in range(rows):
+        prompt = ' '.join(rng.sample(words, 4)) + f' scene {i}'
+        batch.append(_row(1_600_000_000 + i, prompt, rng.choice(('9:16', '16:9'))))
+        if len(batch) == 10000:
+            store.write(batch)
+            batch = []
+    store.write(batch)
+    load = time.perf_counter() - start
+
+    def timed(**filters):
+        start = time.perf_counter()
+        page = store.query(limit=20, **filters)
+        # Page 50 costs the same as page 1
+        for _ in range(49):
+            page = store.query(limit=20, cursor=page['next_cursor'], **filters)
+        return (time.perf_counter() - start) / 50 * 1000, page
+
+    middle = 1_600_000_000 + rows // 2
+    results = {
+        'newest': timed(),
+        'aspect ratio': timed(aspect_ratio='16:9'),
+        'time range': timed(since=middle - 100_000, until=middle),
+        'text': timed(text='sunset'),
+        'text + ratio': timed(text='neon castle', aspect_ratio='9:16'),
+        'rare text': timed(text='scene 12345'),
+    }
+    print(f"\n{rows:,} rows loaded in {load:.0f}s; ms per page of 20:")
+    for name, (ms, _) in results.items():
+        print(f"  {name:<14} {ms:7.2f}")
+    for name, (ms, page) in results.items():
+        if name != 'rare text':
+            assert len(page['items']) == 20, name
+        assert ms < 50, name
@@ -0,0 +1,179 @@
+"""Tests for Idempotency-Key support on /api/generate"""
+import io
+import time
+import types
+import threading
+
+import pytest
+from PIL import Image
+
+from bananaai.services.idempotency import IdempotencyStore, RUN, REPLAY, IN_PROGRESS
+
+PNG = io.BytesIO()
+Image.new('RGB', (32, 32), 'orange').save(PNG, 'PNG')
+PNG = PNG.getvalue()
+
+
+class FakeImageModel:
+    calls = 0
+    release = None  # threading.Event the call waits for, if set
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, **kwargs):
+        FakeImageModel.calls += 1
+        if FakeImageModel.release is not None:
+            FakeImageModel.release.wait(5)
+        inline = types.SimpleNamespace(data=PNG, mime_type='image/png')
+        part = types.SimpleNamespace(text=None, inline_data=inline)
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]))
+        return types.SimpleNamespace(candidates=[candidate])
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(FakeImageModel, 'calls', 0)
+    monkeypatch.setattr(FakeImageModel, 'release', None)
+    return FakeImageModel
+
+
+def _generate(app, key, prompt='a banana'):
+    return app.test_client().post('/api/generate', json={'prompt': prompt},
+                                  headers={'Idempotency-Key': key})
+
+
+def test_retry_replays_stored_response(app):
+    first = _generate(app, 'retry-1')
+    second = _generate(app, 'retry-1')
+    assert first.status_code == second.status_code == 200
+    assert FakeImageModel.calls == 1
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+
+    # Without a key, or with another key, generation runs again
+    app.test_client().post('/api/generate', json={'prompt': 'a banana'})
+    _generate(app, 'retry-2')
+    assert FakeImageModel.calls == 3
+
+
+def test_concurrent_duplicate_attaches_to_running_request(app):
+    FakeImageModel.release = threading.Event()
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(_generate(app, 'tap-tap')))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    assert FakeImageModel.calls == 1
+    FakeImageModel.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert FakeImageModel.calls == 1
+    assert [r.status_code for r in responses] == [200, 200]
+    assert responses[0].get_json()['filename'] == responses[1].get_json()['filename']
+
+
+def test_retry_from_a_new_address_is_replayed(app):
+    first = _generate(app, 'same-key')
+    # The client switched networks before retrying
+    retry = app.test_client().post('/api/generate', json={'prompt': 'a banana'},
+                                   headers={'Idempotency-Key': 'same-key'},
+                                   environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert FakeImageModel.calls == 1
+
+
+def test_duplicate_waits_no_longer_than_the_admission_deadline(app):
+    app.config['ADMISSION_GENERATE_DEADLINE_MS'] = 100
+    FakeImageModel.release = threading.Event()
+    running = threading.Thread(target=_generate, args=(app, 'slow'))
+    running.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    duplicate = _generate(app, 'slow')
+    assert duplicate.status_code == 409
+    assert time.monotonic() - start < 1
+    FakeImageModel.release.set()
+    running.join()
+    assert FakeImageModel.calls == 1
+
+
+def test_key_reused_for_another_request_is_rejected(app):
+    _generate(app, 'reused', prompt='a banana')
+    assert _generate(app, 'reused', prompt='an apple').status_code == 422
+    assert _generate(app, 'x' * 300).status_code == 400
+
+
+def test_failed_request_releases_key(app, monkeypatch):
+    from bananaai.services.banana_client import BananaAIClient
+    original = BananaAIClient.generate_images
+    attempts = []
+
+    def fail_once(self, *args, **kwargs):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Image generation failed: quota")
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(BananaAIClient, 'generate_images', fail_once)
+    assert _generate(app, 'flaky').status_code == 503
+    response = _generate(app, 'flaky')
+    assert response.status_code == 200 and 'Idempotent-Replayed' not in response.headers
+    assert len(attempts) == 2
+
+
+def _store(path, **settings):
+    store = IdempotencyStore()
+    config = {'IDEMPOTENCY_DB': str(path), **settings}
+    store.init_app(types.SimpleNamespace(config=config))
+    return store
+
+
+def test_store_is_shared_between_workers(tmp_path):
+    owner, other = _store(tmp_path / 'shared.db'), _store(tmp_path / 'shared.db')
+    assert owner.begin('k', b'fp', wait=1) == (RUN, None)
+    assert other.begin('k', b'fp', wait=0.1) == (IN_PROGRESS, None)
+
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(other.begin('k', b'fp', wait=5)))
+    waiter.start()
+    time.sleep(0.05)
+    owner.complete('k', 200, b'{"ok": true}')
+    waiter.join()
+    assert result == [(REPLAY, (200, b'{"ok": true}'))]
+
+
+def test_abandoned_key_is_taken_over_after_lease(tmp_path):
+    crashed = _store(tmp_path / 'shared.db', IDEMPOTENCY_LEASE_SECONDS=0)
+    crashed.begin('k', b'fp', wait=0)
+    assert _store(tmp_path / 'shared.db').begin('k', b'fp', wait=0) == (RUN, None)
+
+
+def test_store_is_bounded(tmp_path):
+    store = _store(tmp_path / 'bounded.db', IDEMPOTENCY_MAX_ENTRIES=2)
+    for key in 'abc':
+        store.begin(key, b'fp', wait=0)
+        store.complete(key, 200, b'{}')
+    assert store.purge() == 1
+    assert store.summary()['stored'] == 2
+    # The oldest response went first
+    assert store.begin('a', b'fp', wait=0) == (RUN, None)
+
+
+def test_summary_counts_are_kept_by_the_store(tmp_path):
+    store = _store(tmp_path / 'counts.db')
+    for key in 'abc':
+        store.begin(key, b'fp', wait=0)
+    store.complete('a', 200, b'{}')
+    store.release('b')
+    assert store.summary()['pending'] == 1 and store.summary()['stored'] == 1
+
+    # A database created before the counters is counted once when opened
+    db = store._db()
+    db.executescript('DROP TABLE idempotency_counts')
+    assert _store(tmp_path / 'counts.db').summary()['pending'] == 1
+    assert _store(tmp_path / 'counts.db').summary()['stored'] == 1
@@ -0,0 +1,81 @@
+"""Tests and benchmarks for the inline_data decode path"""
+import os
+import time
+import base64
+import tracemalloc
+
+import pytest
+
+from bananaai.utils.image_codec import write_inline_data, decode_inline_data, sniff_image_type
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+def make_payload(size: int) -> bytes:
+    return PNG_HEADER + os.urandom(size - len(PNG_HEADER))
+
+
+@pytest.mark.parametrize('encode', [
+    lambda raw: raw,
+    lambda raw: base64.b64encode(raw),
+    lambda raw: base64.b64encode(raw).decode('ascii'),
+    lambda raw: 'data:image/png;base64,' + base64.b64encode(raw).decode('ascii'),
+    lambda raw: base64.encodebytes(raw),  # MIME line breaks force the fallback
+], ids=['raw', 'b64-bytes', 'b64-str', 'data-url', 'b64-multiline'])
+def test_write_inline_data_roundtrip(tmp_path, encode):
+    raw = make_payload(3 * 1024 * 1024 + 17)
+    target = tmp_path / 'out.png'
+
+    written = write_inline_data(encode(raw), str(target))
+
+    assert written == len(raw)
+    assert target.read_bytes() == raw
+    assert bytes(decode_inline_data(encode(raw))) == raw
+
+
+def test_write_inline_data_rejects_non_image(tmp_path):
+    target = tmp_path / 'out.png'
+    with pytest.raises(ValueError):
+        write_inline_data(base64.b64encode(b'not an image at all'), str(target))
+    assert not target.exists()
+    assert sniff_image_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+
+
+def _legacy_save(image_data, filepath):
+    """The decode path used before image_codec, kept for comparison"""
+    if isinstance(image_data, bytes):
+        image_data = image_data.decode('utf-8')
+    image_data = str(image_data)
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    final = base64.b64decode(image_data)
+    with open(filepath, 'wb') as f:
+        f.write(final)
+
+
+def _measure(func, data, filepath):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(data, filepath)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+@pytest.mark.slow
+def test_benchmark_decode_paths(tmp_path):
+    """Peak memory and time per image, run with ``pytest -m slow -s``"""
+    target = str(tmp_path / 'bench.png')
+    print(f"\n{'size':>6} {'legacy ms':>10} {'legacy peak MB':>15} {'new ms':>8} {'new peak MB':>12}")
+
+    for size_mb in (1, 2, 5, 10):
+        raw = make_payload(size_mb * 1024 * 1024)
+        data = b'data:image/png;base64,' + base64.b64encode(raw)
+
+        legacy_time, legacy_peak = _measure(_legacy_save, data, target)
+        new_time, new_peak = _measure(write_inline_data, data, target)
+
+        print(f"{size_mb:>4}MB {legacy_time * 1000:>10.1f} {legacy_peak / 2**20:>15.1f} "
+              f"{new_time * 1000:>8.1f} {new_peak / 2**20:>12.1f}")
+        assert new_peak < legacy_peak
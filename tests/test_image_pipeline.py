@@ -0,0 +1,137 @@
+"""Tests for the generated image post-processing pipeline"""
+import io
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+import bananaai.services.image_pipeline as pipeline_module
+from bananaai.services.file_index import FileIndex
+from bananaai.services.image_pipeline import ImagePipeline, preview_filename
+
+
+class RecordingStorage:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, folder, filename):
+        self.published.append(filename)
+
+
+@pytest.fixture
+def index(monkeypatch, tmp_path_factory):
+    index = FileIndex(str(tmp_path_factory.mktemp('index') / 'files.db'))
+    monkeypatch.setattr(pipeline_module, 'file_index', index)
+    return index
+
+
+@pytest.fixture
+def published(monkeypatch):
+    storage = RecordingStorage()
+    monkeypatch.setattr(pipeline_module, 'storage', storage)
+    return storage.published
+
+
+def _png(path, size=(1024, 768), **options):
+    # A gradient compresses well, so an optimized re-encode is smaller
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG', **options)
+    path.write_bytes(buffer.getvalue())
+    return str(path)
+
+
+def _run(pipeline, path):
+    """Submit an image and wait for the pool to finish with it"""
+    preview = pipeline.submit(path)
+    pipeline._get_executor().shutdown(wait=True)
+    return preview
+
+
+def test_preview_is_written_in_the_pool(tmp_path, index, published, monkeypatch):
+    pipeline = ImagePipeline()
+    pipeline.preview_max_edge = 256
+    path = _png(tmp_path / 'cat.png')
+    threads = []
+    write_preview = pipeline._write_preview
+
+    def recording_write_preview(filepath):
+        threads.append(threading.current_thread().name)
+        return write_preview(filepath)
+
+    monkeypatch.setattr(pipeline, '_write_preview', recording_write_preview)
+
+    preview = _run(pipeline, path)
+
+    # The request thread only learns the name; decoding happens in the pool
+    assert preview == preview_filename('cat.png') == 'cat_preview.jpg'
+    assert threads and threads[0].startswith('image-pipeline')
+    with Image.open(tmp_path / preview) as img:
+        assert img.format == 'JPEG'
+        assert max(img.size) == 256 and img.size == (256, 192)
+    assert index.stats(str(tmp_path))['file_count'] == 2
+    assert preview in published
+    assert pipeline.get_stats('cat.png')['preview_time'] >= 0
+
+
+def test_disabled_pipeline_writes_nothing(tmp_path, index, published):
+    pipeline = ImagePipeline()
+    pipeline.enabled = False
+    path = _png(tmp_path / 'cat.png')
+
+    assert pipeline.submit(path) is None
+    assert os.listdir(tmp_path) == ['cat.png']
+
+
+def test_smaller_encode_replaces_original(tmp_path, index, published):
+    pipeline = ImagePipeline()
+    path = _png(tmp_path / 'big.png', compress_level=0)
+    before = os.path.getsize(path)
+
+    _run(pipeline, path)
+
+    after = os.path.getsize(path)
+    assert after < before
+    record = pipeline.get_stats('big.png')
+    assert record['status'] == 'optimized'
+    assert (record['bytes_before'], record['bytes_after']) == (before, after)
+    assert record['bytes_saved'] == before - after
+    assert record['encode_time'] >= 0
+
+    # The index and the backend see the swapped file
+    assert index.total_bytes(str(tmp_path)) == after + os.path.getsize(tmp_path / 'big_preview.jpg')
+    assert published.count('big.png') == 1
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+    summary = pipeline.summary()
+    assert summary['processed'] == 1 and summary['pending'] == 0
+    assert summary['bytes_saved'] == before - after
+    assert summary['avg_encode_time'] is not None
+
+
+def test_original_kept_when_encode_is_not_smaller(tmp_path, index, published):
+    pipeline = ImagePipeline()
+    path = _png(tmp_path / 'tight.png', optimize=True)
+    original = open(path, 'rb').read()
+
+    _run(pipeline, path)
+
+    assert open(path, 'rb').read() == original
+    record = pipeline.get_stats('tight.png')
+    assert record['status'] == 'kept_original' and record['bytes_saved'] == 0
+    assert 'tight.png' not in published
+    assert sorted(os.listdir(tmp_path)) == ['tight.png', 'tight_preview.jpg']
+    assert pipeline.summary()['bytes_saved'] == 0
+
+
+def test_unreadable_image_is_counted_as_failed(tmp_path, index, published):
+    pipeline = ImagePipeline()
+    path = tmp_path / 'broken.png'
+    path.write_bytes(b'not an image')
+
+    _run(pipeline, str(path))
+
+    assert pipeline.get_stats('broken.png')['status'] == 'failed'
+    assert pipeline.summary()['failed'] == 1
+    assert os.listdir(tmp_path) == ['broken.png']
@@ -0,0 +1,145 @@
+"""Tests for the storage janitor and the file index behind it"""
+import os
+import time
+import types
+
+import pytest
+
+from bananaai.services import janitor as janitor_module
+from bananaai.services import storage as storage_module
+from bananaai.services.file_index import FileIndex
+from bananaai.services.history import HistoryStore, COLUMNS
+from bananaai.services.janitor import StorageJanitor
+
+DAY = 24 * 3600
+
+
+def _write(folder, name, size=100, age=0):
+    path = folder / name
+    path.write_bytes(b'x' * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'output'
+    folder.mkdir()
+    return folder
+
+
+@pytest.fixture
+def file_index(tmp_path, monkeypatch):
+    """The index of this worker, in a database other workers may open too"""
+    index = FileIndex(str(tmp_path / 'files.db'))
+    monkeypatch.setattr(janitor_module, 'file_index', index)
+    monkeypatch.setattr(storage_module, 'file_index', index)
+    return index
+
+
+def _no_scan(*args):
+    raise AssertionError("folder rescanned")
+
+
+def _janitor(folder, quota=0, deletes_per_second=0):
+    janitor = StorageJanitor(max_age_hours=24, deletes_per_second=deletes_per_second)
+    janitor.quotas = {str(folder): quota}
+    return janitor
+
+
+def test_files_past_the_age_limit_are_deleted(folder, file_index):
+    _write(folder, 'old-1.png', age=3 * DAY)
+    _write(folder, 'old-2.png', age=2 * DAY)
+    _write(folder, 'fresh.png', age=3600)
+    file_index.track(str(folder))
+
+    assert _janitor(folder).run_once() == {str(folder): 2}
+
+    assert os.listdir(folder) == ['fresh.png']
+    assert file_index.stats(str(folder))['file_count'] == 1
+
+
+def test_quota_evicts_least_recently_used_first(folder, file_index):
+    for name in ('a.png', 'b.png', 'c.png'):
+        _write(folder, name)
+        file_index.record_write(str(folder), name, 100)
+    file_index.record_access(str(folder), 'a.png')
+
+    # 300 bytes against a 150 byte quota: b and c were used least recently
+    assert _janitor(folder, quota=150).run_once() == {str(folder): 2}
+
+    assert os.listdir(folder) == ['a.png']
+    assert file_index.total_bytes(str(folder)) == 100
+
+
+def test_files_other_workers_serve_are_evicted_last(folder, file_index, tmp_path, monkeypatch):
+    other_worker = FileIndex(str(tmp_path / 'files.db'))
+    for name in ('a.png', 'b.png', 'c.png'):
+        _write(folder, name)
+        other_worker.record_write(str(folder), name, 100)
+    other_worker.record_access(str(folder), 'a.png')
+
+    # The janitor's process saw none of this, and does not rescan to find out
+    monkeypatch.setattr(FileIndex, '_scan', _no_scan)
+    assert _janitor(folder, quota=150).run_once() == {str(folder): 2}
+    assert os.listdir(folder) == ['a.png']
+    assert other_worker.stats(str(folder))['file_count'] == 1
+
+
+def test_deletes_are_throttled(folder, file_index):
+    for i in range(5):
+        _write(folder, f'old-{i}.png', age=2 * DAY)
+    file_index.track(str(folder))
+
+    start = time.monotonic()
+    assert _janitor(folder, deletes_per_second=20).run_once() == {str(folder): 5}
+
+    # Four gaps of 1/20 s between five deletions
+    assert time.monotonic() - start >= 0.19
+
+
+def test_reconcile_picks_up_files_written_outside_the_index(folder, file_index):
+    file_index.track(str(folder))
+    _write(folder, 'other-worker.png', age=2 * DAY)
+    janitor = _janitor(folder)
+
+    # Unknown to this process until the folder is rescanned
+    assert janitor.run_once() == {str(folder): 0}
+    file_index.reconcile(str(folder))
+    assert file_index.stats(str(folder))['file_count'] == 1
+
+    assert janitor.run_once() == {str(folder): 1}
+    assert os.listdir(folder) == []
+
+
+def test_only_one_process_holds_the_janitor_lock(tmp_path):
+    first, second = StorageJanitor(), StorageJanitor()
+    first.lock_path = second.lock_path = str(tmp_path / 'janitor.lock')
+
+    assert first.acquire_lock()
+    assert first.acquire_lock()
+    assert not second.acquire_lock()
+
+    # The lock goes with the holder, e.g. a worker recycled by max_requests
+    first._lock_file.close()
+    assert second.acquire_lock()
+
+
+def test_deleted_outputs_are_dropped_from_the_history(folder, file_index, tmp_path, monkeypatch):
+    store = HistoryStore()
+    store.init_app(types.SimpleNamespace(config={'HISTORY_DB': str(tmp_path / 'history.db')}))
+    monkeypatch.setattr(janitor_module, 'history', store)
+    store.write([tuple({'created': 1.0, 'filename': name, 'prompt': name, 'aspect_ratio': '1:1',
+                        'variant': 0, 'placeholder': 0}.get(column) for column in COLUMNS)
+                 for name in ('old.png', 'fresh.png')])
+    _write(folder, 'old.png', age=2 * DAY)
+    _write(folder, 'fresh.png')
+    file_index.track(str(folder))
+    janitor = _janitor(folder)
+    janitor.output_folder = str(folder)
+
+    assert janitor.run_once() == {str(folder): 1}
+
+    assert [item['url'] for item in store.query()['items']] == ['/output/fresh.png']
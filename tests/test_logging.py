@@ -0,0 +1,122 @@
+"""Tests and benchmark for the logging pipeline"""
+import json
+import time
+import logging
+
+import pytest
+from flask import Flask
+
+from bananaai.utils.logger import setup_logging, SamplingFilter
+
+
+def make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(LOG_FOLDER=str(tmp_path), **config)
+    return app
+
+
+@pytest.fixture(autouse=True)
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    for handler in root.handlers:
+        if handler not in handlers:
+            root.removeHandler(handler)
+            handler.close()
+    root.setLevel(level)
+
+
+def test_setup_logging_does_not_stack_handlers(tmp_path):
+    setup_logging(make_app(tmp_path))
+    setup_logging(make_app(tmp_path))
+
+    installed = [h for h in logging.getLogger().handlers if getattr(h, '_bananaai', False)]
+    assert len(installed) == 1
+
+
+def test_async_json_logging(tmp_path):
+    setup_logging(make_app(tmp_path, LOG_FORMAT='json'))
+    logging.getLogger('bananaai.test').info("Saved %s", 'a.png', extra={'bytes': 12})
+
+    # Closing the handler drains the queue
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if getattr(handler, '_bananaai', False):
+            root.removeHandler(handler)
+            handler.close()
+
+    lines = (tmp_path / 'app.log').read_text().splitlines()
+    entry = json.loads(lines[-1])
+    assert entry['msg'] == 'Saved a.png'
+    assert entry['bytes'] == 12
+    assert entry['request_id'] == '-'
+
+
+def test_sampling_filter_keeps_warnings():
+    sampler = SamplingFilter(SamplingFilter.parse('bananaai.services=4'))
+
+    def record(name, level=logging.INFO):
+        return logging.makeLogRecord({'name': name, 'levelno': level})
+
+    kept = [sampler.filter(record('bananaai.services.banana_client')) for _ in range(8)]
+    assert kept.count(True) == 2
+    assert sampler.filter(record('bananaai.services.banana_client', logging.WARNING))
+    assert sampler.filter(record('bananaai.routes.api'))
+
+
+# The INFO/DEBUG lines a /generate request with two reference images emitted
+# before this change, all at INFO as eagerly formatted f-strings
+def _legacy_request(log, ref_paths, prompt):
+    for path in ref_paths:
+        log.info(f"Using reference image: {path}")
+    log.info(f"Total reference images found: {len(ref_paths)}")
+    log.info(f"Generating image with prompt: {prompt[:50]}...")
+    for path in ref_paths:
+        log.info(f"Loaded reference image: {path}")
+    log.info(f"Total reference images loaded: {len(ref_paths)}")
+    log.info(f"Using {len(ref_paths)} reference images for generation")
+    log.info("Generating image with Gemini Image Model (attempt 1)")
+    log.info("Received raw binary image data from Gemini")
+    log.info("Successfully generated image with Gemini")
+    log.info(f"Generated image saved: output/{prompt[:10]}.png")
+    log.info("Image generation completed successfully")
+
+
+def _current_request(log, ref_paths, prompt):
+    for path in ref_paths:
+        log.debug("Using reference image: %s", path)
+    log.debug("Total reference images found: %d", len(ref_paths))
+    log.info("Generating image with prompt: %.50s...", prompt)
+    for path in ref_paths:
+        log.debug("Loaded reference image: %s", path)
+    log.debug("Total reference images loaded: %d", len(ref_paths))
+    log.debug("Using %d reference images for generation", len(ref_paths))
+    log.debug("Generating image with Gemini Image Model (attempt %d)", 1)
+    log.debug("Received raw binary image data from Gemini")
+    log.info("Successfully generated image with Gemini")
+    log.info("Generated image saved: %s", f"output/{prompt[:10]}.png")
+    log.info("Image generation completed successfully")
+
+
+def _per_request_us(emit, log, iterations=1000):
+    ref_paths = ['uploads/20250101_000000_ref_a.png', 'uploads/20250101_000000_ref_b.png']
+    prompt = 'a banana astronaut floating above a neon city at dusk, cinematic'
+    start = time.perf_counter()
+    for _ in range(iterations):
+        emit(log, ref_paths, prompt)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+@pytest.mark.slow
+def test_benchmark_logging_overhead(tmp_path):
+    """Logging cost on the request thread per /generate, run with ``pytest -m slow -s``"""
+    log = logging.getLogger('bananaai.bench')
+    results = {}
+    for mode, emit in (('sync', _legacy_request), ('async', _current_request)):
+        setup_logging(make_app(tmp_path / mode, LOG_MODE=mode))
+        results[mode] = _per_request_us(emit, log)
+        setup_logging(make_app(tmp_path / mode, LOG_MODE='sync'))  # drain and close
+
+    print(f"\nlogging per request: before {results['sync']:.1f} us, after {results['async']:.1f} us")
+    assert results['async'] < results['sync']
@@ -0,0 +1,50 @@
+"""Tests for the metrics registry"""
+import os
+
+from bananaai.services.metrics import MetricsRegistry
+
+
+def make_registry(directory=None):
+    registry = MetricsRegistry()
+    registry.directory = directory
+    requests = registry.counter('test_requests_total', 'Requests', ('route',))
+    latency = registry.histogram('test_latency_seconds', 'Latency', buckets=(0.1, 1))
+    return registry, requests, latency
+
+
+def test_render_counters_and_histograms():
+    registry, requests, latency = make_registry()
+    requests.inc(route='/api/assist')
+    requests.inc(2, route='/api/assist')
+    latency.observe(0.05)
+    latency.observe(5)
+
+    text = registry.render()
+
+    assert 'test_requests_total{route="/api/assist"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 2' in text
+    assert 'test_latency_seconds_count 2' in text
+
+
+def test_collect_sums_worker_processes(tmp_path):
+    registry, requests, latency = make_registry(str(tmp_path))
+    requests.inc(route='/')
+
+    pid = os.fork()
+    if pid == 0:
+        # A worker that serves two requests and exits
+        requests.inc(2, route='/')
+        latency.observe(0.5)
+        registry.flush()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    values = registry.collect()
+    assert values['test_requests_total']['["/"]'] == 4
+    assert values['test_latency_seconds']['[]'][-1] == 1
+
+    # The exited worker was archived, so its counts survive the next scrape
+    assert not (tmp_path / f"metrics-{pid}.json").exists()
+    assert registry.collect()['test_requests_total']['["/"]'] == 4
@@ -0,0 +1,131 @@
+"""Tests and benchmark for multi-candidate image generation"""
+import io
+import os
+import time
+import types
+
+import pytest
+from PIL import Image
+
+
+MODEL = 'gemini-2.5-flash-image-preview'
+UPSTREAM_LATENCY = 0.05
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class FakeImageModel:
+    """Returns up to ``supported`` candidates per call, each a different image"""
+    supported = 4
+    reject_multiple = False
+    requested = []
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, generation_config=None, **kwargs):
+        count = generation_config['candidate_count']
+        FakeImageModel.requested.append(count)
+        if count > 1 and FakeImageModel.reject_multiple:
+            from google.api_core.exceptions import InvalidArgument
+            raise InvalidArgument("candidate_count is not supported")
+        time.sleep(UPSTREAM_LATENCY)
+        candidates = []
+        for i in range(min(count, FakeImageModel.supported)):
+            inline = types.SimpleNamespace(data=_png((40 * i, 100, 200)), mime_type='image/png')
+            part = types.SimpleNamespace(text=None, inline_data=inline)
+            candidates.append(types.SimpleNamespace(content=types.SimpleNamespace(parts=[part])))
+        return types.SimpleNamespace(candidates=candidates)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(FakeImageModel, 'requested', [])
+    return FakeImageModel
+
+
+def _generate(app, **fields):
+    return app.test_client().post('/api/generate', json={'prompt': 'a banana', **fields})
+
+
+def test_variants_come_from_one_call(app):
+    data = _generate(app, n=3).get_json()
+
+    assert FakeImageModel.requested == [3]
+    assert len(data['images']) == 3
+    assert data['filename'] == data['images'][0]['filename']
+    assert len({image['url'] for image in data['images']}) == 3
+    assert len({image['seed'] for image in data['images']}) == 3
+
+    contents = [open(os.path.join(app.config['OUTPUT_FOLDER'], image['filename']), 'rb').read()
+                for image in data['images']]
+    assert len(set(contents)) == 3
+
+
+def test_missing_candidates_are_topped_up(app, monkeypatch):
+    monkeypatch.setattr(FakeImageModel, 'supported', 1)
+    data = _generate(app, n=3).get_json()
+    assert FakeImageModel.requested == [3, 2, 1]
+    assert len(data['images']) == 3
+
+
+def test_model_rejecting_candidate_count_falls_back_to_single_calls(app, monkeypatch):
+    monkeypatch.setattr(FakeImageModel, 'reject_multiple', True)
+    assert len(_generate(app, n=2).get_json()['images']) == 2
+    assert FakeImageModel.requested == [2, 1, 1]
+
+    # The limit is remembered for later requests
+    _generate(app, n=2)
+    assert FakeImageModel.requested[3:] == [1, 1]
+
+
+def test_single_image_response_is_unchanged(app):
+    data = _generate(app).get_json()
+    assert FakeImageModel.requested == [1]
+    assert '_v' not in data['filename']
+    assert data['images'] == [{key: data[key] for key in
+                               ('filename', 'url', 'preview_url', 'seed', 'width', 'height')}]
+
+
+def test_n_is_validated(app):
+    assert _generate(app, n=0).status_code == 400
+    assert _generate(app, n=app.config['GENERATE_MAX_IMAGES'] + 1).status_code == 400
+    for n in (2.7, '2', True, None, [2], {'n': 2}):
+        response = _generate(app, n=n)
+        assert response.status_code == 400, n
+        assert response.get_json()['error'] == 'n must be an integer'
+    assert FakeImageModel.requested == []
+    assert _generate(app, num_inference_steps=None).status_code == 400
+
+
+def test_create_rejects_a_non_integer_n(app):
+    response = app.test_client().post('/api/create', json={'prompt': 'a red fox', 'n': [2]})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'n must be an integer'
+
+
+@pytest.mark.slow
+def test_benchmark_one_call_versus_separate_requests(app):
+    """Upstream calls and latency per image, run with ``pytest -m slow -s``"""
+    n = 4
+    start = time.perf_counter()
+    for _ in range(n):
+        assert _generate(app).status_code == 200
+    separate = time.perf_counter() - start
+    separate_calls = len(FakeImageModel.requested)
+
+    start = time.perf_counter()
+    assert len(_generate(app, n=n).get_json()['images']) == n
+    combined = time.perf_counter() - start
+    combined_calls = len(FakeImageModel.requested) - separate_calls
+
+    print(f"\n{n} images, {UPSTREAM_LATENCY * 1000:.0f} ms per upstream call: "
+          f"separate {separate_calls} calls {separate * 1000:.0f} ms "
+          f"({separate / n * 1000:.0f} ms/image), "
+          f"n={n} {combined_calls} call {combined * 1000:.0f} ms ({combined / n * 1000:.0f} ms/image)")
+    assert combined_calls == 1
+    assert combined < separate
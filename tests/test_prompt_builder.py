@@ -0,0 +1,113 @@
+"""Tests and benchmark for the local prompt expansion tier"""
+import time
+
+import pytest
+
+from bananaai.services import metrics as metrics_module
+from bananaai.services.prompt_builder import expand_local, expand_prompt, match_style, should_use_llm
+
+
+@pytest.mark.parametrize('prompt, preset', [
+    ('cinematic shot of a banana', 'cinematic'),
+    ('Latte art COFFEE on a wooden table', 'food'),
+    ('ภาพอาหารไทยบนโต๊ะไม้', 'food'),
+    ('cyberpunk alley at night, neon rain', 'neon'),
+    ('a film still from a movie', 'cinematic'),
+    ('ภาพขาวดำ ชายชรา', 'monochrome'),
+    ('a cat sitting on a chair', None),
+    ('a research lab', None),  # "sea" only matches as a whole word
+])
+def test_match_style(prompt, preset):
+    assert match_style(prompt) == preset
+
+
+def test_unmatched_prompt_keeps_the_generic_expansion():
+    expanded = expand_prompt('  a cat sitting on a chair ', '16:9')
+    assert expanded.startswith('a cat sitting on a chair\n\nStyle Enhancement:\n')
+    assert '- Lighting: professional studio lighting, soft shadows, highlight details\n' in expanded
+    assert 'Horizontal composition ideal for landscapes and cinematic shots, 16:9 format' in expanded
+
+
+def test_preset_expansion_keeps_subject_and_braces():
+    expanded, preset = expand_local('{brand} neon sign', '9:16')
+    assert preset == 'neon'
+    assert expanded.startswith('{brand} neon sign\n')
+    assert 'neon signage glow' in expanded and '9:16 format' in expanded
+
+
+def test_should_use_llm_policy():
+    assert not should_use_llm('food', 'auto')
+    assert should_use_llm(None, 'auto')
+    assert should_use_llm('food', 'auto', refine=True)
+    assert should_use_llm('food', 'auto', reference_images=['ref.png'])
+    assert should_use_llm('food', 'off')
+    assert not should_use_llm(None, 'always', refine=True)
+
+
+class _FakeLLM:
+    calls = 0
+
+    def __init__(self, api_key, model, upload_folder=None, pool=None):
+        pass
+
+    def expand(self, system_prompt, user_prompt, reference_images=None, images=None):
+        _FakeLLM.calls += 1
+        time.sleep(0.01)
+        return 'refined: ' + user_prompt.splitlines()[0]
+
+    async def expand_async(self, **kwargs):
+        return self.expand(**kwargs)
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr('bananaai.routes.api.LLMClient', _FakeLLM)
+    monkeypatch.setattr(_FakeLLM, 'calls', 0)
+    return client
+
+
+def test_assist_answers_matching_prompts_locally(client):
+    before = _FakeLLM.calls
+    local = client.post('/api/assist', json={'prompt': 'dessert on a plate 1', 'aspect_ratio': '9:16'})
+    assert local.status_code == 200
+    assert local.get_json()['source'] == 'local'
+    assert local.get_json()['preset'] == 'food'
+    assert _FakeLLM.calls == before
+
+    unmatched = client.post('/api/assist', json={'prompt': 'a cat on a chair 1'}).get_json()
+    refined = client.post('/api/assist', json={'prompt': 'dessert on a plate 2', 'refine': True}).get_json()
+    assert unmatched['source'] == refined['source'] == 'llm'
+    assert refined['expanded'] == 'refined: dessert on a plate 2'
+    assert _FakeLLM.calls == before + 2
+
+    rendered = metrics_module.metrics.render()
+    assert 'bananaai_assist_expansions_total{tier="local",preset="food"}' in rendered
+    assert 'bananaai_assist_upstream_seconds_saved_total' in rendered
+
+
+@pytest.mark.slow
+def test_benchmark_upstream_calls_saved(client):
+    """Upstream call rate over a prompt mix, run with ``pytest -m slow -s``"""
+    prompts = ['cinematic street at dusk', 'ภาพอาหารญี่ปุ่น', 'product shot of a watch',
+               'a dog', 'anime girl in the rain', 'portrait of an old man',
+               'a red chair', 'sunset over the sea', 'watercolor cat', 'my house']
+    before = _FakeLLM.calls
+    start = time.perf_counter()
+    for round_ in range(5):
+        for prompt in prompts:
+            client.post('/api/assist', json={'prompt': f'{prompt} {round_}'})
+    elapsed = time.perf_counter() - start
+
+    sent = len(prompts) * 5
+    upstream = _FakeLLM.calls - before
+    local_us = min(_time(lambda: expand_local('ภาพอาหารญี่ปุ่น สไตล์ภาพยนตร์')) for _ in range(3))
+    print(f"\nupstream calls: {upstream}/{sent} ({upstream / sent:.0%}), "
+          f"local expansion {local_us:.1f} us, {elapsed / sent * 1000:.2f} ms per request")
+    assert upstream / sent <= 0.3
+
+
+def _time(func, iterations=2000):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
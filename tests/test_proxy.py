@@ -0,0 +1,37 @@
+"""Tests for resolving the client address behind a reverse proxy"""
+import pytest
+
+PROXY = {'REMOTE_ADDR': '10.0.0.1'}
+
+
+@pytest.fixture
+def app_env():
+    return {'TRUSTED_PROXY_HOPS': '1', 'RATE_LIMIT_ASSIST': '1'}
+
+
+def _assist(client, forwarded_for):
+    return client.post('/api/assist', json={}, environ_base=PROXY,
+                       headers={'X-Forwarded-For': forwarded_for})
+
+
+def test_clients_behind_the_proxy_are_told_apart(client):
+    assert _assist(client, '203.0.113.7').status_code == 400
+    assert _assist(client, '198.51.100.2').status_code == 400
+    assert _assist(client, '203.0.113.7').status_code == 429
+
+
+def test_hops_the_client_added_are_ignored(client):
+    assert _assist(client, '203.0.113.7').status_code == 400
+    # Only the hop added by the trusted proxy counts
+    assert _assist(client, '192.0.2.1, 203.0.113.7').status_code == 429
+
+
+def test_admission_queues_by_forwarded_address(app, client, monkeypatch):
+    queue = app.extensions['admission']['assist']
+    seen = []
+    acquire = queue.acquire
+    monkeypatch.setattr(queue, 'acquire', lambda client: seen.append(client) or acquire(client))
+
+    client.post('/api/assist', json={'prompt': 'food photo of ramen'}, environ_base=PROXY,
+                headers={'X-Forwarded-For': '203.0.113.7'})
+    assert seen == ['203.0.113.7']
@@ -0,0 +1,96 @@
+"""Tests and benchmark for the shared reference image cache"""
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from bananaai.services.reference_images import ReferenceImageCache
+
+
+def _png(path, color='orange', size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    path.write_bytes(buffer.getvalue())
+    return str(path)
+
+
+def test_repeat_reads_hit_and_share_payloads(tmp_path):
+    cache = ReferenceImageCache()
+    first = cache.get(_png(tmp_path / 'logo.png'))
+    assert first['mime_type'] == 'image/png'
+    assert cache.get(str(tmp_path / 'logo.png')) is first
+
+    # Same content uploaded under another name is stored once
+    assert cache.get(_png(tmp_path / 'logo-copy.png')) is first
+    summary = cache.summary()
+    assert (summary['entries'], summary['hits'], summary['misses']) == (1, 2, 1)
+    assert summary['hit_rate'] == pytest.approx(2 / 3, abs=1e-3)
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    cache = ReferenceImageCache()
+    path = _png(tmp_path / 'brand.png', 'red')
+    before = cache.get(path)
+
+    _png(tmp_path / 'brand.png', 'blue', size=(65, 64))
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 1_000_000))
+    after = cache.get(path)
+    assert after is not before and after['data'] != before['data']
+
+
+def test_bounded_by_bytes(tmp_path):
+    paths = [_png(tmp_path / f'{i}.png', (i * 40, 0, 0)) for i in range(3)]
+    sizes = [os.path.getsize(p) for p in paths]
+    cache = ReferenceImageCache(max_bytes=2 * max(sizes))
+
+    for path in paths:
+        cache.get(path)
+    summary = cache.summary()
+    assert summary['entries'] == 2 and summary['bytes'] <= cache.max_bytes
+
+    # The least recently used image was evicted and is read again
+    cache.get(paths[0])
+    assert cache.summary()['misses'] == 4
+
+    tiny = ReferenceImageCache(max_bytes=10)
+    assert tiny.get(paths[0])['data'] == open(paths[0], 'rb').read()
+    assert tiny.summary()['entries'] == 0
+
+
+def test_missing_and_non_image_files(tmp_path):
+    cache = ReferenceImageCache()
+    (tmp_path / 'notes.png').write_text('not an image')
+    assert cache.get(str(tmp_path / 'notes.png')) is None
+    assert cache.get(str(tmp_path / 'missing.png')) is None
+
+
+@pytest.mark.slow
+def test_benchmark_cached_reference_load(tmp_path):
+    """Per-request reference load cost, run with ``pytest -m slow -s``"""
+    path = str(tmp_path / 'photo.jpg')
+    Image.effect_noise((1600, 1600), 64).convert('RGB').save(path, 'JPEG', quality=90)
+
+    def uncached():
+        # What each attempt paid before: open the file, then the SDK re-reads it
+        with Image.open(path) as img:
+            img.load()
+        with open(path, 'rb') as f:
+            f.read()
+
+    cache = ReferenceImageCache()
+    cache.get(path)
+    iterations = 50
+    start = time.perf_counter()
+    for _ in range(iterations):
+        uncached()
+    uncached_ms = (time.perf_counter() - start) / iterations * 1000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        cache.get(path)
+    cached_ms = (time.perf_counter() - start) / iterations * 1000
+
+    print(f"\n{os.path.getsize(path) / 1024:.0f} KiB reference: "
+          f"decode + read {uncached_ms:.2f} ms, cache hit {cached_ms:.3f} ms")
+    assert cached_ms < uncached_ms / 10
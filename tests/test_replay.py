@@ -0,0 +1,124 @@
+"""Tests for traffic capture and the replay tool"""
+import io
+import json
+import types
+
+import pytest
+from PIL import Image
+
+from bananaai.services.prompt_builder import expand_local
+from bananaai.tools import replay
+
+PNG = io.BytesIO()
+Image.new('RGB', (32, 32), 'orange').save(PNG, 'PNG')
+PNG = PNG.getvalue()
+
+
+class FakeModel:
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, generation_config=None, **kwargs):
+        if 'image' in self.name:
+            part = types.SimpleNamespace(text=None, inline_data=types.SimpleNamespace(data=PNG, mime_type='image/png'))
+            count = generation_config['candidate_count']
+        else:
+            part = types.SimpleNamespace(text='An expanded prompt', inline_data=None)
+            count = 1
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]), finish_reason=1)
+        return types.SimpleNamespace(candidates=[candidate] * count)
+
+
+@pytest.fixture
+def fake_model():
+    return FakeModel
+
+
+@pytest.fixture
+def app_env():
+    return {'CAPTURE_ENABLED': 'true'}
+
+
+def test_capture_records_shapes_not_content(app, tmp_path):
+    client = app.test_client()
+    # Records are written when the response is closed, which the test client
+    # only does for buffered responses
+    post = lambda *args, **kwargs: client.post(*args, buffered=True, **kwargs)
+    uploaded = post('/api/upload', data={'image_file': (io.BytesIO(PNG), 'secret-face.png')},
+                    content_type='multipart/form-data').get_json()['filename']
+    for _ in range(2):
+        post('/api/assist', json={'prompt': 'a misty harbor at dawn', 'refine': True})
+    post('/api/generate', json={'prompt': 'a misty harbor at dawn', 'aspect_ratio': '16:9',
+                                'n': 2, 'reference_images': [uploaded]})
+
+    raw = (tmp_path / 'capture.jsonl').read_text()
+    assert 'misty' not in raw and uploaded not in raw and 'secret' not in raw
+    upload, miss, hit, generate = [json.loads(line) for line in raw.splitlines()]
+
+    assert upload['route'] == '/api/upload' and upload['files']['image_file']['bytes'] == len(PNG)
+    assert miss['params'] == {'prompt': {'chars': 22}, 'refine': True}
+    assert miss['cache_key'] == hit['cache_key']
+    assert miss['expansion'] == {'outcome': 'llm', 'preset': None}
+    assert hit['expansion'] == {'outcome': 'hit'} and hit['upstream'] == []
+    assert [call['client'] for call in miss['upstream']] == ['llm']
+
+    assert generate['status'] == 200 and generate['params']['aspect_ratio'] == '16:9'
+    assert generate['params']['reference_images'][0]['bytes'] == len(PNG)
+    assert generate['upstream'][0]['client'] == 'banana' and generate['upstream'][0]['candidates'] == 2
+    assert generate['ms'] >= generate['upstream'][0]['ms']
+    assert client.get('/health/stats').get_json()['capture']['written'] == 4
+
+
+def _record(t, route, **fields):
+    return {'t': t, 'method': 'POST', 'route': route, 'status': 200, 'ms': 10.0, 'upstream': [], **fields}
+
+
+# Far enough apart at 4x that the first expansion is cached before its repeat
+CAPTURE = [
+    _record(100.0, '/api/assist', params={'prompt': {'chars': 30}, 'aspect_ratio': '16:9'},
+            cache_key='k1', expansion={'outcome': 'local', 'preset': 'food'}),
+    _record(100.1, '/api/assist', params={'prompt': {'chars': 24}, 'refine': True},
+            cache_key='k2', expansion={'outcome': 'llm', 'preset': None},
+            upstream=[{'client': 'llm', 'ms': 400.0}]),
+    _record(100.8, '/api/assist', params={'prompt': {'chars': 24}, 'refine': True},
+            cache_key='k2', expansion={'outcome': 'hit'}),
+    _record(100.9, '/api/generate', cache_key='k3',
+            params={'prompt': {'chars': 40}, 'n': 2, 'reference_images': [{'id': 'r1', 'bytes': 3000}]},
+            upstream=[{'client': 'banana', 'ms': 900.0, 'candidates': 2}]),
+    {'t': 101.0, 'method': 'GET', 'route': '/api/history', 'status': 200, 'ms': 2.0,
+     'params': {'q': {'chars': 5}, 'limit': '10', 'cursor': {'chars': 8}}},
+]
+
+
+def test_requests_are_synthesized_deterministically():
+    requests = replay.build_requests(CAPTURE)
+    bodies = [json.loads(body) if method == 'POST' else None for method, _, body, _ in requests]
+
+    # The preset the prompt matched in production still matches
+    assert expand_local(bodies[0]['prompt'])[1] == 'food'
+    assert bodies[0]['aspect_ratio'] == '16:9'
+    # A repeated cache key repeats the prompt; another key gets another prompt
+    assert bodies[1] == bodies[2] and len(bodies[1]['prompt']) == 24
+    assert expand_local(bodies[1]['prompt'])[1] is None
+    assert bodies[3]['reference_images'] == ['replay-r1.png'] and bodies[3]['n'] == 2
+    assert requests[4][1].startswith('/api/history?q=') and 'cursor' not in requests[4][1]
+    assert replay.build_requests(CAPTURE) == requests
+
+    capture = replay.summarize_capture(CAPTURE)
+    assert capture['cache_hit_rate'] == pytest.approx(1 / 3, abs=1e-3)
+    assert capture['upstream_calls'] == {'llm': 1, 'banana': 1}
+
+
+@pytest.mark.slow
+def test_replay_against_this_tree():
+    report = replay.run_build(CAPTURE, speed=4)
+    assert report['requests'] == 5 and report['errors'] == 0
+    assert report['statuses'] == {'200': 5}
+    assert report['cache_hit_rate'] == pytest.approx(1 / 3, abs=1e-3)
+    assert report['local_rate'] == pytest.approx(1 / 3, abs=1e-3)
+    assert report['upstream_calls'] == {'llm': 1, 'banana': 1}
+    # The image call alone takes 900 / 4 ms
+    assert report['routes']['/api/generate']['p50'] >= 225
+
+    table = replay.format_report(replay.summarize_capture(CAPTURE), [report, report], speed=4)
+    assert 'cache hit rate' in table and '+0.0%' in table
@@ -0,0 +1,70 @@
+"""Tests for the production server entry points"""
+import os
+import importlib.util
+
+import pytest
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def gunicorn_conf(monkeypatch):
+    """Load gunicorn.conf.py, restoring the environment it writes to"""
+    for key in ('APP_ENV', 'START_BACKGROUND_SERVICES', 'METRICS_DIR', 'WEB_CONCURRENCY',
+                'WEB_WORKER_MEMORY_MB'):
+        monkeypatch.setenv(key, 'placeholder')
+        monkeypatch.delenv(key)
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.delenv('WEB_CONCURRENCY')
+    return module
+
+
+@pytest.mark.parametrize('cpus, memory_mb, expected', [
+    (1, None, 3),      # 2 * CPUs + 1 without a memory limit
+    (4, None, 9),
+    (4, 1024, 3),      # (1024 - 128) // 256 workers fit in memory
+    (8, 200, 1),       # always at least one
+])
+def test_worker_count_follows_cpus_and_memory(gunicorn_conf, cpus, memory_mb, expected):
+    assert gunicorn_conf._worker_count(cpus, memory_mb) == expected
+
+
+def test_worker_count_overrides(gunicorn_conf, monkeypatch):
+    monkeypatch.setenv('WEB_WORKER_MEMORY_MB', '128')
+    assert gunicorn_conf._worker_count(4, 1024) == 7
+    monkeypatch.setenv('WEB_CONCURRENCY', '2')
+    assert gunicorn_conf._worker_count(16, None) == 2
+
+
+def _app(monkeypatch, **env):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    from app import create_app
+    app = create_app()
+    started = []
+    monkeypatch.setattr(app, 'run', lambda **kwargs: started.append(kwargs))
+    return app, started
+
+
+def test_dev_server_is_refused_in_production(monkeypatch):
+    from app import run_dev_server
+    app, started = _app(monkeypatch, APP_ENV='production', ALLOW_DEV_SERVER='false')
+
+    with pytest.raises(SystemExit) as exc:
+        run_dev_server(app)
+    assert 'gunicorn' in str(exc.value.code)
+    assert started == []
+
+
+@pytest.mark.parametrize('env', [
+    {'APP_ENV': 'development'},
+    {'APP_ENV': 'production', 'ALLOW_DEV_SERVER': 'true'},
+])
+def test_dev_server_runs_outside_production_or_when_allowed(monkeypatch, env):
+    from app import run_dev_server
+    app, started = _app(monkeypatch, PORT='8123', **env)
+
+    run_dev_server(app)
+    assert started == [{'host': '0.0.0.0', 'port': 8123}]
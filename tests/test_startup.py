@@ -0,0 +1,15 @@
+"""Cold start regression test"""
+import os
+
+from bananaai.tools.startup_profile import profile_startup
+
+# Generous enough for slow CI machines; the SDK alone used to take longer
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '3.0'))
+
+
+def test_cold_start_is_bounded():
+    result = profile_startup()
+
+    assert result['status'] == 200
+    assert result['heavy_loaded'] == [], "heavy modules imported before the first health check"
+    assert result['time_to_healthy'] < STARTUP_BUDGET_SECONDS
@@ -0,0 +1,61 @@
+"""Tests for the storage backends"""
+import os
+
+import pytest
+
+from bananaai.services.storage import Storage, S3Storage
+
+
+def test_local_storage_rejects_unsafe_names(tmp_path):
+    (tmp_path / 'ok.png').write_bytes(b'x')
+    storage = Storage()
+
+    assert storage.local_path(str(tmp_path), 'ok.png') == os.path.join(str(tmp_path), 'ok.png')
+    assert storage.local_path(str(tmp_path), 'missing.png') is None
+    assert storage.local_path(str(tmp_path), '../ok.png') is None
+
+
+@pytest.fixture
+def s3_endpoint(monkeypatch):
+    """Local S3-compatible stand-in (moto server)"""
+    pytest.importorskip('boto3')
+    moto_server = pytest.importorskip('moto.server')
+
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+
+    server = moto_server.ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+def test_s3_storage_roundtrip(tmp_path, s3_endpoint):
+    import boto3
+
+    boto3.client('s3', endpoint_url=s3_endpoint).create_bucket(Bucket='banana')
+    folder = tmp_path / 'output'
+    folder.mkdir()
+
+    storage = Storage()
+    storage.backend = S3Storage('banana', prefix='test/', endpoint_url=s3_endpoint,
+                                multipart_threshold_mb=5)
+
+    # Above the threshold, so this goes through a multipart upload
+    payload = os.urandom(6 * 1024 * 1024)
+    (folder / 'big.png').write_bytes(payload)
+    assert storage.publish(str(folder), 'big.png')
+
+    # Another replica only has the bucket: the read-through cache fetches it
+    storage.evict_local(str(folder), 'big.png')
+    path = storage.local_path(str(folder), 'big.png')
+    assert path and open(path, 'rb').read() == payload
+
+    url = storage.backend.download_url(str(folder), 'big.png')
+    assert url.startswith(s3_endpoint) and 'test/output/big.png' in url
+
+    storage.delete(str(folder), 'big.png')
+    assert storage.local_path(str(folder), 'big.png') is None
+    assert not [name for name in os.listdir(folder) if name.endswith('.tmp')]
@@ -0,0 +1,34 @@
+"""Tests for request phase tracing"""
+import asyncio
+
+from bananaai.middleware.tracing import Trace, span, _current_trace
+from bananaai.services.upstream_loop import upstream_loop
+
+
+def test_server_timing_header(client):
+    response = client.post('/api/assist', json={})
+
+    assert response.status_code == 400
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('validate;dur=')
+    assert 'total;dur=' in timing
+    assert response.headers['X-Request-ID']
+
+
+def test_spans_follow_request_onto_upstream_loop():
+    trace = Trace('req-1')
+
+    async def upstream_call():
+        with span('upstream', attempt=1):
+            await asyncio.to_thread(lambda: None)
+        with span('ref_load'):
+            pass
+
+    token = _current_trace.set(trace)
+    try:
+        upstream_loop.run(upstream_call(), timeout=5)
+    finally:
+        _current_trace.reset(token)
+
+    assert [(s['name'], s.get('attempt')) for s in trace.summary()] == [
+        ('upstream', 1), ('ref_load', None)]
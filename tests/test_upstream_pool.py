@@ -0,0 +1,179 @@
+"""Tests for routing upstream calls across several API keys and models"""
+import types
+
+import pytest
+
+from bananaai.services.upstream_pool import UpstreamPool, PoolExhausted
+
+LLM = 'gemini-2.5-flash'
+LLM_FALLBACK = 'gemini-2.0-flash'
+
+
+class ResourceExhausted(Exception):
+    """Stands in for google.api_core.exceptions.ResourceExhausted"""
+
+
+def _pool(keys, **models):
+    pool = UpstreamPool()
+    pool.configure({'keys': keys, 'models': models or {'llm': [LLM, LLM_FALLBACK]}})
+    return pool
+
+
+def _use(pool, kind='llm', error=None):
+    """Lease a key for one call, failing it with ``error``"""
+    lease = pool.acquire(kind)
+    pool.release(lease, error)
+    return lease
+
+
+def test_routes_to_least_loaded_key_by_weight():
+    pool = _pool([{'name': 'big', 'key': 'a', 'weight': 3}, {'name': 'small', 'key': 'b'}])
+    leases = [pool.acquire('llm') for _ in range(8)]
+    names = [lease.key.name for lease in leases]
+    assert names.count('big') == 6 and names.count('small') == 2
+    for lease in leases:
+        pool.release(lease)
+    assert all(key['inflight'] == 0 for key in pool.summary()['keys'])
+
+
+def test_per_key_rpm_limit():
+    pool = _pool([{'name': 'a', 'key': 'a', 'rpm': 2}, {'name': 'b', 'key': 'b', 'rpm': 1}])
+    assert sorted(_use(pool).key.name for _ in range(3)) == ['a', 'a', 'b']
+    with pytest.raises(PoolExhausted) as exc:
+        pool.acquire('llm')
+    assert 1 <= exc.value.retry_after <= 60
+
+    summary = {key['name']: key for key in pool.summary()['keys']}
+    assert summary['a']['utilization'] == 1.0
+    assert summary['b']['requests_last_minute'] == 1
+
+
+def test_quota_error_cools_key_down_and_fails_over():
+    pool = _pool([{'name': 'a', 'key': 'a'}, {'name': 'b', 'key': 'b'}])
+    _use(pool, error=ResourceExhausted('429 quota'))
+    _use(pool, error=ResourceExhausted('429 quota'))
+    cooling = {key['name']: key['cooling_down'] for key in pool.summary()['keys']}
+    assert set(cooling['a']) == set(cooling['b']) == {LLM}
+
+    # Both keys are out of quota for the primary model: fall back
+    lease = _use(pool)
+    assert lease.model == LLM_FALLBACK
+    totals = [key['totals'] for key in pool.summary()['keys']]
+    assert sum(t['quota'] for t in totals) == 2 and sum(t['ok'] for t in totals) == 1
+
+
+def test_cooldown_grows_with_repeated_quota_errors(monkeypatch):
+    pool = _pool([{'name': 'a', 'key': 'a'}], llm=[LLM])
+    clock = [1000.0]
+    monkeypatch.setattr('bananaai.services.upstream_pool.time.monotonic', lambda: clock[0])
+
+    _use(pool, error=ResourceExhausted())
+    assert pool.summary()['keys'][0]['cooling_down'] == {LLM: 60}
+    clock[0] += 61
+    _use(pool, error=ResourceExhausted())
+    assert pool.summary()['keys'][0]['cooling_down'] == {LLM: 120}
+
+    # A success resets the count
+    clock[0] += 121
+    _use(pool)
+    _use(pool, error=ResourceExhausted())
+    assert pool.summary()['keys'][0]['cooling_down'] == {LLM: 60}
+
+
+def test_other_errors_keep_key_in_rotation():
+    pool = _pool([{'name': 'a', 'key': 'a'}])
+    _use(pool, error=ValueError('bad response'))
+    assert _use(pool).model == LLM
+    assert pool.summary()['keys'][0]['totals'] == {'ok': 1, 'error': 1, 'quota': 0}
+
+
+def test_keys_are_read_from_environment(monkeypatch):
+    monkeypatch.setenv('GEMINI_KEY_SPARE', 'secret')
+    pool = _pool([{'name': 'spare', 'key_env': 'GEMINI_KEY_SPARE'}])
+    assert pool.keys[0].api_key == 'secret'
+    with pytest.raises(ValueError):
+        _pool([{'name': 'missing', 'key_env': 'GEMINI_KEY_MISSING'}])
+
+
+class FakeModel:
+    calls = []
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+
+    def generate_content(self, content, **kwargs):
+        FakeModel.calls.append((self.name, self._client))
+        if self._client == 'client-a' and self.name == LLM:
+            from google.api_core.exceptions import ResourceExhausted
+            raise ResourceExhausted('quota exceeded')
+        part = types.SimpleNamespace(text=f'expanded by {self.name}')
+        candidate = types.SimpleNamespace(content=types.SimpleNamespace(parts=[part]), finish_reason=1)
+        return types.SimpleNamespace(candidates=[candidate])
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    monkeypatch.setattr(FakeModel, 'calls', [])
+    # Each key's SDK client is identified by the key it was made for
+    monkeypatch.setattr('bananaai.services.upstream_pool.PoolKey.clients', lambda key: types.SimpleNamespace(
+        get_default_client=lambda name: f'client-{key.api_key}'))
+    monkeypatch.setattr('time.sleep', lambda seconds: None)
+    return FakeModel
+
+
+@pytest.fixture
+def app_env():
+    return {
+        'ASSIST_LOCAL_MODE': 'off',
+        'LLM_MODEL': LLM,
+        'UPSTREAM_POOL': '{"keys": [{"name": "a", "key": "a", "weight": 2}, '
+                         '{"name": "b", "key": "b"}], '
+                         '"models": {"llm": ["%s", "%s"]}}' % (LLM, LLM_FALLBACK),
+    }
+
+
+@pytest.fixture
+def app(app):
+    yield app
+    from bananaai.services.upstream_pool import upstream_pool
+    upstream_pool.enabled = False
+
+
+def test_assist_retries_on_another_key_after_quota_error(app):
+    client = app.test_client()
+    response = client.post('/api/assist', json={'prompt': 'a lighthouse at dusk'})
+    assert response.get_json()['expanded'] == f'expanded by {LLM}'
+    assert FakeModel.calls == [(LLM, 'client-a'), (LLM, 'client-b')]
+
+    client.post('/api/assist', json={'prompt': 'a lighthouse at dawn'})
+    assert FakeModel.calls[2] == (LLM, 'client-b')
+
+    stats = client.get('/health/stats').get_json()['upstream_pool']
+    assert stats['enabled'] and stats['models']['banana'] == [app.config['BANANA_MODEL']]
+    keys = {key['name']: key for key in stats['keys']}
+    assert list(keys['a']['cooling_down']) == [LLM]
+    assert keys['b']['totals']['ok'] == 2
+
+
+def test_rpm_is_split_across_worker_processes():
+    pool = UpstreamPool()
+    pool.processes = 4
+    pool.configure({'keys': [{'name': 'a', 'key': 'a', 'rpm': 60}, {'name': 'b', 'key': 'b', 'rpm': 2},
+                             {'name': 'c', 'key': 'c'}],
+                    'models': {'llm': [LLM]}})
+    # b's 2 per minute cannot be split over 4 workers without going over it
+    assert [key.rpm for key in pool.keys] == [15, 0, 0]
+    assert pool.summary()['processes'] == 4
+
+
+def test_sdk_internals_used_for_per_key_clients_exist():
+    """Fails when a google-generativeai upgrade moves the private API the pool relies on"""
+    pytest.importorskip('google.generativeai')
+    from google.generativeai import GenerativeModel
+    from google.generativeai.client import _ClientManager
+
+    manager = _ClientManager()
+    manager.configure(api_key='test')
+    assert callable(manager.get_default_client)
+    model = GenerativeModel(LLM)
+    assert hasattr(model, '_client') and hasattr(model, '_async_client')